@@ -11,7 +11,7 @@ from pymongo import MongoClient
 # Add the backend directory to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from inventory_data import inventory_manager
+from med_inv import MedicalInventoryDB
 
 def create_sample_inventory():
     """Create sample inventory items for testing"""
@@ -20,6 +20,7 @@ def create_sample_inventory():
     client = MongoClient('mongodb://localhost:27017/')
     db = client['hospital_db']
     hospitals_collection = db['hospitals']
+    inventory_db = MedicalInventoryDB()
     
     # Get existing hospitals
     hospitals = list(hospitals_collection.find())
@@ -252,12 +253,12 @@ def create_sample_inventory():
     for item_data in sample_inventory:
         try:
             # Check if item already exists
-            existing_item = db['inventory'].find_one({"item_id": item_data["item_id"]})
+            existing_item = db['medical_inventory'].find_one({"item_id": item_data["item_id"]})
             if existing_item:
                 print(f"Inventory item {item_data['name']} ({item_data['item_id']}) already exists, skipping...")
                 continue
             
-            item_id = inventory_manager.add_inventory_item(item_data)
+            item_id = inventory_db.create_inventory_item(item_data)
             if item_id:
                 print(f"✅ Created inventory item: {item_data['name']} ({item_data['item_id']})")
                 created_count += 1
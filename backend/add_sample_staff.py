@@ -11,7 +11,7 @@ from pymongo import MongoClient
 # Add the backend directory to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from staff_data import staff_manager
+from staff_inv import StaffManagementDB
 
 def create_sample_staff():
     """Create sample staff members for testing"""
@@ -20,6 +20,7 @@ def create_sample_staff():
     client = MongoClient('mongodb://localhost:27017/')
     db = client['hospital_db']
     hospitals_collection = db['hospitals']
+    staff_db = StaffManagementDB()
     
     # Get existing hospitals
     hospitals = list(hospitals_collection.find())
@@ -242,7 +243,7 @@ def create_sample_staff():
                 print(f"Staff member {staff_data['name']} ({staff_data['staff_id']}) already exists, skipping...")
                 continue
             
-            staff_id = staff_manager.add_staff_member(staff_data)
+            staff_id = staff_db.create_staff_member(staff_data)
             if staff_id:
                 print(f"✅ Created staff member: {staff_data['name']} ({staff_data['staff_id']})")
                 created_count += 1
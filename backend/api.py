@@ -1,9 +1,12 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-from datetime import datetime
+from datetime import datetime, timedelta
 import json
+import csv
+import io
 import sys
 import os
+from threading import Lock
 
 # Add the backend directory to Python path to import our modules
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -11,15 +14,56 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from hospital import HospitalManagementSystem
 from hospital_beds import HospitalBedsDB
 from patient_data import PatientDataDB
-from staff_data import staff_manager
-from inventory_data import inventory_manager
+from med_inv import TRANSACTION_RETENTION_DAYS, DEFAULT_RESERVATION_TTL_MINUTES
+from assignment_balancer import MAX_CASELOAD
+from staff_auth import verify_session_token
+from staff_inv import EMPLOYMENT_STATUSES
+from cache import cache_metrics
+from http_cache import conditional_get
+from compression import init_compression
+from events import event_bus
+from change_log import CHANGE_LOG_PAGE_SIZE
+from batch import parse_batch, run_batch
+from bed_forecast import BED_FORECAST_HORIZON_HOURS
+from bed_availability import NEAREST_BEDS_DEFAULT_LIMIT
+from geocoding import check_coordinates
+from transfers import TRANSFER_HOLD_MINUTES
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+init_compression(app)
 
 # Initialize the hospital management system
 hms = HospitalManagementSystem()
 
+_background_lock = Lock()
+_background_started = False
+
+def start_background_tasks():
+    """Start the change watcher, summary refresher and transfer expiry sweep of this process (idempotent).
+
+    Only the process that serves requests runs them: the reloader's child under the debug server,
+    each worker under a WSGI server. Importing the module starts nothing.
+    """
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+    hms.change_watcher.start()
+    hms.summaries.start()
+    hms.transfers.start()
+
+@app.before_request
+def _ensure_background_tasks():
+    """WSGI servers import app without running __main__; a worker starts its threads on its first request"""
+    if not _background_started:
+        start_background_tasks()
+
+def _hospital_scope(collection, field='hospital_id'):
+    """Conditional-GET scope: one hospital's documents in a collection"""
+    return lambda hospital_id, **_: (collection, {field: hospital_id})
+
 # Error handler
 @app.errorhandler(Exception)
 def handle_error(e):
@@ -28,6 +72,7 @@ def handle_error(e):
 # ==================== HOSPITAL ENDPOINTS ====================
 
 @app.route('/api/hospitals', methods=['GET'])
+@conditional_get(lambda **_: (hms.hospitals_collection, {}))
 def get_all_hospitals():
     """Get all hospitals"""
     try:
@@ -47,10 +92,12 @@ def create_hospital():
         return jsonify({'success': False, 'error': str(e)}), 400
 
 @app.route('/api/hospitals/<hospital_id>', methods=['GET'])
+@conditional_get(_hospital_scope(hms.hospitals_collection))
 def get_hospital(hospital_id):
     """Get hospital by ID"""
     try:
-        hospital = hms.get_hospital_by_id(hospital_id)
+        # The ETag comes from the database, so the body must too; a cached copy may predate it
+        hospital = hms.get_hospital_by_id(hospital_id, cached=False)
         if hospital:
             return jsonify({'success': True, 'data': hospital})
         else:
@@ -81,6 +128,8 @@ def update_hospital(hospital_id):
             return jsonify({'success': True, 'message': 'Hospital updated successfully'})
         else:
             return jsonify({'success': False, 'error': 'Hospital not found'}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -110,9 +159,38 @@ def search_hospitals():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/hospitals/<hospital_id>/events', methods=['GET'])
+def stream_hospital_events(hospital_id):
+    """Server-Sent Events stream of bed, patient, stock and staff changes for a hospital"""
+    # EventSource resends the last id it saw when it reconnects; ?last_event_id= is for other clients
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid Last-Event-ID'}), 400
+    response = Response(stream_with_context(event_bus.stream(hospital_id, last_event_id)),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx must not hold events back
+    return response
+
+@app.route('/api/hospitals/<hospital_id>/changes', methods=['GET'])
+def get_hospital_changes(hospital_id):
+    """Records changed since a change log sequence number (delta sync)"""
+    try:
+        since = request.args.get('since', 0, type=int)
+        limit = min(max(request.args.get('limit', CHANGE_LOG_PAGE_SIZE, type=int), 1), CHANGE_LOG_PAGE_SIZE)
+        if since < 0:
+            return jsonify({'success': False, 'error': 'since must be a non-negative sequence number'}), 400
+        changes = hms.get_hospital_changes(hospital_id, since, limit)
+        return jsonify({'success': True, 'data': changes})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # ==================== BED ENDPOINTS ====================
 
 @app.route('/api/hospitals/<hospital_id>/beds', methods=['GET'])
+@conditional_get(_hospital_scope(hms.beds_db.beds_collection))
 def get_hospital_beds(hospital_id):
     """Get all beds for a hospital"""
     try:
@@ -122,6 +200,7 @@ def get_hospital_beds(hospital_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/hospitals/<hospital_id>/departments', methods=['GET'])
+@conditional_get(_hospital_scope(hms.beds_db.beds_collection))
 def get_hospital_departments(hospital_id):
     """Get all departments for a hospital"""
     try:
@@ -141,6 +220,25 @@ def create_bed(hospital_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
+@app.route('/api/beds/nearest', methods=['GET'])
+def get_nearest_beds():
+    """Nearest active hospitals with an available bed, optionally of one bed type"""
+    try:
+        if request.args.get('lat') is None or request.args.get('lon') is None:
+            raise ValueError("lat and lon are required")
+        latitude, longitude = check_coordinates(request.args['lat'], request.args['lon'])
+        hospitals = hms.beds_db.availability.nearest(
+            latitude, longitude,
+            bed_type=request.args.get('bed_type'),
+            limit=request.args.get('limit', NEAREST_BEDS_DEFAULT_LIMIT, type=int),
+            max_km=request.args.get('max_km', type=float)
+        )
+        return jsonify({'success': True, 'data': hospitals, 'count': len(hospitals)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/beds/<bed_id>/status', methods=['PUT'])
 def update_bed_status(bed_id):
     """Update bed status"""
@@ -157,6 +255,7 @@ def update_bed_status(bed_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/hospitals/<hospital_id>/beds/stats', methods=['GET'])
+@conditional_get(_hospital_scope(hms.beds_db.beds_collection))
 def get_hospital_bed_stats(hospital_id):
     """Get bed statistics for a hospital"""
     try:
@@ -165,7 +264,47 @@ def get_hospital_bed_stats(hospital_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/hospitals/<hospital_id>/beds/occupancy', methods=['GET'])
+def get_hospital_bed_occupancy(hospital_id):
+    """Bed occupancy history: per-department occupancy at an instant (?at=) or a histogram over [start, end)"""
+    try:
+        occupancy = hms.beds_db.occupancy
+
+        if request.args.get('at'):
+            at = datetime.fromisoformat(request.args['at'])
+            return jsonify({'success': True, 'data': occupancy.occupancy_at(hospital_id, at)})
+
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else datetime.utcnow()
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else end - timedelta(days=1)
+        bucket_minutes = request.args.get('bucket_minutes', 60, type=int)
+        department = request.args.get('department')
+
+        return jsonify({
+            'success': True,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'bucket_minutes': bucket_minutes,
+            'department': department,
+            'data': occupancy.histogram(hospital_id, start, end, bucket_minutes, department)
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/beds/forecast', methods=['GET'])
+def get_hospital_bed_forecast(hospital_id):
+    """Projected occupied beds per department over the next hours"""
+    try:
+        hours = request.args.get('hours', BED_FORECAST_HORIZON_HOURS, type=int)
+        return jsonify({'success': True, 'data': hms.bed_forecaster.forecast_hospital(hospital_id, hours)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/hospitals/<hospital_id>/beds/department/<department>', methods=['GET'])
+@conditional_get(_hospital_scope(hms.beds_db.beds_collection))
 def get_hospital_beds_by_department(hospital_id, department):
     """Get beds by department for a hospital"""
     try:
@@ -202,6 +341,7 @@ def update_bed_details(bed_id):
 # ==================== PATIENT ENDPOINTS ====================
 
 @app.route('/api/hospitals/<hospital_id>/patients', methods=['GET'])
+@conditional_get(_hospital_scope(hms.patients_db.patients_collection, 'current_hospital'))
 def get_hospital_patients(hospital_id):
     """Get all patients for a hospital"""
     try:
@@ -272,46 +412,391 @@ def discharge_patient(patient_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/hospitals/<hospital_id>/patients/flow', methods=['GET'])
+def get_patient_flow(hospital_id):
+    """Length of stay, hourly admissions and discharges, and bed turnover over the last whole days"""
+    try:
+        days = request.args.get('days', 30, type=int)
+        return jsonify({'success': True, 'data': hms.patient_flow.report(hospital_id, days)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+# ==================== TRANSFER ENDPOINTS ====================
+
+@app.route('/api/patients/<patient_id>/transfers', methods=['POST'])
+def request_patient_transfer(patient_id):
+    """Hold a bed at another hospital for a patient; completing the transfer moves them"""
+    try:
+        data = request.get_json()
+        transfer = hms.transfers.request_transfer(
+            patient_id,
+            data['to_hospital_id'],
+            bed_id=data.get('bed_id'),
+            bed_type=data.get('bed_type'),
+            department=data.get('department'),
+            hold_minutes=int(data.get('hold_minutes', TRANSFER_HOLD_MINUTES)),
+            requested_by=data.get('requested_by', ''),
+            reason=data.get('reason', '')
+        )
+        return jsonify({'success': True, 'data': transfer}), 201
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/transfers/<transfer_id>', methods=['GET'])
+def get_transfer(transfer_id):
+    """Get a transfer by ID"""
+    try:
+        transfer = hms.transfers.get_transfer(transfer_id)
+        if transfer:
+            return jsonify({'success': True, 'data': transfer})
+        else:
+            return jsonify({'success': False, 'error': 'Transfer not found'}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/transfers/<transfer_id>/complete', methods=['PUT'])
+def complete_transfer(transfer_id):
+    """Move the patient into the held bed and free their bed at the sending hospital"""
+    try:
+        transfer = hms.transfers.complete_transfer(transfer_id)
+        if transfer:
+            return jsonify({'success': True, 'data': transfer})
+        else:
+            return jsonify({'success': False, 'error': 'Transfer not found'}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/transfers/<transfer_id>/cancel', methods=['PUT'])
+def cancel_transfer(transfer_id):
+    """Cancel a held transfer and release its bed"""
+    try:
+        success = hms.transfers.cancel_transfer(transfer_id)
+        if success:
+            return jsonify({'success': True, 'message': 'Transfer cancelled successfully'})
+        else:
+            return jsonify({'success': False, 'error': 'Held transfer not found'}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/transfers', methods=['GET'])
+def get_hospital_transfers(hospital_id):
+    """Transfers into or out of a hospital, newest first"""
+    try:
+        transfers = hms.transfers.get_transfers_by_hospital(hospital_id, request.args.get('status'))
+        return jsonify({'success': True, 'data': transfers, 'count': len(transfers)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/evacuations', methods=['POST'])
+def evacuate_ward(hospital_id):
+    """Plan (dry_run) or hold beds for moving every patient of a ward to receiving hospitals"""
+    try:
+        data = request.get_json()
+        department = data['department']
+        receiving_hospitals = data.get('receiving_hospitals')
+        if data.get('dry_run'):
+            result = hms.transfers.plan_evacuation(hospital_id, department, receiving_hospitals, data.get('bed_type'))
+        else:
+            result = hms.transfers.evacuate_ward(
+                hospital_id, department, receiving_hospitals,
+                bed_type=data.get('bed_type'),
+                hold_minutes=int(data.get('hold_minutes', TRANSFER_HOLD_MINUTES)),
+                requested_by=data.get('requested_by', '')
+            )
+        return jsonify({'success': True, 'data': result}), 200 if data.get('dry_run') else 201
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/evacuations/<evacuation_id>/complete', methods=['PUT'])
+def complete_evacuation(evacuation_id):
+    """Complete every held transfer of an evacuation"""
+    try:
+        return jsonify({'success': True, 'data': hms.transfers.complete_evacuation(evacuation_id)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # ==================== STAFF ENDPOINTS ====================
 
 @app.route('/api/hospitals/<hospital_id>/staff', methods=['GET'])
+@conditional_get(_hospital_scope(hms.staff_db.staff_collection))
 def get_hospital_staff(hospital_id):
     """Get all staff for a hospital"""
     try:
-        print(f"Debug: Fetching staff for hospital_id: {hospital_id}")
-        staff = staff_manager.get_staff_by_hospital(hospital_id)
-        print(f"Debug: Found {len(staff)} staff members")
+        status = request.args.get('status')
+        staff = [hms.staff_db.format_staff(member) for member in hms.staff_db.get_staff_by_hospital(hospital_id, status)]
         return jsonify({'success': True, 'data': staff})
     except Exception as e:
-        print(f"Debug: Error fetching staff: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/hospitals/<hospital_id>/staff/department/<department>', methods=['GET'])
+@conditional_get(_hospital_scope(hms.staff_db.staff_collection))
 def get_staff_by_department(hospital_id, department):
     """Get staff by department"""
     try:
-        staff = staff_manager.get_staff_by_department(hospital_id, department)
+        staff = [hms.staff_db.format_staff(member)
+                 for member in hms.staff_db.get_staff_by_department_and_hospital(department, hospital_id)]
         return jsonify({'success': True, 'data': staff})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/hospitals/<hospital_id>/staff/stats', methods=['GET'])
+@app.route('/api/hospitals/<hospital_id>/staff/statistics', methods=['GET'])
+@conditional_get(_hospital_scope(hms.staff_db.staff_collection))
 def get_staff_statistics(hospital_id):
     """Get staff statistics for a hospital"""
     try:
-        stats = staff_manager.get_staff_statistics(hospital_id)
+        stats = hms.staff_db.get_staff_statistics_by_hospital(hospital_id)
         return jsonify({'success': True, 'data': stats})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/staff/login', methods=['POST'])
+def staff_login():
+    """Staff login by email or staff_id; returns a signed session token"""
+    try:
+        data = request.get_json()
+        result = hms.staff_db.auth.login(data['identifier'], data['password'], data.get('hospital_id'))
+        if result is None:
+            return jsonify({'success': False, 'error': 'Invalid credentials'}), 401
+        return jsonify({'success': True, 'data': result})
+    except KeyError as e:
+        return jsonify({'success': False, 'error': f"Missing field: {e}"}), 400
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/staff/session', methods=['GET'])
+def get_staff_session():
+    """Verify a session token (Authorization: Bearer <token>); deactivated staff are checked against the live roster"""
+    header = request.headers.get('Authorization', '')
+    token = header[7:] if header.startswith('Bearer ') else ''
+    session = verify_session_token(token, hms.staff_db.is_staff_active)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Invalid or expired session'}), 401
+    return jsonify({'success': True, 'data': session})
+
+@app.route('/api/hospitals/<hospital_id>/staff/on-duty', methods=['GET'])
+def get_on_duty_staff(hospital_id):
+    """Get staff on duty right now from the live roster"""
+    try:
+        department = request.args.get('department')
+        staff = hms.staff_db.get_on_duty_staff(hospital_id, department)
+        return jsonify({'success': True, 'data': staff, 'count': len(staff)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/staff/roster', methods=['GET'])
+def get_staff_roster_counts(hospital_id):
+    """Get per-department staff counts by status from the live roster"""
+    try:
+        counts = hms.staff_db.roster.get_department_counts(hospital_id)
+        return jsonify({'success': True, 'data': counts})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/staff/<staff_id>/clock-in', methods=['POST'])
+def clock_in_staff(staff_id):
+    """Clock in a staff member"""
+    try:
+        data = request.get_json(silent=True) or {}
+        attendance_id = hms.staff_db.clock_in(staff_id, data.get('location'))
+        return jsonify({'success': True, 'attendance_id': attendance_id}), 201
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/staff/<staff_id>/clock-out', methods=['POST'])
+def clock_out_staff(staff_id):
+    """Clock out a staff member"""
+    try:
+        success = hms.staff_db.clock_out(staff_id)
+        if success:
+            return jsonify({'success': True, 'message': 'Staff member clocked out successfully'})
+        else:
+            return jsonify({'success': False, 'error': 'No open attendance record found'}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _parse_pay_period(args):
+    """Pay period from ?start=&end= (ISO dates, end exclusive); defaults to the last 14 days"""
+    today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+    period_end = datetime.fromisoformat(args['end']) if args.get('end') else today
+    period_start = datetime.fromisoformat(args['start']) if args.get('start') else period_end - timedelta(days=14)
+    return period_start, period_end
+
+TIMESHEET_COLUMNS = ['staff_id', 'full_name', 'role', 'department', 'employment_type', 'days_worked', 'shifts',
+                     'worked_hours', 'break_hours', 'net_hours', 'regular_hours', 'overtime_hours']
+
+@app.route('/api/hospitals/<hospital_id>/timesheets', methods=['GET'])
+def export_timesheets(hospital_id):
+    """Bulk timesheet export for a pay period (json, ndjson or csv)"""
+    try:
+        period_start, period_end = _parse_pay_period(request.args)
+        export_format = request.args.get('format', 'json')
+        rows = hms.timesheets.get_timesheets(hospital_id, period_start, period_end,
+                                             staff_id=request.args.get('staff_id'))
+
+        if export_format == 'ndjson':
+            def generate_ndjson():
+                for row in rows:
+                    yield json.dumps(row) + '\n'
+            return Response(stream_with_context(generate_ndjson()), mimetype='application/x-ndjson')
+
+        if export_format == 'csv':
+            def generate_csv():
+                buffer = io.StringIO()
+                writer = csv.DictWriter(buffer, fieldnames=TIMESHEET_COLUMNS, extrasaction='ignore')
+                writer.writeheader()
+                for row in rows:
+                    writer.writerow(row)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+                yield buffer.getvalue()
+            filename = f"timesheets_{hospital_id}_{period_start:%Y%m%d}_{period_end:%Y%m%d}.csv"
+            return Response(stream_with_context(generate_csv()), mimetype='text/csv',
+                            headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+        return jsonify({
+            'success': True,
+            'period_start': period_start.isoformat(),
+            'period_end': period_end.isoformat(),
+            'closed': hms.timesheets.is_period_closed(period_end),
+            'data': list(rows)
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/staff/coverage', methods=['GET'])
+def get_staff_coverage(hospital_id):
+    """Scheduled staff coverage: a point-in-time count (?at=) or a histogram over [start, end)"""
+    try:
+        department = request.args.get('department')
+        role = request.args.get('role')
+        coverage = hms.staff_db.coverage
+
+        if request.args.get('at'):
+            at = datetime.fromisoformat(request.args['at'])
+            return jsonify({
+                'success': True,
+                'at': at.isoformat(),
+                'on_shift': coverage.count_at(hospital_id, at, department, role)
+            })
+
+        start = datetime.fromisoformat(request.args['start']) if request.args.get('start') else datetime.utcnow()
+        end = datetime.fromisoformat(request.args['end']) if request.args.get('end') else start + timedelta(days=1)
+        bucket_minutes = request.args.get('bucket_minutes', 60, type=int)
+        if (end - start) / timedelta(minutes=max(bucket_minutes, 1)) > 10000:
+            raise ValueError("Too many buckets; increase bucket_minutes or narrow the window")
+
+        return jsonify({
+            'success': True,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'bucket_minutes': bucket_minutes,
+            'scheduled_in_window': coverage.count_between(hospital_id, start, end, department, role),
+            'data': coverage.histogram(hospital_id, start, end, bucket_minutes, department, role)
+        })
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/staff/caseloads', methods=['GET'])
+def get_staff_caseloads(hospital_id):
+    """Patient caseload of on-duty staff, least-loaded first"""
+    try:
+        department = request.args.get('department')
+        caseloads = hms.assignment_balancer.get_caseloads(hospital_id, department)
+        return jsonify({'success': True, 'data': caseloads})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/assignments', methods=['POST'])
+def auto_assign_patient(hospital_id):
+    """Assign a patient to the least-loaded on-duty staff member of a department"""
+    try:
+        data = request.get_json()
+        assignment = hms.assignment_balancer.assign(
+            hospital_id,
+            data['patient_id'],
+            data['department'],
+            role=data.get('role'),
+            assignment_type=data.get('assignment_type', 'primary'),
+            max_caseload=data.get('max_caseload', MAX_CASELOAD)
+        )
+        return jsonify({'success': True, 'data': assignment}), 201
+    except KeyError as e:
+        return jsonify({'success': False, 'error': f"Missing field: {e}"}), 400
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/assignments/shift-change', methods=['POST'])
+def reassign_at_shift_change(hospital_id):
+    """Move all patients of outgoing staff in a department to on-duty staff"""
+    try:
+        data = request.get_json()
+        result = hms.assignment_balancer.reassign_at_shift_change(
+            hospital_id,
+            data['department'],
+            outgoing_staff_ids=data.get('staff_ids'),
+            max_caseload=data.get('max_caseload', MAX_CASELOAD)
+        )
+        return jsonify({'success': True, 'data': result})
+    except KeyError as e:
+        return jsonify({'success': False, 'error': f"Missing field: {e}"}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/schedules/generate', methods=['POST'])
+def generate_schedules(hospital_id):
+    """Build a week of staff schedules against per-department minimum coverage"""
+    try:
+        data = request.get_json(silent=True) or {}
+        today = datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        week_start = datetime.fromisoformat(data['week_start']) if data.get('week_start') else today
+        result = hms.shift_scheduler.generate_week(
+            hospital_id,
+            week_start,
+            min_coverage=data.get('min_coverage'),
+            roles=data.get('roles'),
+            dry_run=bool(data.get('dry_run', False))
+        )
+        return jsonify({
+            'success': True,
+            'week_start': result['week_start'].isoformat(),
+            'schedules_created': 0 if data.get('dry_run') else len(result['schedules']),
+            'schedules': result['schedules'],
+            'coverage': result['coverage'],
+            'gaps': result['gaps'],
+            'unscheduled_staff': result['unscheduled_staff']
+        }), 200 if data.get('dry_run') else 201
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 @app.route('/api/hospitals/<hospital_id>/staff', methods=['POST'])
 def add_staff(hospital_id):
     """Add staff member to a hospital"""
     try:
         data = request.get_json()
-        data['hospital_id'] = hospital_id
-        staff_id = staff_manager.add_staff_member(data)
+        staff_id = hms.add_staff_to_hospital(hospital_id, data)
         return jsonify({'success': True, 'staff_id': staff_id}), 201
+    except KeyError as e:
+        return jsonify({'success': False, 'error': f"Missing field: {e}"}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
 
@@ -319,9 +804,9 @@ def add_staff(hospital_id):
 def get_staff_member(staff_id):
     """Get a specific staff member"""
     try:
-        staff = staff_manager.get_staff_by_id(staff_id)
+        staff = hms.staff_db.get_staff_by_id(staff_id)
         if staff:
-            return jsonify({'success': True, 'data': staff})
+            return jsonify({'success': True, 'data': hms.staff_db.format_staff(staff)})
         else:
             return jsonify({'success': False, 'error': 'Staff member not found'}), 404
     except Exception as e:
@@ -333,11 +818,17 @@ def update_staff_status(staff_id):
     try:
         data = request.get_json()
         status = data.get('status')
-        success = staff_manager.update_staff_status(staff_id, status)
+        # Older clients send employment statuses (active/on_leave/inactive)
+        if status in EMPLOYMENT_STATUSES:
+            success = hms.staff_db.set_employment_status(staff_id, status)
+        else:
+            success = hms.staff_db.update_staff_status(staff_id, status, data.get('location'), data.get('reason', ''))
         if success:
             return jsonify({'success': True, 'message': 'Staff status updated successfully'})
         else:
             return jsonify({'success': False, 'error': 'Staff member not found'}), 404
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -346,7 +837,7 @@ def update_staff_member(staff_id):
     """Update staff member information"""
     try:
         data = request.get_json()
-        success = staff_manager.update_staff_member(staff_id, data)
+        success = hms.staff_db.update_staff_member(staff_id, data)
         if success:
             return jsonify({'success': True, 'message': 'Staff member updated successfully'})
         else:
@@ -357,23 +848,24 @@ def update_staff_member(staff_id):
 # ==================== INVENTORY ENDPOINTS ====================
 
 @app.route('/api/hospitals/<hospital_id>/inventory', methods=['GET'])
+@conditional_get(_hospital_scope(hms.inventory_db.inventory_collection))
 def get_hospital_inventory(hospital_id):
     """Get all inventory for a hospital"""
     try:
-        print(f"Debug: Fetching inventory for hospital_id: {hospital_id}")
         category = request.args.get('category')
-        inventory = inventory_manager.get_inventory_by_hospital(hospital_id, category)
-        print(f"Debug: Found {len(inventory)} inventory items")
+        inventory = [hms.inventory_db.format_item(item)
+                     for item in hms.inventory_db.get_inventory_by_hospital(hospital_id, category)]
         return jsonify({'success': True, 'data': inventory})
     except Exception as e:
-        print(f"Debug: Error fetching inventory: {e}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
 @app.route('/api/hospitals/<hospital_id>/inventory/category/<category>', methods=['GET'])
+@conditional_get(_hospital_scope(hms.inventory_db.inventory_collection))
 def get_inventory_by_category(hospital_id, category):
     """Get inventory by category"""
     try:
-        inventory = inventory_manager.get_inventory_by_category(hospital_id, category)
+        inventory = [hms.inventory_db.format_item(item)
+                     for item in hms.inventory_db.get_inventory_by_hospital(hospital_id, category)]
         return jsonify({'success': True, 'data': inventory})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -382,7 +874,7 @@ def get_inventory_by_category(hospital_id, category):
 def get_inventory_statistics(hospital_id):
     """Get inventory statistics for a hospital"""
     try:
-        stats = inventory_manager.get_inventory_statistics(hospital_id)
+        stats = hms.inventory_db.get_inventory_statistics_by_hospital(hospital_id)
         return jsonify({'success': True, 'data': stats})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -391,7 +883,8 @@ def get_inventory_statistics(hospital_id):
 def get_low_stock_items(hospital_id):
     """Get low stock items for a hospital"""
     try:
-        items = inventory_manager.get_low_stock_items(hospital_id)
+        items = [hms.inventory_db.format_item(item)
+                 for item in hms.inventory_db.get_low_stock_items_by_hospital(hospital_id)]
         return jsonify({'success': True, 'data': items})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -401,7 +894,8 @@ def get_expiring_items(hospital_id):
     """Get expiring items for a hospital"""
     try:
         days_ahead = request.args.get('days', 30, type=int)
-        items = inventory_manager.get_expiring_items(hospital_id, days_ahead)
+        items = [hms.inventory_db.format_item(item)
+                 for item in hms.inventory_db.get_expiring_items_by_hospital(hospital_id, days_ahead)]
         return jsonify({'success': True, 'data': items})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -412,7 +906,7 @@ def add_inventory_item(hospital_id):
     try:
         data = request.get_json()
         data['hospital_id'] = hospital_id
-        item_id = inventory_manager.add_inventory_item(data)
+        item_id = hms.inventory_db.create_inventory_item(data)
         return jsonify({'success': True, 'item_id': item_id}), 201
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 400
@@ -421,9 +915,9 @@ def add_inventory_item(hospital_id):
 def get_inventory_item(item_id):
     """Get a specific inventory item"""
     try:
-        item = inventory_manager.get_item_by_id(item_id)
+        item = hms.inventory_db.get_item_by_id(item_id)
         if item:
-            return jsonify({'success': True, 'data': item})
+            return jsonify({'success': True, 'data': hms.inventory_db.format_item(item)})
         else:
             return jsonify({'success': False, 'error': 'Item not found'}), 404
     except Exception as e:
@@ -434,12 +928,13 @@ def update_inventory_stock(item_id):
     """Update inventory stock"""
     try:
         data = request.get_json()
-        new_stock = data.get('current_stock')
-        success = inventory_manager.update_stock_level(item_id, new_stock)
-        if success:
-            return jsonify({'success': True, 'message': 'Stock updated successfully'})
-        else:
-            return jsonify({'success': False, 'error': 'Item not found'}), 404
+        new_stock = int(data.get('current_stock'))
+        hms.inventory_db.set_stock_level(item_id, new_stock, data.get('reason', ''), data.get('user_id', ''),
+                                         hospital_id=data.get('hospital_id'))
+        return jsonify({'success': True, 'message': 'Stock updated successfully'})
+    except ValueError as e:
+        status_code = 404 if 'not found' in str(e) else 400
+        return jsonify({'success': False, 'error': str(e)}), status_code
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -448,7 +943,7 @@ def update_inventory_item(item_id):
     """Update inventory item information"""
     try:
         data = request.get_json()
-        success = inventory_manager.update_inventory_item(item_id, data)
+        success = hms.inventory_db.update_item(item_id, data)
         if success:
             return jsonify({'success': True, 'message': 'Item updated successfully'})
         else:
@@ -460,7 +955,7 @@ def update_inventory_item(item_id):
 def delete_inventory_item(item_id):
     """Delete an inventory item"""
     try:
-        success = inventory_manager.delete_inventory_item(item_id)
+        success = hms.inventory_db.delete_item(item_id)
         if success:
             return jsonify({'success': True, 'message': 'Item deleted successfully'})
         else:
@@ -468,15 +963,273 @@ def delete_inventory_item(item_id):
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/inventory/<item_id>/lots', methods=['GET'])
+def get_inventory_item_lots(item_id):
+    """Get the lots of an inventory item in FEFO order"""
+    try:
+        include_depleted = request.args.get('include_depleted', 'false').lower() == 'true'
+        lots = hms.inventory_db.get_lots_for_item(item_id, include_depleted)
+        return jsonify({'success': True, 'data': lots})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/inventory/<item_id>/restock', methods=['POST'])
+def restock_inventory_item(item_id):
+    """Restock an inventory item as a new lot"""
+    try:
+        data = request.get_json()
+        hms.inventory_db.restock_item(
+            item_id,
+            int(data['quantity']),
+            data.get('supplier', ''),
+            data.get('batch_number', ''),
+            data.get('expiry_date'),
+            hospital_id=data.get('hospital_id')
+        )
+        return jsonify({'success': True, 'message': 'Item restocked successfully'})
+    except ValueError as e:
+        status_code = 404 if 'not found' in str(e) else 400
+        return jsonify({'success': False, 'error': str(e)}), status_code
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/inventory/<item_id>/dispense', methods=['POST'])
+def dispense_inventory_item(item_id):
+    """Dispense an inventory item (FEFO across lots)"""
+    try:
+        data = request.get_json()
+        hms.inventory_db.dispense_item(
+            item_id,
+            int(data['quantity']),
+            data.get('patient_id', ''),
+            data.get('department', ''),
+            data.get('reason', ''),
+            hospital_id=data.get('hospital_id')
+        )
+        return jsonify({'success': True, 'message': 'Item dispensed successfully'})
+    except ValueError as e:
+        status_code = 404 if 'not found' in str(e) else 400
+        return jsonify({'success': False, 'error': str(e)}), status_code
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/inventory/<item_id>/availability', methods=['GET'])
+def get_inventory_item_availability(item_id):
+    """Get current, reserved and available-to-promise stock for an item"""
+    try:
+        availability = hms.inventory_db.get_item_availability(item_id, request.args.get('hospital_id'))
+        if availability:
+            return jsonify({'success': True, 'data': availability})
+        else:
+            return jsonify({'success': False, 'error': 'Item not found'}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/inventory/<item_id>/reservations', methods=['POST'])
+def reserve_inventory_item(item_id):
+    """Reserve stock of an item for a scheduled procedure"""
+    try:
+        data = request.get_json()
+        reservation_id = hms.inventory_db.reserve_stock(
+            item_id,
+            int(data['quantity']),
+            ttl_minutes=int(data.get('ttl_minutes', DEFAULT_RESERVATION_TTL_MINUTES)),
+            reference=data.get('reference', ''),
+            patient_id=data.get('patient_id', ''),
+            reserved_by=data.get('reserved_by', ''),
+            hospital_id=data.get('hospital_id')
+        )
+        return jsonify({'success': True, 'reservation_id': reservation_id}), 201
+    except ValueError as e:
+        status_code = 404 if 'not found' in str(e) else 400
+        return jsonify({'success': False, 'error': str(e)}), status_code
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/hospitals/<hospital_id>/inventory/reservations', methods=['GET'])
+def get_inventory_reservations(hospital_id):
+    """Get stock reservations for a hospital"""
+    try:
+        status = request.args.get('status', 'active')
+        reservations = hms.inventory_db.get_reservations_by_hospital(hospital_id, status)
+        return jsonify({'success': True, 'data': reservations})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/reservations/<reservation_id>/release', methods=['PUT'])
+def release_inventory_reservation(reservation_id):
+    """Release a stock reservation"""
+    try:
+        success = hms.inventory_db.release_reservation(reservation_id)
+        if success:
+            return jsonify({'success': True, 'message': 'Reservation released successfully'})
+        else:
+            return jsonify({'success': False, 'error': 'Active reservation not found'}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/reservations/<reservation_id>/fulfill', methods=['PUT'])
+def fulfill_inventory_reservation(reservation_id):
+    """Dispense the stock held by a reservation"""
+    try:
+        data = request.get_json(silent=True) or {}
+        success = hms.inventory_db.fulfill_reservation(
+            reservation_id,
+            patient_id=data.get('patient_id', ''),
+            department=data.get('department', ''),
+            user_id=data.get('user_id', '')
+        )
+        if success:
+            return jsonify({'success': True, 'message': 'Reservation fulfilled successfully'})
+        else:
+            return jsonify({'success': False, 'error': 'Active reservation not found'}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/hospitals/<hospital_id>/inventory/scan', methods=['POST'])
+def scan_inventory_item(hospital_id):
+    """Resolve a scanned barcode and dispense in one call"""
+    try:
+        data = request.get_json()
+        if not data.get('barcode'):
+            return jsonify({'success': False, 'error': 'barcode is required'}), 400
+        result = hms.inventory_db.scan_and_dispense(
+            hospital_id,
+            data['barcode'],
+            int(data.get('quantity', 1)),
+            batch_number=data.get('batch_number'),
+            patient_id=data.get('patient_id', ''),
+            department=data.get('department', ''),
+            reason=data.get('reason', ''),
+            user_id=data.get('user_id', '')
+        )
+        return jsonify({'success': True, 'data': result})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+@app.route('/api/hospitals/<hospital_id>/inventory/lots/expiring', methods=['GET'])
+def get_expiring_lots(hospital_id):
+    """Get lots expiring within N days for a hospital"""
+    try:
+        days_ahead = request.args.get('days', 30, type=int)
+        lots = hms.inventory_db.get_expiring_lots_by_hospital(hospital_id, days_ahead)
+        return jsonify({'success': True, 'data': lots})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/inventory/lots/expired', methods=['GET'])
+def get_expired_lots(hospital_id):
+    """Get lots that have already expired but still hold stock"""
+    try:
+        lots = hms.inventory_db.get_expired_lots_by_hospital(hospital_id)
+        return jsonify({'success': True, 'data': lots})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/inventory/lots/expired/write-off', methods=['POST'])
+def write_off_expired_lots(hospital_id):
+    """Write off the remaining stock of expired lots"""
+    try:
+        data = request.get_json(silent=True) or {}
+        lots = hms.inventory_db.write_off_expired_lots(hospital_id, data.get('user_id', ''))
+        return jsonify({'success': True, 'data': lots, 'count': len(lots)})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/inventory/transactions', methods=['GET'])
+def get_inventory_transactions(hospital_id):
+    """Get recent raw inventory transactions for a hospital (paginated)"""
+    try:
+        item_id = request.args.get('item_id')
+        # Raw rows only exist for the retention window; longer ranges come from /consumption
+        days = min(request.args.get('days', 1, type=int), TRANSACTION_RETENTION_DAYS)
+        limit = min(request.args.get('limit', 100, type=int), 1000)
+        skip = request.args.get('skip', 0, type=int)
+        transactions = hms.inventory_db.get_transaction_history(item_id, days, hospital_id, limit, skip)
+        return jsonify({'success': True, 'data': transactions, 'limit': limit, 'skip': skip})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/inventory/consumption', methods=['GET'])
+def get_inventory_consumption(hospital_id):
+    """Get hourly or daily consumption totals from the transaction rollups"""
+    try:
+        item_id = request.args.get('item_id')
+        days = request.args.get('days', 30, type=int)
+        granularity = request.args.get('granularity')
+        history = hms.inventory_db.get_consumption_history(hospital_id, item_id, days, granularity)
+        return jsonify({'success': True, 'data': history})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/inventory/reorder', methods=['GET'])
+def get_inventory_reorder_list(hospital_id):
+    """Get a ranked reorder list from consumption-based forecasts"""
+    try:
+        limit = request.args.get('limit', type=int)
+        reorder = hms.inventory_forecaster.get_reorder_list(
+            hospital_id,
+            limit=limit,
+            window_days=request.args.get('window', 28, type=int),
+            lead_time_days=request.args.get('lead_time', 7, type=int),
+            service_level=request.args.get('service_level', 0.95, type=float)
+        )
+        return jsonify({'success': True, 'data': reorder, 'count': len(reorder)})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/hospitals/<hospital_id>/inventory/forecast', methods=['GET'])
+def get_inventory_forecast(hospital_id):
+    """Get burn rate, days of cover and reorder point for every active item"""
+    try:
+        forecasts = hms.inventory_forecaster.forecast_hospital(
+            hospital_id,
+            window_days=request.args.get('window', 28, type=int),
+            lead_time_days=request.args.get('lead_time', 7, type=int),
+            service_level=request.args.get('service_level', 0.95, type=float)
+        )
+        return jsonify({'success': True, 'data': forecasts})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
 # ==================== SYSTEM ENDPOINTS ====================
 
 @app.route('/api/system/overview', methods=['GET'])
 def get_system_overview():
     """Get system overview"""
     try:
-        overview = hms.get_system_overview()
+        overview = hms.get_system_overview(request.args.get('region', 'state'))
         overview['last_updated'] = overview['last_updated'].isoformat()
         return jsonify({'success': True, 'data': overview})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/system/cache', methods=['GET'])
+def get_cache_metrics():
+    """Hit/miss metrics of the entity lookup caches and the state of the change watcher feeding them"""
+    try:
+        return jsonify({'success': True, 'data': {**cache_metrics(), 'change_watcher': hms.change_watcher.stats()}})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/batch', methods=['POST'])
+def batch_requests():
+    """Run several independent API requests concurrently and return all responses in one"""
+    try:
+        subrequests = parse_batch(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    try:
+        shared_headers = {'Authorization': request.headers['Authorization']} if 'Authorization' in request.headers else {}
+        return jsonify({'success': True, 'responses': run_batch(app, subrequests, shared_headers)})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -527,33 +1280,77 @@ def api_documentation():
                 'PUT /api/hospitals/{id}': 'Update hospital',
                 'GET /api/hospitals/{id}/dashboard': 'Get hospital dashboard',
                 'PUT /api/hospitals/{id}/deactivate': 'Deactivate hospital',
-                'GET /api/hospitals/search?q={term}': 'Search hospitals'
+                'GET /api/hospitals/search?q={term}': 'Search hospitals',
+                'GET /api/hospitals/{id}/events': 'Live bed, admission, discharge, stock and staff events (text/event-stream)',
+                'GET /api/hospitals/{id}/changes?since={seq}&limit={n}': 'Records changed or deleted since a sequence number'
             },
             'beds': {
                 'GET /api/hospitals/{id}/beds': 'Get hospital beds',
                 'POST /api/hospitals/{id}/beds': 'Create bed',
-                'PUT /api/beds/{id}/status': 'Update bed status'
+                'PUT /api/beds/{id}/status': 'Update bed status',
+                'GET /api/beds/nearest?lat={lat}&lon={lon}&bed_type={type}&limit={n}&max_km={km}': 'Nearest hospitals with an available bed, by distance',
+                'GET /api/hospitals/{id}/beds/occupancy?start={iso}&end={iso}&bucket_minutes={n}&department={dept}': 'Occupancy history histogram (or ?at={iso} for one instant)',
+                'GET /api/hospitals/{id}/beds/forecast?hours={n}': 'Projected occupancy per department for the next 24-72 hours'
             },
             'patients': {
                 'GET /api/hospitals/{id}/patients': 'Get hospital patients',
                 'POST /api/hospitals/{id}/patients': 'Admit patient',
                 'GET /api/patients/{id}': 'Get patient by ID',
-                'PUT /api/patients/{id}/discharge': 'Discharge patient'
+                'PUT /api/patients/{id}/discharge': 'Discharge patient',
+                'GET /api/hospitals/{id}/patients/flow?days={n}': 'Length of stay, hourly admissions/discharges and bed turnover'
+            },
+            'transfers': {
+                'POST /api/patients/{id}/transfers': 'Hold a bed at another hospital for a patient',
+                'GET /api/transfers/{id}': 'Get transfer',
+                'PUT /api/transfers/{id}/complete': 'Move the patient into the held bed and free the old one',
+                'PUT /api/transfers/{id}/cancel': 'Cancel a held transfer',
+                'GET /api/hospitals/{id}/transfers?status={status}': 'Transfers into or out of a hospital',
+                'POST /api/hospitals/{id}/evacuations': 'Plan (dry_run) or hold beds for evacuating a ward',
+                'PUT /api/evacuations/{id}/complete': 'Complete every held transfer of an evacuation'
             },
             'staff': {
                 'GET /api/hospitals/{id}/staff': 'Get hospital staff',
                 'POST /api/hospitals/{id}/staff': 'Add staff member',
                 'PUT /api/staff/{id}/status': 'Update staff status',
-                'POST /api/staff/login': 'Staff login'
+                'GET /api/hospitals/{id}/staff/on-duty?department={dept}': 'Get staff on duty now',
+                'GET /api/hospitals/{id}/staff/roster': 'Get live roster counts by department',
+                'POST /api/staff/{id}/clock-in': 'Clock in',
+                'POST /api/staff/{id}/clock-out': 'Clock out',
+                'GET /api/hospitals/{id}/timesheets?start={date}&end={date}&format={json|ndjson|csv}': 'Export pay period timesheets',
+                'POST /api/hospitals/{id}/schedules/generate': 'Generate a week of staff schedules',
+                'GET /api/hospitals/{id}/staff/caseloads?department={dept}': 'Get on-duty staff caseloads',
+                'POST /api/hospitals/{id}/assignments': 'Assign a patient to the least-loaded staff member',
+                'POST /api/hospitals/{id}/assignments/shift-change': 'Reassign outgoing staff patients',
+                'GET /api/hospitals/{id}/staff/coverage?start={iso}&end={iso}&bucket_minutes={n}&department={dept}&role={role}': 'Scheduled coverage histogram (or ?at={iso} for one instant)',
+                'POST /api/staff/login': 'Staff login',
+                'GET /api/staff/session': 'Verify a session token'
             },
             'inventory': {
                 'GET /api/hospitals/{id}/inventory': 'Get hospital inventory',
                 'POST /api/hospitals/{id}/inventory': 'Add inventory item',
                 'PUT /api/inventory/{id}/stock': 'Update inventory stock',
-                'GET /api/hospitals/{id}/inventory/low-stock': 'Get low stock items'
+                'GET /api/hospitals/{id}/inventory/low-stock': 'Get low stock items',
+                'GET /api/inventory/{id}/lots': 'Get item lots in FEFO order',
+                'POST /api/inventory/{id}/restock': 'Restock item as a new lot',
+                'POST /api/inventory/{id}/dispense': 'Dispense item (FEFO)',
+                'POST /api/hospitals/{id}/inventory/scan': 'Scan barcode and dispense',
+                'GET /api/inventory/{id}/availability': 'Get available-to-promise stock',
+                'POST /api/inventory/{id}/reservations': 'Reserve stock for a procedure',
+                'GET /api/hospitals/{id}/inventory/reservations?status={status}': 'Get stock reservations',
+                'PUT /api/reservations/{id}/release': 'Release a reservation',
+                'PUT /api/reservations/{id}/fulfill': 'Dispense reserved stock',
+                'GET /api/hospitals/{id}/inventory/lots/expiring?days={n}': 'Get lots expiring within n days',
+                'GET /api/hospitals/{id}/inventory/lots/expired': 'Get expired lots still in stock',
+                'POST /api/hospitals/{id}/inventory/lots/expired/write-off': 'Write off expired lots',
+                'GET /api/hospitals/{id}/inventory/transactions?days={n}&limit={n}&skip={n}': 'Get recent raw transactions',
+                'GET /api/hospitals/{id}/inventory/consumption?days={n}&granularity={hour|day}': 'Get consumption rollups',
+                'GET /api/hospitals/{id}/inventory/forecast': 'Get burn rates and reorder points',
+                'GET /api/hospitals/{id}/inventory/reorder?limit={n}': 'Get ranked reorder list'
             },
             'system': {
-                'GET /api/system/overview': 'Get system overview',
+                'GET /api/system/overview?region={state|city}': 'System totals and per-region breakdown from per-hospital summaries',
+                'GET /api/system/cache': 'Entity lookup cache metrics and change watcher state',
+                'POST /api/batch': 'Run several independent requests in one round trip',
                 'POST /api/initialize-sample-data': 'Initialize sample data',
                 'GET /api/health': 'Health check',
                 'GET /api/docs': 'API documentation'
@@ -566,4 +1363,7 @@ if __name__ == '__main__':
     print("Starting Hospital Management System API...")
     print("API Documentation available at: http://localhost:5000/api/docs")
     print("Health Check available at: http://localhost:5000/api/health")
+    # The debug reloader imports this module in a watcher process too; only its child serves requests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_tasks()
     app.run(debug=True, host='0.0.0.0', port=5000)
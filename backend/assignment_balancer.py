@@ -0,0 +1,168 @@
+"""
+Patient Assignment Balancer for Hospital Management
+Least-loaded assignment of patients to on-duty staff, per department and role
+"""
+
+from threading import Lock
+import heapq
+import os
+
+# Default ceiling on patients per staff member (None = unlimited)
+MAX_CASELOAD = int(os.getenv('MAX_CASELOAD', 0)) or None
+
+
+class AssignmentBalancer:
+    def __init__(self, staff_db):
+        """Balancer on top of StaffManagementDB and its live roster"""
+        self.staff_db = staff_db
+        self.roster = staff_db.roster
+        self._lock = Lock()
+        # (hospital_id, department, role) -> (roster version, [(caseload, staff_id)], {staff_id: caseload})
+        self._heaps = {}
+
+    def _heap(self, hospital_id, department, role):
+        """Min-heap of on-duty staff by caseload and its caseload map; rebuilt when the roster version
+        moves (membership changes, or someone's caseload dropped) (caller holds the lock)"""
+        key = (hospital_id, department, role)
+        version = self.roster.sync(hospital_id)
+        cached = self._heaps.get(key)
+        if cached and cached[0] == version:
+            return cached[1], cached[2]
+
+        heap, caseloads = [], {}
+        for entry in self.roster.get_on_duty(hospital_id, department):
+            if role is not None and entry.get('role') != role:
+                continue
+            caseload = entry.get('caseload', 0)
+            caseloads[entry['staff_id']] = caseload
+            heap.append((caseload, entry['staff_id']))
+        heapq.heapify(heap)
+        self._heaps[key] = (version, heap, caseloads)
+        return heap, caseloads
+
+    def _set_caseload(self, hospital_id, staff_id, caseload):
+        """Record a new caseload in every heap holding the staff member; their older entries become stale"""
+        for (heap_hospital_id, _, _), (_, heap, caseloads) in self._heaps.items():
+            if heap_hospital_id == hospital_id and staff_id in caseloads:
+                caseloads[staff_id] = caseload
+                heapq.heappush(heap, (caseload, staff_id))
+
+    def _pop_least_loaded(self, hospital_id, heap, caseloads, max_caseload, planned=None):
+        """Remove and return the least-loaded staff member, or None if everyone is full.
+
+        The candidate's caseload is checked against the roster (plus planned, for moves not written
+        yet); a rise made outside the balancer re-queues them at their real load.
+        """
+        while heap:
+            caseload, staff_id = heap[0]
+            if caseloads.get(staff_id) != caseload:
+                heapq.heappop(heap)
+                continue
+            entry = self.roster.get_entry(hospital_id, staff_id)
+            if entry is None:
+                heapq.heappop(heap)
+                del caseloads[staff_id]
+                continue
+            current = entry.get('caseload', 0) + (planned or {}).get(staff_id, 0)
+            if current != caseload:
+                caseloads[staff_id] = current
+                heapq.heapreplace(heap, (current, staff_id))
+                continue
+            if max_caseload is not None and caseload >= max_caseload:
+                return None
+            heapq.heappop(heap)
+            return staff_id
+        return None
+
+    def assign(self, hospital_id, patient_id, department, role=None, assignment_type='primary',
+               max_caseload=MAX_CASELOAD):
+        """Assign a patient to the least-loaded on-duty staff member of a department (and role)"""
+        with self._lock:
+            heap, caseloads = self._heap(hospital_id, department, role)
+            skipped = []
+            popped = None  # Off the heap and not yet given a new entry
+            try:
+                while True:
+                    popped = staff_id = self._pop_least_loaded(hospital_id, heap, caseloads, max_caseload)
+                    if staff_id is None:
+                        raise ValueError(f"No on-duty staff with spare capacity in {department}")
+                    try:
+                        assignment_id = self.staff_db.assign_patient_to_staff(
+                            staff_id, patient_id, assignment_type, max_caseload
+                        )
+                    except ValueError:
+                        # Another worker filled this staff member up; try the next one
+                        skipped.append(staff_id)
+                        popped = None
+                        continue
+                    entry = self.roster.get_entry(hospital_id, staff_id)
+                    caseload = entry.get('caseload', 0) if entry else caseloads[staff_id] + 1
+                    popped = None
+                    self._set_caseload(hospital_id, staff_id, caseload)
+                    return {'assignment_id': assignment_id, 'staff_id': staff_id, 'caseload': caseload}
+            finally:
+                if popped is not None:
+                    # Any other failure leaves them where they were, so they stay assignable
+                    heapq.heappush(heap, (caseloads[popped], popped))
+                for staff_id in skipped:
+                    # Their true load is unknown until the roster catches up; keep them at the back
+                    caseloads[staff_id] = max_caseload or caseloads[staff_id] + 1
+                    heapq.heappush(heap, (caseloads[staff_id], staff_id))
+
+    def reassign_at_shift_change(self, hospital_id, department, outgoing_staff_ids=None,
+                                 max_caseload=MAX_CASELOAD, reason='shift_change'):
+        """Hand every patient of outgoing staff to on-duty staff of the same role, least-loaded first"""
+        query = {'hospital_id': hospital_id, 'department': department, 'caseload': {'$gt': 0}}
+        if outgoing_staff_ids:
+            query['staff_id'] = {'$in': list(outgoing_staff_ids)}
+        else:
+            # Default: everyone in the department who is no longer on duty
+            query['current_status'] = {'$ne': 'on_duty'}
+
+        outgoing = list(self.staff_db.staff_collection.find(
+            query, {'_id': 0, 'staff_id': 1, 'role': 1, 'assigned_patients': 1}
+        ))
+
+        with self._lock:
+            moves, unassigned = [], []
+            outgoing_ids = {member['staff_id'] for member in outgoing}
+            planned = {}  # staff_id -> patients planned for them but not written yet
+            for member in outgoing:
+                heap, caseloads = self._heap(hospital_id, department, member.get('role'))
+                held_back = []
+                for patient_id in member.get('assigned_patients', []):
+                    staff_id = self._pop_least_loaded(hospital_id, heap, caseloads, max_caseload, planned)
+                    # Leaving staff never receive patients back
+                    while staff_id in outgoing_ids:
+                        held_back.append(staff_id)
+                        staff_id = self._pop_least_loaded(hospital_id, heap, caseloads, max_caseload, planned)
+                    if staff_id is None:
+                        unassigned.append(patient_id)
+                        continue
+                    moves.append((member['staff_id'], staff_id, patient_id))
+                    planned[staff_id] = planned.get(staff_id, 0) + 1
+                    self._set_caseload(hospital_id, staff_id, caseloads[staff_id] + 1)
+                for staff_id in held_back:
+                    heapq.heappush(heap, (caseloads[staff_id], staff_id))
+
+            try:
+                self.staff_db.move_patient_assignments(moves, reason)
+            except Exception:
+                # Planned caseloads were never written; rebuild from the roster next time
+                self._heaps.clear()
+                raise
+
+        return {
+            'reassigned': len(moves),
+            'moves': [{'from_staff_id': f, 'to_staff_id': t, 'patient_id': p} for f, t, p in moves],
+            'unassigned_patients': unassigned
+        }
+
+    def get_caseloads(self, hospital_id, department=None):
+        """Current caseload of on-duty staff, least-loaded first"""
+        entries = self.roster.get_on_duty(hospital_id, department)
+        return sorted(
+            ({'staff_id': e['staff_id'], 'full_name': e.get('full_name', ''), 'role': e.get('role', ''),
+              'department': e.get('department', ''), 'caseload': e.get('caseload', 0)} for e in entries),
+            key=lambda e: (e['caseload'], e['staff_id'])
+        )
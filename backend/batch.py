@@ -0,0 +1,105 @@
+"""
+Batched API Requests for Hospital Management
+Runs a page's sub-requests concurrently in one round trip, sharing reads between them
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import os
+
+from cache import RequestMemo, use_request_memo, reset_request_memo
+
+# Most sub-requests accepted in one batch
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 20))
+
+# Sub-requests of all batches run on this many threads
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', 8))
+
+BATCH_METHODS = {'GET', 'POST', 'PUT', 'DELETE'}
+
+# Per-sub-request headers a client may set; Authorization comes from the batch request itself
+BATCH_SUBREQUEST_HEADERS = ['If-None-Match', 'If-Modified-Since']
+
+# Sub-response headers returned to the client
+BATCH_RESPONSE_HEADERS = ['ETag', 'Last-Modified', 'Cache-Control']
+
+_executor = ThreadPoolExecutor(max_workers=BATCH_MAX_WORKERS, thread_name_prefix='batch')
+
+
+def parse_batch(payload):
+    """Validated list of sub-requests from a batch body; raises ValueError"""
+    requests = payload.get('requests') if isinstance(payload, dict) else None
+    if not isinstance(requests, list) or not requests:
+        raise ValueError("Body must be {'requests': [{'method': ..., 'path': ...}, ...]}")
+    if len(requests) > BATCH_MAX_REQUESTS:
+        raise ValueError(f"At most {BATCH_MAX_REQUESTS} sub-requests per batch")
+
+    parsed = []
+    for index, sub in enumerate(requests):
+        if not isinstance(sub, dict) or not isinstance(sub.get('path'), str):
+            raise ValueError(f"Sub-request {index} needs a path")
+        method = str(sub.get('method', 'GET')).upper()
+        path = sub['path']
+        if method not in BATCH_METHODS:
+            raise ValueError(f"Sub-request {index}: unsupported method {method}")
+        target = urlsplit(path)
+        if target.scheme or target.netloc or not target.path.startswith('/api/') or target.path.startswith('/api/batch'):
+            raise ValueError(f"Sub-request {index}: path must be an /api/ endpoint other than /api/batch")
+        headers = sub.get('headers') or {}
+        parsed.append({
+            'id': sub.get('id', index),
+            'method': method,
+            'path': target.path,
+            'query': target.query,
+            'body': sub.get('body'),
+            'headers': {name: str(headers[name]) for name in BATCH_SUBREQUEST_HEADERS if name in headers}
+        })
+    return parsed
+
+
+def _dispatch(app, sub, shared_headers, memo):
+    """Run one sub-request through the app's full request handling"""
+    token = use_request_memo(memo)
+    try:
+        headers = {**shared_headers, **sub['headers'], 'Accept-Encoding': 'identity'}
+        with app.test_request_context(sub['path'], method=sub['method'], query_string=sub['query'],
+                                      json=sub['body'], headers=headers):
+            response = app.full_dispatch_request()
+            if response.is_streamed:
+                # Event streams and exports never finish inside a batch
+                response.close()
+                return {'status': 400, 'headers': {},
+                        'body': {'success': False, 'error': 'Streaming endpoints cannot be batched'}}
+            body = response.get_json(silent=True) if response.status_code != 304 else None
+            return {
+                'status': response.status_code,
+                'headers': {name: response.headers[name] for name in BATCH_RESPONSE_HEADERS if name in response.headers},
+                'body': body if body is not None or response.status_code == 304 else response.get_data(as_text=True)
+            }
+    except Exception as e:
+        # One failing sub-request must not fail the others
+        return {'status': 500, 'headers': {}, 'body': {'success': False, 'error': str(e)}}
+    finally:
+        reset_request_memo(token)
+
+
+def run_batch(app, subrequests, shared_headers):
+    """Responses to the sub-requests, in request order.
+
+    Sub-requests run concurrently and must not depend on each other. Identical GETs run once, and
+    reads the endpoints memoize (such as conditional-GET versions) are done once per batch.
+    """
+    memo = RequestMemo()
+    futures = {}
+    responses = []
+    for sub in subrequests:
+        key = None
+        if sub['method'] == 'GET':
+            key = (sub['path'], sub['query'], tuple(sorted(sub['headers'].items())))
+        future = futures.get(key) if key else None
+        if future is None:
+            future = _executor.submit(_dispatch, app, sub, shared_headers, memo)
+            if key:
+                futures[key] = future
+        responses.append((sub['id'], future))
+    return [{'id': sub_id, **future.result()} for sub_id, future in responses]
@@ -0,0 +1,138 @@
+"""
+Bed Availability for Hospital Management
+Live per-hospital counts of available beds by bed type, stored next to the hospital's location so
+the nearest hospitals with a free bed come from one geo query
+"""
+
+from pymongo import ASCENDING, GEOSPHERE
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime
+
+# Nearest-bed results returned by default and at most
+NEAREST_BEDS_DEFAULT_LIMIT = 5
+NEAREST_BEDS_MAX_LIMIT = 50
+
+
+class BedAvailability:
+    def __init__(self, db, changes):
+        """One document per hospital in hospital_db.bed_availability, kept current by HospitalBedsDB"""
+        self.collection = db.bed_availability
+        self.beds_collection = db.beds
+        self.hospitals_collection = db.hospitals
+        self.changes = changes
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """Create the geo index behind nearest() and the bed index the recount reads (idempotent)"""
+        try:
+            self.collection.create_index([('location', GEOSPHERE), ('is_active', ASCENDING)])
+            self.beds_collection.create_index([('hospital_id', ASCENDING), ('bed_type', ASCENDING), ('status', ASCENDING)])
+        except Exception as e:
+            print(f"Error creating bed availability indexes: {e}")
+
+    def refresh(self, hospital_id):
+        """Recount a hospital's beds by type; never raises into the write path.
+
+        The hospital's change-log sequence is read before counting and the document is only replaced
+        by a count at least as recent, so a slower concurrent refresh cannot overwrite a newer one.
+        """
+        if not hospital_id:
+            return
+        try:
+            seq = self.changes.current_seq(hospital_id)
+            counts = {}
+            for row in self.beds_collection.aggregate([
+                {'$match': {'hospital_id': hospital_id}},
+                {'$group': {
+                    '_id': '$bed_type',
+                    'total': {'$sum': 1},
+                    'available': {'$sum': {'$cond': [{'$eq': ['$status', 'available']}, 1, 0]}}
+                }}
+            ]):
+                # Bed types are matched case-insensitively ('ICU' and 'icu' are the same ward type)
+                bed_type = str(row['_id'] or 'standard').lower()
+                total, available = counts.get(bed_type, (0, 0))
+                counts[bed_type] = (total + row['total'], available + row['available'])
+
+            hospital = self.hospitals_collection.find_one(
+                {'hospital_id': hospital_id}, {'_id': 0, 'name': 1, 'city': 1, 'state': 1, 'is_active': 1, 'location': 1}
+            ) or {}
+            document = {
+                'name': hospital.get('name', ''),
+                'city': hospital.get('city', ''),
+                'state': hospital.get('state', ''),
+                'is_active': hospital.get('is_active', False),
+                'seq': seq,
+                'beds': [{'bed_type': bed_type, 'total': total, 'available': available}
+                         for bed_type, (total, available) in sorted(counts.items())],
+                'updated_at': datetime.utcnow()
+            }
+            # Hospitals that could not be geocoded are left out of the geo index until they are
+            if hospital.get('location'):
+                document['location'] = hospital['location']
+            try:
+                self.collection.replace_one({'_id': hospital_id, 'seq': {'$lte': seq}}, document, upsert=True)
+            except DuplicateKeyError:
+                pass  # A refresh that saw later writes already landed
+        except Exception as e:
+            print(f"Error refreshing bed availability for {hospital_id}: {e}")
+
+    def rebuild(self):
+        """Recount every hospital with beds, catching up on writes made outside HospitalBedsDB"""
+        try:
+            for hospital_id in self.beds_collection.distinct('hospital_id'):
+                self.refresh(hospital_id)
+        except Exception as e:
+            print(f"Error rebuilding bed availability: {e}")
+
+    def nearest(self, latitude, longitude, bed_type=None, limit=NEAREST_BEDS_DEFAULT_LIMIT, max_km=None):
+        """Active hospitals with an available bed of the type (any type if None), nearest first"""
+        if not 1 <= limit <= NEAREST_BEDS_MAX_LIMIT:
+            raise ValueError(f"limit must be between 1 and {NEAREST_BEDS_MAX_LIMIT}")
+        if max_km is not None and max_km <= 0:
+            raise ValueError("max_km must be positive")
+        bed_type = bed_type.lower() if bed_type else None
+
+        beds_filter = {'available': {'$gt': 0}}
+        if bed_type:
+            beds_filter['bed_type'] = bed_type
+        geo_near = {
+            'near': {'type': 'Point', 'coordinates': [longitude, latitude]},
+            'distanceField': 'distance_m',
+            'spherical': True,
+            'query': {'is_active': True, 'beds': {'$elemMatch': beds_filter}}
+        }
+        if max_km is not None:
+            geo_near['maxDistance'] = max_km * 1000
+
+        results = []
+        for hospital in self.collection.aggregate([{'$geoNear': geo_near}, {'$limit': limit}]):
+            beds = [entry for entry in hospital['beds'] if bed_type is None or entry['bed_type'] == bed_type]
+            results.append({
+                'hospital_id': hospital['_id'],
+                'name': hospital['name'],
+                'city': hospital['city'],
+                'state': hospital['state'],
+                'distance_km': round(hospital['distance_m'] / 1000, 2),
+                'latitude': hospital['location']['coordinates'][1],
+                'longitude': hospital['location']['coordinates'][0],
+                'available_beds': sum(entry['available'] for entry in beds),
+                'beds': beds,
+                'updated_at': hospital['updated_at']
+            })
+        return results
+
+    def receiving_hospitals(self, exclude_hospital_id, near=None, hospital_ids=None):
+        """Availability documents of the active hospitals other than one (or of those listed), nearest to
+        near (a GeoJSON point) first when it is given, with hospitals that have no location last"""
+        query = {'_id': {'$ne': exclude_hospital_id}, 'is_active': True}
+        if hospital_ids is not None:
+            query['_id'] = {'$in': [hospital_id for hospital_id in hospital_ids if hospital_id != exclude_hospital_id]}
+        hospitals = list(self.collection.find(query).sort('_id', ASCENDING))
+        if near is None:
+            return hospitals
+        located = list(self.collection.aggregate([
+            {'$geoNear': {'near': near, 'distanceField': 'distance_m', 'spherical': True, 'query': query}}
+        ]))
+        placed = {hospital['_id'] for hospital in located}
+        return located + [hospital for hospital in hospitals if hospital['_id'] not in placed]
@@ -0,0 +1,189 @@
+"""
+Bed Demand Forecasting for Hospital Management
+Projects occupied beds per hospital and department over the next hours from current census and
+hour-of-day arrival and departure rates learned from the bed occupancy history
+"""
+
+from datetime import datetime, timedelta
+from threading import Lock
+import os
+import time
+import numpy as np
+
+# Longest projection, in hours
+BED_FORECAST_HORIZON_HOURS = 72
+
+# Horizons reported (and checked for alerts), in hours
+BED_FORECAST_CHECKPOINTS = [24, 48, 72]
+
+# Days of history the hour-of-day rates are learned from
+BED_FORECAST_HISTORY_DAYS = int(os.getenv('BED_FORECAST_HISTORY_DAYS', 28))
+
+# How long a forecast batch is served before all hospitals are recomputed
+BED_FORECAST_TTL_SECONDS = float(os.getenv('BED_FORECAST_TTL_SECONDS', 900))
+
+# Projected occupancy rates that raise predictive alerts (percent)
+FORECAST_WARNING_RATE = 85
+FORECAST_CRITICAL_RATE = 95
+
+# One-sided 95% z-score for the upper bound of the projection
+UPPER_BOUND_Z = 1.65
+
+
+class BedDemandForecaster:
+    def __init__(self, beds_db):
+        """Forecast on top of an existing HospitalBedsDB and its occupancy history"""
+        self.beds_collection = beds_db.beds_collection
+        self.occupancy = beds_db.occupancy
+        self._lock = Lock()
+        self._batch = None
+        self._computed_at = 0.0
+
+    def _census(self):
+        """Beds and occupied beds per hospital and department, for every hospital in one aggregation"""
+        return list(self.beds_collection.aggregate([
+            {'$group': {
+                '_id': {'hospital_id': '$hospital_id', 'department': '$department'},
+                'beds': {'$sum': 1},
+                'occupied': {'$sum': {'$cond': [{'$eq': ['$status', 'occupied']}, 1, 0]}}
+            }}
+        ]))
+
+    def _rates(self, hospital_id, departments, start, end):
+        """Hour-of-day arrivals per hour and departure probability per occupied bed-hour, per department"""
+        flows, first = self.occupancy.hourly_flows(hospital_id, start, end)
+        arrival_rates = np.zeros((len(departments), 24))
+        departure_rates = np.zeros((len(departments), 24))
+        if first is None:
+            return arrival_rates, departure_rates
+
+        # Hours before recording began carry no arrivals or departures; leave them out of the averages
+        hour_starts = [start + timedelta(hours=i) for i in range(int((end - start) / timedelta(hours=1)))]
+        first_hour = first.replace(minute=0, second=0, microsecond=0)
+        observed = np.array([hour >= first_hour for hour in hour_starts], dtype=bool)
+        hour_of_day = np.array([hour.hour for hour in hour_starts], dtype=np.int64)[observed]
+        observed_days = np.maximum(np.bincount(hour_of_day, minlength=24), 1)
+
+        for row, department in enumerate(departments):
+            flow = flows.get(department)
+            if flow is None:
+                continue
+            arrival_rates[row] = np.bincount(hour_of_day, flow['arrivals'][observed], minlength=24) / observed_days
+            bed_hours = np.bincount(hour_of_day, flow['occupied'][observed], minlength=24)
+            departures = np.bincount(hour_of_day, flow['departures'][observed], minlength=24)
+            departure_rates[row] = np.divide(departures, bed_hours, out=np.zeros(24), where=bed_hours > 0)
+        return arrival_rates, np.minimum(departure_rates, 1)
+
+    def _compute(self):
+        """Forecast every hospital and department together; the projection is one array step per hour"""
+        now = datetime.utcnow()
+        end = now.replace(minute=0, second=0, microsecond=0)
+        start = end - timedelta(days=BED_FORECAST_HISTORY_DAYS)
+
+        census = self._census()
+        series = [(row['_id'].get('hospital_id'), row['_id'].get('department') or '') for row in census]
+        beds = np.array([row['beds'] for row in census], dtype=np.float64)
+        occupied = np.array([row['occupied'] for row in census], dtype=np.float64)
+
+        arrival_rates = np.zeros((len(series), 24))
+        departure_rates = np.zeros((len(series), 24))
+        rows_by_hospital = {}
+        for row, (hospital_id, _) in enumerate(series):
+            rows_by_hospital.setdefault(hospital_id, []).append(row)
+        for hospital_id, rows in rows_by_hospital.items():
+            arrivals, departures = self._rates(hospital_id, [series[row][1] for row in rows], start, end)
+            arrival_rates[rows] = arrivals
+            departure_rates[rows] = departures
+
+        # Census follows expected arrivals minus departures of current patients; its variance adds the
+        # Poisson arrivals and binomial departures of each hour
+        hours = BED_FORECAST_HORIZON_HOURS
+        expected = np.empty((len(series), hours))
+        variance = np.empty((len(series), hours))
+        mean, var = occupied.copy(), np.zeros(len(series))
+        for step in range(hours):
+            hour_of_day = (now.hour + step) % 24
+            arrivals, leaving = arrival_rates[:, hour_of_day], departure_rates[:, hour_of_day]
+            var = (1 - leaving) ** 2 * var + arrivals + leaving * (1 - leaving) * mean
+            mean = np.minimum(mean * (1 - leaving) + arrivals, beds)
+            expected[:, step], variance[:, step] = mean, var
+        upper = np.minimum(expected + UPPER_BOUND_Z * np.sqrt(variance), beds[:, None])
+        has_beds = beds[:, None] > 0
+        expected_rate = np.divide(expected * 100, beds[:, None], out=np.zeros_like(expected), where=has_beds)
+        upper_rate = np.divide(upper * 100, beds[:, None], out=np.zeros_like(upper), where=has_beds)
+
+        batch = {}
+        for row, (hospital_id, department) in enumerate(series):
+            batch.setdefault(hospital_id, {})[department] = {
+                'beds': int(beds[row]),
+                'occupied_now': int(occupied[row]),
+                'arrivals_per_day': round(float(arrival_rates[row].sum()), 2),
+                'projections': [
+                    {
+                        'hours_ahead': horizon,
+                        'expected_occupied': round(float(expected[row, horizon - 1]), 1),
+                        'upper_occupied': round(float(upper[row, horizon - 1]), 1),
+                        'expected_rate': round(float(expected_rate[row, horizon - 1]), 2),
+                        'upper_rate': round(float(upper_rate[row, horizon - 1]), 2)
+                    }
+                    for horizon in BED_FORECAST_CHECKPOINTS
+                ],
+                'hourly_expected': np.round(expected[row], 1).tolist()
+            }
+        return {'generated_at': now, 'history_days': BED_FORECAST_HISTORY_DAYS, 'hospitals': batch}
+
+    def _get_batch(self):
+        with self._lock:
+            if self._batch is None or time.monotonic() - self._computed_at >= BED_FORECAST_TTL_SECONDS:
+                self._batch = self._compute()
+                self._computed_at = time.monotonic()
+            return self._batch
+
+    def invalidate(self):
+        """Drop the cached batch; the next request recomputes every hospital"""
+        with self._lock:
+            self._batch = None
+
+    def forecast_hospital(self, hospital_id, hours=BED_FORECAST_HORIZON_HOURS):
+        """Per-department projections for one hospital, served from the cached all-hospital batch"""
+        if not 1 <= hours <= BED_FORECAST_HORIZON_HOURS:
+            raise ValueError(f"hours must be between 1 and {BED_FORECAST_HORIZON_HOURS}")
+        batch = self._get_batch()
+        departments = {}
+        for department, forecast in batch['hospitals'].get(hospital_id, {}).items():
+            departments[department] = {
+                **forecast,
+                'projections': [p for p in forecast['projections'] if p['hours_ahead'] <= hours],
+                'hourly_expected': forecast['hourly_expected'][:hours]
+            }
+        return {
+            'hospital_id': hospital_id,
+            'generated_at': batch['generated_at'].isoformat(),
+            'history_days': batch['history_days'],
+            'departments': departments
+        }
+
+    def capacity_alerts(self, hospital_id):
+        """Predictive alerts: departments projected to cross the warning or critical occupancy rate"""
+        alerts = []
+        batch = self._get_batch()
+        for department, forecast in sorted(batch['hospitals'].get(hospital_id, {}).items()):
+            for projection in forecast['projections']:
+                if projection['expected_rate'] >= FORECAST_CRITICAL_RATE:
+                    level, rate = 'critical', projection['expected_rate']
+                elif projection['upper_rate'] >= FORECAST_WARNING_RATE:
+                    level, rate = 'warning', projection['upper_rate']
+                else:
+                    continue
+                alerts.append({
+                    'type': level,
+                    'category': 'beds_forecast',
+                    'message': f"{department or 'Unassigned'} projected to reach {rate:.1f}% occupancy "
+                               f"within {projection['hours_ahead']} hours",
+                    'department': department,
+                    'hours_ahead': projection['hours_ahead'],
+                    'projected_rate': rate,
+                    'timestamp': datetime.utcnow()
+                })
+                break  # The earliest horizon is the one to act on
+        return alerts
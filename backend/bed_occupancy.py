@@ -0,0 +1,340 @@
+"""
+Bed Occupancy History for Hospital Management
+Every bed transition appended to per-hospital day buckets, and occupancy over time computed
+from them with vectorized step-function rollups
+"""
+
+from pymongo import ASCENDING
+from datetime import datetime, timedelta
+from threading import RLock
+import numpy as np
+
+# Transitions per bucket document; a busy day spills into further buckets
+OCCUPANCY_BUCKET_SIZE = 1000
+
+# Bed statuses that count towards occupancy
+OCCUPIED_STATUSES = {'occupied'}
+
+# Status recorded when a bed is deleted; it stops counting towards the bed total
+DELETED_STATUS = 'deleted'
+
+# Most buckets one history query may return
+OCCUPANCY_MAX_BUCKETS = 10000
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_ms(value):
+    return int((value - _EPOCH) / timedelta(milliseconds=1))
+
+
+class OccupancyHistory:
+    def __init__(self, db):
+        """Bed transitions in hospital_db.bed_transitions, one bucket document per hospital, day and up to
+        OCCUPANCY_BUCKET_SIZE transitions, with the fields stored as parallel arrays"""
+        self.collection = db.bed_transitions
+        self._lock = RLock()
+        # hospital_id -> columns of every transition before `through` (a midnight), which no longer change
+        self._history = {}
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """Create the bucket index (idempotent)"""
+        try:
+            self.collection.create_index([('hospital_id', ASCENDING), ('day', ASCENDING), ('count', ASCENDING)])
+        except Exception as e:
+            print(f"Error creating bed transition indexes: {e}")
+
+    def record(self, bed, deleted=False, at=None):
+        """Append a bed's state after a write; never raises into the write path"""
+        hospital_id = bed.get('hospital_id')
+        if not hospital_id:
+            return
+        at = at or datetime.utcnow()
+        try:
+            self.collection.update_one(
+                {
+                    'hospital_id': hospital_id,
+                    'day': at.replace(hour=0, minute=0, second=0, microsecond=0),
+                    'count': {'$lt': OCCUPANCY_BUCKET_SIZE}
+                },
+                {
+                    '$push': {
+                        'at': at,
+                        'bed_id': str(bed['_id']),
+                        'department': bed.get('department') or '',
+                        'status': DELETED_STATUS if deleted else bed.get('status') or ''
+                    },
+                    '$inc': {'count': 1}
+                },
+                upsert=True
+            )
+        except Exception as e:
+            print(f"Error recording bed transition: {e}")
+
+    def backfill(self, beds_collection):
+        """Seed the history with every bed's current state the first time it is used"""
+        try:
+            if self.collection.find_one({}, {'_id': 1}) is not None:
+                return
+            for bed in beds_collection.find({}, {'hospital_id': 1, 'department': 1, 'status': 1, 'updated_at': 1}):
+                self.record(bed, at=bed.get('updated_at'))
+        except Exception as e:
+            print(f"Error seeding bed transitions: {e}")
+
+    # ---- loading ----
+
+    def _read(self, hospital_id, day_from, day_to=None):
+        """Transitions in buckets from day_from up to (not including) day_to, as columns sorted by time"""
+        day_query = {'$gte': day_from}
+        if day_to is not None:
+            day_query['$lt'] = day_to
+        at, beds, departments, statuses = [], [], [], []
+        for bucket in self.collection.find({'hospital_id': hospital_id, 'day': day_query},
+                                           {'_id': 0, 'at': 1, 'bed_id': 1, 'department': 1, 'status': 1}):
+            at.extend(bucket['at'])
+            beds.extend(bucket['bed_id'])
+            departments.extend(bucket['department'])
+            statuses.extend(bucket['status'])
+
+        times = np.array(at, dtype='datetime64[ms]').astype(np.int64)
+        order = np.argsort(times, kind='stable')
+        return {
+            'at': times[order],
+            'bed': [beds[i] for i in order],
+            'department': [departments[i] for i in order],
+            'status': [statuses[i] for i in order]
+        }
+
+    def _encode(self, history, rows):
+        """Append rows to a hospital's columns, with beds and departments as integer codes"""
+        bed_codes, department_codes = history['bed_codes'], history['department_codes']
+        bed = np.fromiter((bed_codes.setdefault(b, len(bed_codes)) for b in rows['bed']), dtype=np.int64,
+                          count=len(rows['bed']))
+        department = np.fromiter((department_codes.setdefault(d, len(department_codes)) for d in rows['department']),
+                                 dtype=np.int64, count=len(rows['department']))
+        return {
+            'at': np.concatenate([history['at'], rows['at']]),
+            'bed': np.concatenate([history['bed'], bed]),
+            'department': np.concatenate([history['department'], department]),
+            'occupied': np.concatenate([history['occupied'], [s in OCCUPIED_STATUSES for s in rows['status']]]).astype(bool),
+            'present': np.concatenate([history['present'], [s != DELETED_STATUS for s in rows['status']]]).astype(bool)
+        }
+
+    def _columns(self, hospital_id):
+        """All of a hospital's transitions: past days from memory, today's read fresh"""
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        with self._lock:
+            history = self._history.get(hospital_id)
+            if history is None:
+                empty = np.array([], dtype=np.int64)
+                history = {'through': _EPOCH, 'bed_codes': {}, 'department_codes': {}, 'at': empty,
+                           'bed': empty, 'department': empty, 'occupied': empty.astype(bool),
+                           'present': empty.astype(bool)}
+            if history['through'] < today:
+                history = {**history, **self._encode(history, self._read(hospital_id, history['through'], today)),
+                           'through': today}
+                self._history[hospital_id] = history
+            columns = self._encode(history, self._read(hospital_id, today))
+        columns['departments'] = dict(history['department_codes'])
+        return columns
+
+    def invalidate(self, hospital_id=None):
+        """Forget a hospital's loaded history (or all of it); the next query reloads it"""
+        with self._lock:
+            if hospital_id is None:
+                self._history.clear()
+            else:
+                self._history.pop(hospital_id, None)
+
+    # ---- rollups ----
+
+    @staticmethod
+    def _previous(bed):
+        """Index of each transition's previous transition of the same bed, -1 for a bed's first"""
+        order = np.argsort(bed, kind='stable')  # by bed, then by time
+        previous_sorted = np.empty(len(order), dtype=np.int64)
+        if len(order):
+            previous_sorted[0] = -1
+            same_bed = bed[order[1:]] == bed[order[:-1]]
+            previous_sorted[1:] = np.where(same_bed, order[:-1], -1)
+        previous = np.empty(len(order), dtype=np.int64)
+        previous[order] = previous_sorted
+        return previous
+
+    @staticmethod
+    def _deltas(columns, previous, department_code):
+        """Change in occupied beds and in beds after each transition, for one department or all"""
+        has_previous = previous >= 0
+        prev = np.where(has_previous, previous, 0)
+        if department_code is None:
+            here = np.ones(len(previous), dtype=bool)
+            was_here = has_previous
+        else:
+            here = columns['department'] == department_code
+            was_here = has_previous & (columns['department'][prev] == department_code)
+        occupied = (here & columns['occupied']).astype(np.int64) - (was_here & columns['occupied'][prev])
+        beds = (here & columns['present']).astype(np.int64) - (was_here & columns['present'][prev])
+        return occupied, beds
+
+    @staticmethod
+    def _step(times, values, starts, end):
+        """Level at each bucket start, and time-weighted mean and peak over each bucket, of the step
+        function that is values[k] from times[k] until the next transition (0 before the first)"""
+        bounds = np.append(starts, end)
+        positions = np.searchsorted(times, bounds, side='right')  # transitions at or before each bound
+        at_bound = np.concatenate([[0], values])[positions]
+        if not len(times):
+            zeros = np.zeros(len(starts))
+            return at_bound[:-1], zeros, at_bound[:-1]
+
+        # Area under the step function up to each bound, from the area up to the last transition before it
+        area_before = np.concatenate([[0], np.cumsum(values[:-1] * np.diff(times))])
+        last = np.maximum(positions - 1, 0)
+        area = np.where(positions > 0, area_before[last] + values[last] * (bounds - times[last]), 0)
+        mean = np.diff(area) / np.diff(bounds)
+
+        # Peak: the level at the bucket start, or after any transition strictly inside the bucket
+        inside_from = positions[:-1]
+        inside_to = np.searchsorted(times, bounds[1:], side='left')
+        segments = np.minimum(np.column_stack([inside_from, inside_to]).ravel(), len(values))
+        segment_max = np.maximum.reduceat(np.append(values, 0), segments)[::2]
+        peak = np.where(inside_to > inside_from, np.maximum(segment_max, at_bound[:-1]), at_bound[:-1])
+        return at_bound[:-1], mean, peak
+
+    def occupancy_at(self, hospital_id, at):
+        """Occupied beds and beds per department at one instant"""
+        columns = self._columns(hospital_id)
+        known = np.searchsorted(columns['at'], _to_ms(at), side='right')
+        bed = columns['bed'][:known]
+        # Each bed's latest transition up to `at`
+        _, last_reversed = np.unique(bed[::-1], return_index=True)
+        latest = known - 1 - last_reversed
+
+        departments = {code: name for name, code in columns['departments'].items()}
+        size = len(departments)
+        department = columns['department'][latest]
+        present = columns['present'][latest]
+        occupied = np.bincount(department[present & columns['occupied'][latest]], minlength=size)
+        beds = np.bincount(department[present], minlength=size)
+
+        by_department = {
+            departments[code]: {
+                'occupied': int(occupied[code]),
+                'beds': int(beds[code]),
+                'occupancy_rate': round(float(occupied[code] / beds[code] * 100), 2) if beds[code] else 0
+            }
+            for code in range(size) if beds[code]
+        }
+        total_beds = int(beds.sum())
+        return {
+            'at': at.isoformat(),
+            'occupied': int(occupied.sum()),
+            'beds': total_beds,
+            'occupancy_rate': round(float(occupied.sum() / total_beds * 100), 2) if total_beds else 0,
+            'departments': by_department
+        }
+
+    def histogram(self, hospital_id, start, end, bucket_minutes=60, department=None):
+        """Occupancy for each bucket of [start, end): occupied beds and beds at the bucket start, plus the
+        time-weighted mean and the peak of occupied beds within it"""
+        if end <= start:
+            raise ValueError("end must be after start")
+        if bucket_minutes <= 0:
+            raise ValueError("bucket_minutes must be positive")
+        step = timedelta(minutes=bucket_minutes)
+        bucket_count = -(-(end - start) // step)
+        if bucket_count > OCCUPANCY_MAX_BUCKETS:
+            raise ValueError("Too many buckets; increase bucket_minutes or narrow the window")
+
+        columns = self._columns(hospital_id)
+        start_ms, end_ms = _to_ms(start), _to_ms(end)
+        starts = start_ms + np.arange(bucket_count, dtype=np.int64) * int(step / timedelta(milliseconds=1))
+
+        # A department that never had a bed matches no transition (code -1)
+        department_code = None if department is None else columns['departments'].get(department, -1)
+
+        # Transitions after the window cannot affect it
+        within = np.searchsorted(columns['at'], end_ms, side='left')
+        times = columns['at'][:within]
+        window_columns = {key: columns[key][:within] for key in ('bed', 'department', 'occupied', 'present')}
+        previous = self._previous(window_columns['bed'])
+        occupied_delta, beds_delta = self._deltas(window_columns, previous, department_code)
+
+        occupied_start, occupied_mean, occupied_peak = self._step(times, np.cumsum(occupied_delta), starts, end_ms)
+        beds_start, beds_mean, _ = self._step(times, np.cumsum(beds_delta), starts, end_ms)
+
+        return [
+            {
+                'start': (start + i * step).isoformat(),
+                'end': min(start + (i + 1) * step, end).isoformat(),
+                'occupied': int(occupied_start[i]),
+                'beds': int(beds_start[i]),
+                'mean_occupied': round(float(occupied_mean[i]), 2),
+                'peak_occupied': int(occupied_peak[i]),
+                'occupancy_rate': round(float(occupied_mean[i] / beds_mean[i] * 100), 2) if beds_mean[i] else 0
+            }
+            for i in range(bucket_count)
+        ]
+
+    def hourly_flows(self, hospital_id, start, end):
+        """Per department, for each hour of [start, end): beds that became occupied (arrivals), beds that
+        were vacated (departures) and the mean occupied beds. Also returns the time of the first
+        transition, since hours before it hold no data."""
+        columns = self._columns(hospital_id)
+        start_ms, end_ms = _to_ms(start), _to_ms(end)
+        hours = -(-(end_ms - start_ms) // 3600000)
+        within = np.searchsorted(columns['at'], end_ms, side='left')
+        times = columns['at'][:within]
+        window_columns = {key: columns[key][:within] for key in ('bed', 'department', 'occupied', 'present')}
+        previous = self._previous(window_columns['bed'])
+
+        prev = np.where(previous >= 0, previous, 0)
+        department = window_columns['department']
+        was_occupied = (previous >= 0) & window_columns['occupied'][prev] & window_columns['present'][prev]
+        occupied = window_columns['occupied'] & window_columns['present']
+        same_department = department == department[prev]
+        arrived = occupied & ~(was_occupied & same_department)
+        departed = was_occupied & ~(occupied & same_department)
+        in_window = times >= start_ms
+        hour = (times - start_ms) // 3600000
+
+        size = len(columns['departments'])
+        arrivals = np.zeros((size, hours), dtype=np.int64)
+        departures = np.zeros((size, hours), dtype=np.int64)
+        np.add.at(arrivals, (department[arrived & in_window], hour[arrived & in_window]), 1)
+        np.add.at(departures, (department[prev][departed & in_window], hour[departed & in_window]), 1)
+
+        starts = start_ms + np.arange(hours, dtype=np.int64) * 3600000
+        flows = {}
+        for name, code in columns['departments'].items():
+            occupied_delta, _ = self._deltas(window_columns, previous, code)
+            _, mean_occupied, _ = self._step(times, np.cumsum(occupied_delta), starts, end_ms)
+            flows[name] = {'arrivals': arrivals[code], 'departures': departures[code], 'occupied': mean_occupied}
+        first = _EPOCH + timedelta(milliseconds=int(columns['at'][0])) if len(columns['at']) else None
+        return flows, first
+
+    def turnover(self, hospital_id, start, end):
+        """Per department over [start, end): times a bed was vacated, and the time-weighted mean bed count"""
+        columns = self._columns(hospital_id)
+        start_ms, end_ms = _to_ms(start), _to_ms(end)
+        within = np.searchsorted(columns['at'], end_ms, side='left')
+        times = columns['at'][:within]
+        window_columns = {key: columns[key][:within] for key in ('bed', 'department', 'occupied', 'present')}
+        previous = self._previous(window_columns['bed'])
+
+        # Vacated: occupied before the transition, and not occupied in the same department after it
+        prev = np.where(previous >= 0, previous, 0)
+        was_occupied = (previous >= 0) & window_columns['occupied'][prev] & window_columns['present'][prev]
+        stayed = window_columns['occupied'] & (window_columns['department'] == window_columns['department'][prev])
+        vacated = was_occupied & ~stayed & (times >= start_ms)
+        size = len(columns['departments'])
+        vacated_by_department = np.bincount(window_columns['department'][prev][vacated], minlength=size)
+
+        result = {}
+        for name, code in columns['departments'].items():
+            _, beds_delta = self._deltas(window_columns, previous, code)
+            _, mean_beds, _ = self._step(times, np.cumsum(beds_delta), np.array([start_ms]), end_ms)
+            if mean_beds[0] or vacated_by_department[code]:
+                result[name] = {'mean_beds': float(mean_beds[0]), 'vacated': int(vacated_by_department[code])}
+        return result
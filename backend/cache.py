@@ -0,0 +1,394 @@
+"""
+In-process caches for Hospital Management
+Small thread-safe LRU used in front of hot lookups, read-through entity caches
+with an optional shared tier, and per-batch memos
+"""
+
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextvars import ContextVar
+from threading import Lock
+import copy
+import os
+import pickle
+import time
+
+# Entity lookups (hospital, bed, patient, staff, item) are served from memory this long.
+# Writes in this process invalidate at once; other workers' in-memory copies age out after the TTL.
+ENTITY_CACHE_TTL_SECONDS = float(os.getenv('ENTITY_CACHE_TTL_SECONDS', 30))
+ENTITY_CACHE_SIZE = int(os.getenv('ENTITY_CACHE_SIZE', 4096))
+
+# Optional shared tier: redis://host:port/db, or local:// for the in-process stand-in
+SHARED_CACHE_URL = os.getenv('SHARED_CACHE_URL', '')
+SHARED_CACHE_PREFIX = 'hms'
+
+
+class LRUCache:
+    def __init__(self, maxsize=1024, ttl=None):
+        """Least-recently-used cache holding at most maxsize entries, each for at most ttl seconds"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _live(self, key):
+        """Entry for key if present and unexpired (caller holds the lock)"""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        """Get a cached value and mark it as recently used"""
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        """Cache a value, evicting the least recently used entry when full"""
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """Drop a cached value if present"""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_value(self, value):
+        """Drop every entry holding value (a scan; for caches keyed by something the writer does not know)"""
+        with self._lock:
+            for key in [key for key, entry in self._data.items() if entry[0] == value]:
+                del self._data[key]
+
+    def clear(self):
+        """Drop every cached value"""
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._live(key) is not None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+
+class LocalSharedCache:
+    def __init__(self):
+        """In-process stand-in for a shared cache server; same interface as RedisSharedCache"""
+        self._data = {}  # key -> (payload bytes, expires_at)
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._data[key]
+                return None
+            return entry[0]
+
+    def set(self, key, payload, ttl):
+        with self._lock:
+            self._data[key] = (payload, time.monotonic() + ttl)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self, prefix):
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+
+class RedisSharedCache:
+    def __init__(self, url):
+        """Shared tier on a Redis server, so workers reuse each other's lookups and see each other's invalidations"""
+        import redis  # optional dependency, only needed when SHARED_CACHE_URL points at Redis
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, payload, ttl):
+        self.client.set(key, payload, ex=max(int(ttl), 1))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*keys)
+
+    def clear(self, prefix):
+        keys = list(self.client.scan_iter(match=f"{prefix}*", count=500))
+        if keys:
+            self.client.delete(*keys)
+
+
+def shared_cache_from_url(url):
+    """Shared tier for a SHARED_CACHE_URL, or None when no shared tier is configured"""
+    if not url:
+        return None
+    if url.startswith('local://'):
+        return LocalSharedCache()
+    if url.startswith(('redis://', 'rediss://')):
+        try:
+            return RedisSharedCache(url)
+        except ImportError:
+            print("Warning: SHARED_CACHE_URL is a Redis URL but the redis package is not installed; "
+                  "entity caches will be in-process only")
+            return None
+    raise ValueError(f"Unsupported SHARED_CACHE_URL: {url}")
+
+
+class EntityCache:
+    def __init__(self, name, alias_field=None, maxsize=ENTITY_CACHE_SIZE, ttl=ENTITY_CACHE_TTL_SECONDS, shared=None):
+        """Read-through cache of one entity type, keyed by the document _id.
+
+        Lookups by a business key (alias_field, e.g. staff_id) go through an alias map, so an
+        entity is cached once however it is looked up and one invalidation covers every key.
+        """
+        self.name = name
+        self.alias_field = alias_field
+        self.ttl = ttl
+        self.shared = shared
+        self.entries = LRUCache(maxsize, ttl)  # str(_id) -> document
+        self.aliases = LRUCache(maxsize)       # business key -> str(_id); neither ever changes, so no TTL
+        self._lock = Lock()
+        self._epoch = 0  # bumped by every invalidation; loads that straddle one are not cached
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.shared_errors = 0
+
+    def _shared_key(self, key, kind='doc'):
+        return f"{SHARED_CACHE_PREFIX}:{self.name}:{kind}:{key}"
+
+    def _shared_call(self, method, *args):
+        """Call the shared tier; an unreachable cache server degrades to a miss, never an error"""
+        try:
+            return getattr(self.shared, method)(*args)
+        except Exception as e:
+            with self._lock:
+                self.shared_errors += 1
+            print(f"Shared cache {method} failed for {self.name}: {e}")
+            return None
+
+    def _resolve(self, key):
+        """Document key for a lookup key"""
+        doc_key = self.aliases.get(key)
+        if doc_key is None and self.shared is not None:
+            payload = self._shared_call('get', self._shared_key(key, 'alias'))
+            if payload is not None:
+                doc_key = payload.decode() if isinstance(payload, bytes) else payload
+                self.aliases.set(key, doc_key)
+        return doc_key or key
+
+    def _store(self, doc):
+        doc_key = str(doc['_id'])
+        self.entries.set(doc_key, doc)
+        alias = doc.get(self.alias_field) if self.alias_field else None
+        if alias is not None and str(alias) != doc_key:
+            self.aliases.set(str(alias), doc_key)
+        return doc_key, alias
+
+    def get(self, key, loader):
+        """Cached copy of the entity for key, calling loader(key) on a miss; None results are not cached"""
+        key = str(key)
+        doc_key = self._resolve(key)
+
+        doc = self.entries.get(doc_key)
+        if doc is not None:
+            with self._lock:
+                self.hits += 1
+            return copy.deepcopy(doc)
+
+        with self._lock:
+            epoch = self._epoch
+
+        if self.shared is not None:
+            payload = self._shared_call('get', self._shared_key(doc_key))
+            if payload is not None:
+                doc = pickle.loads(payload)
+                with self._lock:
+                    self.shared_hits += 1
+                    if epoch == self._epoch:
+                        self._store(copy.deepcopy(doc))
+                return doc
+
+        with self._lock:
+            self.misses += 1
+        doc = loader(key)
+        if doc is None:
+            return None
+
+        with self._lock:
+            if epoch != self._epoch:
+                # Written while we were reading; the next lookup reloads
+                return doc
+            doc_key, alias = self._store(copy.deepcopy(doc))
+
+        if self.shared is not None:
+            self._shared_call('set', self._shared_key(doc_key), pickle.dumps(doc), self.ttl)
+            if alias is not None and str(alias) != doc_key:
+                self._shared_call('set', self._shared_key(alias, 'alias'), doc_key.encode(), self.ttl)
+        return doc
+
+    def invalidate(self, *keys):
+        """Drop the entities for these keys (any mix of _id and business keys) from every tier"""
+        doc_keys = {self._resolve(str(key)) for key in keys if key is not None}
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += 1
+            for doc_key in doc_keys:
+                self.entries.delete(doc_key)
+        if self.shared is not None and doc_keys:
+            self._shared_call('delete', *[self._shared_key(doc_key) for doc_key in doc_keys])
+
+    def clear(self):
+        """Drop every cached entity, e.g. after a bulk write or migration"""
+        with self._lock:
+            self._epoch += 1
+            self.invalidations += 1
+            self.entries.clear()
+        if self.shared is not None:
+            self._shared_call('clear', f"{SHARED_CACHE_PREFIX}:{self.name}:doc:")
+
+    def on_change(self, event):
+        """Change watcher callback: drop the changed entity, or everything when the collection was dropped"""
+        if event['_id'] is None:
+            self.clear()
+        else:
+            self.invalidate(event['_id'])
+
+    def stats(self):
+        """Hit/miss metrics for this entity type"""
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                'size': len(self.entries),
+                'maxsize': self.entries.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+                'invalidations': self.invalidations,
+                'evictions': self.entries.evictions,
+                'shared_errors': self.shared_errors,
+                'shared_tier': type(self.shared).__name__ if self.shared is not None else None
+            }
+
+
+_entity_caches = {}
+_entity_caches_lock = Lock()
+_shared_backend = None
+_shared_backend_loaded = False
+
+
+def _get_shared_backend():
+    global _shared_backend, _shared_backend_loaded
+    if not _shared_backend_loaded:
+        _shared_backend = shared_cache_from_url(SHARED_CACHE_URL)
+        _shared_backend_loaded = True
+    return _shared_backend
+
+
+def entity_cache(name, alias_field=None):
+    """Process-wide cache for one entity type, shared by every repository object that reads or writes it"""
+    with _entity_caches_lock:
+        if name not in _entity_caches:
+            _entity_caches[name] = EntityCache(name, alias_field, shared=_get_shared_backend())
+        return _entity_caches[name]
+
+
+def cache_metrics():
+    """Metrics for every entity cache"""
+    with _entity_caches_lock:
+        caches = dict(_entity_caches)
+    return {name: cache.stats() for name, cache in sorted(caches.items())}
+
+
+def invalidate_all_entity_caches():
+    """Drop every cached entity of every type"""
+    with _entity_caches_lock:
+        caches = list(_entity_caches.values())
+    for cache in caches:
+        cache.clear()
+
+
+class RequestMemo:
+    def __init__(self):
+        """Results computed once and shared by every sub-request of one batch"""
+        self._results = {}  # key -> Future
+        self._lock = Lock()
+        self.hits = 0
+
+    def get(self, key, compute):
+        """compute() for the first caller of a key; later (or concurrent) callers wait for that result"""
+        with self._lock:
+            future = self._results.get(key)
+            owner = future is None
+            if owner:
+                future = self._results[key] = Future()
+            else:
+                self.hits += 1
+        if owner:
+            try:
+                future.set_result(compute())
+            except Exception as e:
+                future.set_exception(e)
+        return future.result()
+
+
+# Set while a batch sub-request runs; None for ordinary requests
+_request_memo = ContextVar('request_memo', default=None)
+
+
+def use_request_memo(memo):
+    """Share memo with memoized() calls in this thread's context; returns a token for reset_request_memo"""
+    return _request_memo.set(memo)
+
+
+def reset_request_memo(token):
+    _request_memo.reset(token)
+
+
+def memoized(key, compute):
+    """compute() once per batch for key; outside a batch, just compute()"""
+    memo = _request_memo.get()
+    if memo is None:
+        return compute()
+    return memo.get(key, compute)
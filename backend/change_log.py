@@ -0,0 +1,155 @@
+"""
+Per-Hospital Change Log for Hospital Management
+Monotonic sequence of changed records per hospital, so clients sync deltas instead of reloading lists
+"""
+
+from pymongo import ASCENDING, ReturnDocument
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+import os
+
+# Entries older than this are dropped; clients further behind get reset=True and reload in full
+CHANGE_LOG_RETENTION_DAYS = int(os.getenv('CHANGE_LOG_RETENTION_DAYS', 7))
+
+# Most records returned per call; clients keep calling with the returned seq while has_more is true
+CHANGE_LOG_PAGE_SIZE = 500
+
+# A gap in the sequence younger than this is a write still in flight; older gaps are failed writes
+CHANGE_LOG_SETTLE_SECONDS = 5
+
+# Synced record type -> (collection, key field, field that puts the record in a hospital)
+CHANGE_LOG_SCOPES = {
+    'hospital': ('hospitals', 'hospital_id', 'hospital_id'),
+    'beds': ('beds', '_id', 'hospital_id'),
+    'patients': ('patients', 'patient_id', 'current_hospital'),
+    'staff': ('staff', 'staff_id', 'hospital_id'),
+    'inventory': ('medical_inventory', 'item_id', 'hospital_id')
+}
+
+# Never sent to clients
+HIDDEN_FIELDS = {'password_hash': 0}
+
+
+class ChangeLog:
+    def __init__(self, db):
+        """Change log in hospital_db; every repository that writes synced records holds one"""
+        self.db = db
+        self.log_collection = db.change_log
+        self.counters_collection = db.change_log_counters
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """Create the change log indexes (idempotent)"""
+        try:
+            self.log_collection.create_index([('hospital_id', ASCENDING), ('seq', ASCENDING)], unique=True)
+            self.log_collection.create_index('at', expireAfterSeconds=CHANGE_LOG_RETENTION_DAYS * 24 * 3600)
+        except Exception as e:
+            print(f"Error creating change log indexes: {e}")
+
+    def _next_seq(self, hospital_id, count):
+        """Reserve count sequence numbers for a hospital; returns the last one"""
+        counter = self.counters_collection.find_one_and_update(
+            {'_id': hospital_id},
+            {'$inc': {'seq': count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        return counter['seq']
+
+    def record(self, hospital_id, record_type, *keys):
+        """Note that these records of a hospital changed (created, updated, deleted or moved out).
+
+        Only the key is logged; changes_since reads the record as it is when the client asks, so a
+        record changed many times between two syncs is sent once. Never raises into the write path.
+        """
+        keys = [str(key) for key in keys if key is not None]
+        if not hospital_id or not keys:
+            return
+        try:
+            last = self._next_seq(hospital_id, len(keys))
+            now = datetime.utcnow()
+            self.log_collection.insert_many([{
+                'hospital_id': hospital_id,
+                'seq': seq,
+                'type': record_type,
+                'key': key,
+                'at': now
+            } for seq, key in zip(range(last - len(keys) + 1, last + 1), keys)], ordered=False)
+        except Exception as e:
+            print(f"Error recording {record_type} change: {e}")
+
+    def current_seq(self, hospital_id):
+        counter = self.counters_collection.find_one({'_id': hospital_id})
+        return counter['seq'] if counter else 0
+
+    def changes_since(self, hospital_id, since=0, limit=CHANGE_LOG_PAGE_SIZE):
+        """Records of a hospital changed after sequence number since.
+
+        Returns seq (pass it as since next time), has_more, reset (the log no longer reaches back to
+        since; reload in full), and per record type the current records and the keys of deleted ones.
+        A record that left the hospital (discharged, transferred) counts as deleted there.
+        """
+        current = self.current_seq(hospital_id)
+        oldest = self.log_collection.find_one({'hospital_id': hospital_id}, {'seq': 1}, sort=[('seq', ASCENDING)])
+        first_kept = oldest['seq'] if oldest else current + 1
+        result = {
+            'since': since,
+            'seq': current,
+            'has_more': False,
+            'reset': since > current or since < first_kept - 1,
+            'changes': {}
+        }
+        if result['reset'] or since == current:
+            return result
+
+        entries = list(self.log_collection.find(
+            {'hospital_id': hospital_id, 'seq': {'$gt': since}},
+            {'_id': 0, 'seq': 1, 'type': 1, 'key': 1, 'at': 1},
+            sort=[('seq', ASCENDING)],
+            limit=limit
+        ))
+        entries = self._settled(entries, since)
+        result['seq'] = entries[-1]['seq'] if entries else since
+        result['has_more'] = result['seq'] < current
+
+        keys_by_type = {}
+        for entry in entries:
+            keys_by_type.setdefault(entry['type'], set()).add(entry['key'])
+
+        for record_type, keys in keys_by_type.items():
+            if record_type not in CHANGE_LOG_SCOPES:
+                continue
+            collection_name, key_field, scope_field = CHANGE_LOG_SCOPES[record_type]
+            lookup = [self._key_value(key_field, key) for key in keys]
+            records = list(self.db[collection_name].find(
+                {key_field: {'$in': lookup}, scope_field: hospital_id}, HIDDEN_FIELDS
+            ))
+            found = {str(record[key_field]) for record in records}
+            for record in records:
+                record['_id'] = str(record['_id'])
+            result['changes'][record_type] = {
+                'updated': records,
+                'deleted': sorted(keys - found)
+            }
+        return result
+
+    @staticmethod
+    def _settled(entries, since):
+        """Entries up to the first gap left by a concurrent writer that has not inserted yet.
+
+        Sequence numbers are reserved before the entry is written, so a later number can be visible
+        before an earlier one; handing out the later one would make the client skip the earlier.
+        """
+        settled_before = datetime.utcnow() - timedelta(seconds=CHANGE_LOG_SETTLE_SECONDS)
+        expected = since + 1
+        for index, entry in enumerate(entries):
+            if entry['seq'] != expected and entry['at'] > settled_before:
+                return entries[:index]
+            expected = entry['seq'] + 1
+        return entries
+
+    @staticmethod
+    def _key_value(key_field, key):
+        if key_field == '_id':
+            return ObjectId(key) if ObjectId.is_valid(key) else key
+        return key
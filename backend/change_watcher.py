@@ -0,0 +1,230 @@
+"""
+Change Watcher for Hospital Management
+Follows writes to hospital_db from any process (other API workers, db_utils.py, the add_sample_*
+scripts) and passes them to the in-process caches registered for each collection
+"""
+
+from pymongo import ASCENDING
+from pymongo.errors import OperationFailure, PyMongoError
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+import os
+import time
+
+# auto: change stream when the server supports it (replica set / Atlas), updated_at polling otherwise
+CHANGE_WATCHER_MODE = os.getenv('CHANGE_WATCHER_MODE', 'auto')
+
+# Polling fallback: how often collections are checked, and how far back each check reaches past
+# the previous one so writes committed with a slightly older updated_at are not missed
+CHANGE_WATCHER_POLL_SECONDS = float(os.getenv('CHANGE_WATCHER_POLL_SECONDS', 2))
+CHANGE_WATCHER_POLL_OVERLAP_SECONDS = 1
+
+# Resume position is saved at most this often, so a restart replays only what it missed
+CHANGE_WATCHER_CHECKPOINT_SECONDS = 5
+
+# Processes sharing a name share a resume position (all workers of one API deployment)
+CHANGE_WATCHER_NAME = os.getenv('CHANGE_WATCHER_NAME', 'api')
+
+# Server errors meaning change streams are unavailable here (standalone server) or the saved position is gone
+CHANGE_STREAM_UNSUPPORTED_CODES = {40573, 40324}
+CHANGE_STREAM_HISTORY_LOST_CODES = {136, 280, 286}
+
+# Operations after which a collection's cached state as a whole is suspect
+DROP_OPERATIONS = {'drop', 'rename', 'dropDatabase', 'invalidate'}
+
+
+class ChangeWatcher:
+    def __init__(self, db, name=CHANGE_WATCHER_NAME, mode=CHANGE_WATCHER_MODE):
+        """Background watcher over hospital_db; caches subscribe per collection with register()"""
+        self.db = db
+        self.name = name
+        self.mode = mode
+        self.state_collection = db.change_watcher_state
+        self._callbacks = {}    # collection name -> [callback(event)]
+        self._poll_fields = {}  # collection name -> timestamp field the polling fallback follows
+        self._lock = Lock()
+        self._stop = Event()
+        self._thread = None
+        self._resume_token = None
+        self._watermark = None
+        self._polled = {}  # (collection, _id) -> timestamp already reported, for documents inside the overlap
+        self._last_checkpoint = 0.0
+        self.events = 0
+        self.errors = 0
+        self.last_event_at = None
+        self.history_lost = 0
+
+    def register(self, collection_name, *callbacks, poll_field='updated_at'):
+        """Call each callback with every change to the collection.
+
+        Events are dicts with collection, operation (insert, update, replace, delete, drop...),
+        _id (str), document (the document after the change, or None for deletes and drops) and
+        updated_fields (names of changed fields when known, else None). poll_field is the timestamp
+        the polling fallback follows (created_at for insert-only collections).
+        """
+        with self._lock:
+            self._callbacks.setdefault(collection_name, []).extend(callbacks)
+            self._poll_fields[collection_name] = poll_field
+
+    def start(self):
+        """Start following changes in a daemon thread (idempotent)"""
+        with self._lock:
+            if self._thread is not None or not self._callbacks:
+                return
+            self._load_state()
+            if self.mode != 'stream':
+                self._ensure_poll_indexes()
+            self._thread = Thread(target=self._run, name='change-watcher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._checkpoint(force=True)
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'collections': sorted(self._callbacks),
+            'events': self.events,
+            'errors': self.errors,
+            'history_lost': self.history_lost,
+            'last_event_at': self.last_event_at.isoformat() if self.last_event_at else None
+        }
+
+    def _load_state(self):
+        try:
+            state = self.state_collection.find_one({'_id': self.name}) or {}
+        except PyMongoError as e:
+            print(f"Error loading change watcher state: {e}")
+            state = {}
+        self._resume_token = state.get('resume_token')
+        # Nothing saved: start from now; caches filled from here on are current
+        self._watermark = state.get('watermark') or datetime.utcnow()
+
+    def _checkpoint(self, force=False):
+        """Save the resume position; every process of the deployment writes the same document"""
+        if not force and time.monotonic() - self._last_checkpoint < CHANGE_WATCHER_CHECKPOINT_SECONDS:
+            return
+        self._last_checkpoint = time.monotonic()
+        try:
+            self.state_collection.update_one(
+                {'_id': self.name},
+                {'$set': {'resume_token': self._resume_token, 'watermark': self._watermark,
+                          'mode': self.mode, 'updated_at': datetime.utcnow()}},
+                upsert=True
+            )
+        except PyMongoError as e:
+            print(f"Error saving change watcher state: {e}")
+
+    def _dispatch(self, event):
+        with self._lock:
+            callbacks = list(self._callbacks.get(event['collection'], ()))
+        for callback in callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                self.errors += 1
+                print(f"Error invalidating cache for {event['collection']} change: {e}")
+        self.events += 1
+        self.last_event_at = datetime.utcnow()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self.mode == 'poll':
+                    self._poll_once()
+                    self._checkpoint()
+                    self._stop.wait(CHANGE_WATCHER_POLL_SECONDS)
+                else:
+                    self._watch()
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAM_UNSUPPORTED_CODES and self.mode == 'auto':
+                    print("Change streams are not available on this server; polling updated_at instead")
+                    self.mode = 'poll'
+                elif e.code in CHANGE_STREAM_HISTORY_LOST_CODES:
+                    self._history_lost()
+                else:
+                    self._failed(e)
+            except PyMongoError as e:
+                self._failed(e)
+
+    def _failed(self, error):
+        self.errors += 1
+        print(f"Change watcher error, retrying: {error}")
+        self._stop.wait(CHANGE_WATCHER_POLL_SECONDS)
+
+    def _history_lost(self):
+        """The saved position is older than the server's history: anything may have changed"""
+        print("Change watcher resume position is no longer available; clearing caches")
+        self.history_lost += 1
+        self._resume_token = None
+        with self._lock:
+            collections = list(self._callbacks)
+        for collection_name in collections:
+            self._dispatch({'collection': collection_name, 'operation': 'invalidate', '_id': None,
+                            'document': None, 'updated_fields': None})
+        self._checkpoint(force=True)
+
+    def _watch(self):
+        """Follow the database change stream until stopped"""
+        with self._lock:
+            collections = list(self._callbacks)
+        pipeline = [{'$match': {'$or': [{'ns.coll': {'$in': collections}},
+                                        {'operationType': {'$in': list(DROP_OPERATIONS)}}]}}]
+        with self.db.watch(pipeline, full_document='updateLookup', resume_after=self._resume_token,
+                           max_await_time_ms=1000) as stream:
+            if self.mode == 'auto':
+                self.mode = 'stream'
+            while not self._stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is not None:
+                    self._dispatch(self._stream_event(change))
+                # Advances on idle batches too, so a quiet restart does not replay from long ago
+                self._resume_token = stream.resume_token
+                self._checkpoint()
+
+    @staticmethod
+    def _stream_event(change):
+        update = change.get('updateDescription')
+        document_key = change.get('documentKey') or {}
+        return {
+            'collection': (change.get('ns') or {}).get('coll'),
+            'operation': change['operationType'],
+            '_id': str(document_key['_id']) if '_id' in document_key else None,
+            'document': change.get('fullDocument'),
+            'updated_fields': (list(update.get('updatedFields', {})) + update.get('removedFields', [])) if update else None
+        }
+
+    def _poll_once(self):
+        """Report documents whose updated_at moved since the last poll (deletes are not visible this way)"""
+        since = self._watermark - timedelta(seconds=CHANGE_WATCHER_POLL_OVERLAP_SECONDS)
+        newest = self._watermark
+        polled = {}
+        with self._lock:
+            poll_fields = dict(self._poll_fields)
+        for collection_name, field in poll_fields.items():
+            for document in self.db[collection_name].find({field: {'$gt': since}}).sort(field, ASCENDING):
+                key = (collection_name, document['_id'])
+                polled[key] = document[field]
+                newest = max(newest, document[field])
+                if self._polled.get(key) == document[field]:
+                    continue  # Seen by the previous poll; only the overlap brought it back
+                self._dispatch({'collection': collection_name, 'operation': 'update', '_id': str(document['_id']),
+                                'document': document, 'updated_fields': None})
+        self._polled = polled
+        self._watermark = newest
+
+    def _ensure_poll_indexes(self):
+        """Timestamp indexes for the polling fallback (idempotent; caller holds the lock)"""
+        for collection_name, field in self._poll_fields.items():
+            try:
+                # A TTL index on the field (hospital_events) serves the poll as well
+                indexed = [tuple(info['key']) for info in self.db[collection_name].index_information().values()]
+                if ((field, 1),) in indexed:
+                    continue
+                self.db[collection_name].create_index(field)
+            except Exception as e:
+                print(f"Error creating {collection_name} {field} index: {e}")
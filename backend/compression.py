@@ -0,0 +1,107 @@
+"""
+Response Compression for Hospital Management
+Negotiated brotli/gzip for JSON, NDJSON and CSV responses, including streamed exports
+"""
+
+from flask import request
+import os
+import zlib
+
+try:
+    import brotli  # optional; gzip is always available
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this go out as-is; compressing them costs more than it saves
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', 1024))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', 5))
+
+# Streamed exports are flushed to the client after roughly this much input
+STREAM_FLUSH_BYTES = 64 * 1024
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain', 'text/html'}
+
+
+class _Compressor:
+    def __init__(self, encoding):
+        """Incremental brotli or gzip compressor with a common interface"""
+        self.encoding = encoding
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._zlib = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip container
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._brotli.process(data)
+        return self._zlib.compress(data)
+
+    def flush(self):
+        """Emit everything compressed so far without ending the stream"""
+        if self.encoding == 'br':
+            return self._brotli.flush()
+        return self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._brotli.finish()
+        return self._zlib.flush()
+
+
+def negotiate_encoding():
+    """Best encoding the client accepts, preferring brotli when it is installed"""
+    offered = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(offered)
+
+
+def _compress_stream(chunks, compressor):
+    pending = 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        data = compressor.compress(chunk)
+        pending += len(chunk)
+        if pending >= STREAM_FLUSH_BYTES:
+            data += compressor.flush()
+            pending = 0
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+def compress_response(response):
+    """after_request hook: compress the body when the client accepts it and it is worth it"""
+    if (request.method == 'HEAD' or response.status_code in (204, 304)
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    # The representation depends on Accept-Encoding even when this one goes out uncompressed
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        # Exports are large by nature; their length is unknown until the last row
+        response.response = _compress_stream(response.response, _Compressor(encoding))
+        response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESSION_MIN_BYTES:
+        return response
+    compressor = _Compressor(encoding)
+    compressed = compressor.compress(data) + compressor.finish()
+    if len(compressed) >= len(data):
+        return response
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    """Compress every response of a Flask app"""
+    app.after_request(compress_response)
@@ -0,0 +1,139 @@
+"""
+Staffing Coverage Timeline for Hospital Management
+Sorted shift boundaries per hospital, department and role for log-time coverage queries
+"""
+
+from datetime import timedelta
+from threading import RLock
+import os
+import time
+import numpy as np
+
+# How long a hospital's index is trusted before schedules written by other workers are re-read
+COVERAGE_INDEX_TTL_SECONDS = float(os.getenv('COVERAGE_INDEX_TTL_SECONDS', 60))
+
+
+class CoverageTimeline:
+    def __init__(self, schedules_collection, staff_collection, ttl=COVERAGE_INDEX_TTL_SECONDS):
+        """Coverage index over staff_schedules: hospital -> (department, role) -> (starts, ends)"""
+        self.schedules_collection = schedules_collection
+        self.staff_collection = staff_collection
+        self.ttl = ttl
+        self._lock = RLock()
+        self._index = {}      # hospital_id -> {(department, role): (sorted starts, sorted ends)}
+        self._loaded_at = {}  # hospital_id -> monotonic load time
+
+    @staticmethod
+    def _to_datetime64(values):
+        return np.array(values, dtype='datetime64[ms]')
+
+    def _load(self, hospital_id):
+        """Read a hospital's shifts once and sort their boundaries per department and role"""
+        schedules = list(self.schedules_collection.find(
+            {'hospital_id': hospital_id, 'shift_start': {'$ne': None}, 'shift_end': {'$ne': None}},
+            {'_id': 0, 'staff_id': 1, 'department': 1, 'role': 1, 'shift_start': 1, 'shift_end': 1}
+        ))
+
+        # Hand-written schedules carry no role; take it from the staff record
+        missing = {s['staff_id'] for s in schedules if not s.get('role')}
+        roles = {}
+        if missing:
+            roles = {
+                member['staff_id']: member.get('role', '')
+                for member in self.staff_collection.find(
+                    {'staff_id': {'$in': list(missing)}}, {'_id': 0, 'staff_id': 1, 'role': 1}
+                )
+            }
+
+        grouped = {}
+        for schedule in schedules:
+            key = (schedule.get('department', ''), schedule.get('role') or roles.get(schedule['staff_id'], ''))
+            starts, ends = grouped.setdefault(key, ([], []))
+            starts.append(schedule['shift_start'])
+            ends.append(schedule['shift_end'])
+
+        return {
+            key: (np.sort(self._to_datetime64(starts)), np.sort(self._to_datetime64(ends)))
+            for key, (starts, ends) in grouped.items()
+        }
+
+    def _get(self, hospital_id):
+        with self._lock:
+            loaded_at = self._loaded_at.get(hospital_id)
+            if loaded_at is not None and time.monotonic() - loaded_at < self.ttl:
+                return self._index[hospital_id]
+
+        index = self._load(hospital_id)
+        with self._lock:
+            self._index[hospital_id] = index
+            self._loaded_at[hospital_id] = time.monotonic()
+        return index
+
+    def invalidate(self, hospital_id=None):
+        """Forget a hospital's index (or all of them); the next query rebuilds it"""
+        with self._lock:
+            if hospital_id is None:
+                self._index.clear()
+                self._loaded_at.clear()
+            else:
+                self._index.pop(hospital_id, None)
+                self._loaded_at.pop(hospital_id, None)
+
+    def on_change(self, event):
+        """Change watcher callback for the schedules collection"""
+        document = event['document']
+        self.invalidate(document.get('hospital_id') if document else None)
+
+    def _series(self, hospital_id, department=None, role=None):
+        """Boundary arrays matching the department and role filters"""
+        return [
+            arrays for (dept, staff_role), arrays in self._get(hospital_id).items()
+            if (department is None or dept == department) and (role is None or staff_role == role)
+        ]
+
+    def count_at(self, hospital_id, at, department=None, role=None):
+        """Staff on shift at one instant (shift_start <= at < shift_end)"""
+        point = np.datetime64(at, 'ms')
+        return int(sum(
+            np.searchsorted(starts, point, side='right') - np.searchsorted(ends, point, side='right')
+            for starts, ends in self._series(hospital_id, department, role)
+        ))
+
+    def count_between(self, hospital_id, start, end, department=None, role=None):
+        """Shifts overlapping [start, end): shifts starting before end minus those already ended by start"""
+        window_start, window_end = np.datetime64(start, 'ms'), np.datetime64(end, 'ms')
+        return int(sum(
+            np.searchsorted(starts, window_end, side='left') - np.searchsorted(ends, window_start, side='right')
+            for starts, ends in self._series(hospital_id, department, role)
+        ))
+
+    def histogram(self, hospital_id, start, end, bucket_minutes=60, department=None, role=None):
+        """Coverage for each bucket of [start, end): staff on shift at the bucket start and shifts overlapping it"""
+        if end <= start:
+            raise ValueError("end must be after start")
+        if bucket_minutes <= 0:
+            raise ValueError("bucket_minutes must be positive")
+
+        step = timedelta(minutes=bucket_minutes)
+        bucket_count = -(-(end - start) // step)
+        bucket_starts = self._to_datetime64([start + i * step for i in range(bucket_count)])
+        bucket_ends = np.minimum(bucket_starts + np.timedelta64(bucket_minutes, 'm'), np.datetime64(end, 'ms'))
+
+        on_shift = np.zeros(bucket_count, dtype=np.int64)
+        overlapping = np.zeros(bucket_count, dtype=np.int64)
+        # Every bucket boundary is located with one vectorized binary search per series
+        for starts, ends in self._series(hospital_id, department, role):
+            ended_by_start = np.searchsorted(ends, bucket_starts, side='right')
+            on_shift += np.searchsorted(starts, bucket_starts, side='right') - ended_by_start
+            overlapping += np.searchsorted(starts, bucket_ends, side='left') - ended_by_start
+
+        return [
+            {
+                'start': (start + i * step).isoformat(),
+                'end': min(start + (i + 1) * step, end).isoformat(),
+                'on_shift': int(on_shift[i]),
+                'scheduled': int(overlapping[i])
+            }
+            for i in range(bucket_count)
+        ]
+
@@ -37,10 +37,16 @@ class DatabaseUtils:
             'patients': self.db.patients,
             'staff': self.db.staff,
             'medical_inventory': self.db.medical_inventory,
+            'inventory_lots': self.db.inventory_lots,
+            'inventory_transactions': self.db.inventory_transactions,
+            'inventory_transaction_rollups': self.db.inventory_transaction_rollups,
+            'inventory_reservations': self.db.inventory_reservations,
             'departments': self.db.departments,
             'staff_attendance': self.db.staff_attendance,
             'staff_schedules': self.db.staff_schedules,
-            'patient_assignments': self.db.patient_assignments
+            'patient_assignments': self.db.patient_assignments,
+            'timesheet_summaries': self.db.timesheet_summaries,
+            'timesheet_periods': self.db.timesheet_periods
         }
     
     def reset_database(self, confirm=True):
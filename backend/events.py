@@ -0,0 +1,188 @@
+"""
+Hospital Event Bus for Hospital Management
+Small deltas (bed status, admissions, discharges, stock alerts, staff status) pushed to
+Server-Sent Events subscribers from the write paths of every worker process
+"""
+
+from collections import deque
+from datetime import datetime
+from threading import Condition, Lock
+import json
+import os
+import time
+import uuid
+
+# Recent events kept per hospital so reconnecting screens can catch up from Last-Event-ID
+SSE_BUFFER_SIZE = int(os.getenv('SSE_BUFFER_SIZE', 1000))
+
+# A comment line is sent this often on idle streams, so proxies keep them open and dead clients are noticed
+SSE_HEARTBEAT_SECONDS = float(os.getenv('SSE_HEARTBEAT_SECONDS', 15))
+
+# Browser reconnect delay sent with every stream
+SSE_RETRY_MILLISECONDS = 3000
+
+# Events relayed between processes through hospital_db.hospital_events are removed after this long
+SHARED_EVENT_RETENTION_SECONDS = 3600
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+class HospitalEventBus:
+    def __init__(self, buffer_size=SSE_BUFFER_SIZE):
+        """Per-hospital ring buffers that every subscriber reads with its own cursor.
+
+        Publishing appends once and wakes that hospital's subscribers; nothing is copied per
+        subscriber and no thread is started per subscriber, so fan-out to hundreds of screens
+        costs one serialized event plus one wake-up each.
+        """
+        self.buffer_size = buffer_size
+        self._lock = Lock()
+        self._buffers = {}     # hospital_id -> deque of (event_id, event_type, payload json)
+        self._conditions = {}  # hospital_id -> Condition shared by that hospital's subscribers
+        self._evicted = {}     # hospital_id -> id of the newest event pushed out of its buffer
+        # Ids keep increasing across restarts, so a Last-Event-ID from before a restart is never mistaken for a new one
+        self._first_id = self._next_id = int(time.time() * 1000)
+        self.subscribers = 0
+        # Set by share(): events are relayed to the other processes through this collection
+        self.origin = uuid.uuid4().hex
+        self._shared = None
+        self._started_at = datetime.utcnow()
+
+    def share(self, collection):
+        """Relay every event published here through a collection all processes watch (idempotent).
+
+        Each process's change watcher hands the other processes' events to on_shared_event, so a
+        write made by any API worker or script reaches the screens connected to every worker.
+        """
+        if self._shared is not None and self._shared.full_name == collection.full_name:
+            return
+        try:
+            collection.create_index('created_at', expireAfterSeconds=SHARED_EVENT_RETENTION_SECONDS)
+        except Exception as e:
+            print(f"Error creating shared event index: {e}")
+        self._shared = collection
+
+    def on_shared_event(self, event):
+        """Change watcher callback for the shared collection: deliver events other processes published"""
+        document = event['document']
+        if not document or document.get('origin') == self.origin or 'payload' not in document:
+            return
+        # A restarted watcher may replay a few seconds of history; this process's screens never saw it
+        if document.get('created_at') and document['created_at'] < self._started_at:
+            return
+        self._append(document['hospital_id'], document['event_type'], document['payload'])
+
+    def _channel(self, hospital_id):
+        with self._lock:
+            if hospital_id not in self._buffers:
+                self._buffers[hospital_id] = deque(maxlen=self.buffer_size)
+                self._conditions[hospital_id] = Condition()
+            return self._buffers[hospital_id], self._conditions[hospital_id]
+
+    def publish(self, hospital_id, event_type, data):
+        """Push an event to every subscriber of a hospital; never raises into the write path"""
+        if not hospital_id:
+            return None
+        try:
+            payload = json.dumps(data, default=_json_default)
+            event_id = self._append(hospital_id, event_type, payload)
+        except Exception as e:
+            print(f"Error publishing {event_type} event: {e}")
+            return None
+
+        if self._shared is not None:
+            try:
+                self._shared.insert_one({
+                    'hospital_id': hospital_id,
+                    'event_type': event_type,
+                    'payload': payload,
+                    'origin': self.origin,
+                    'created_at': datetime.utcnow()
+                })
+            except Exception as e:
+                print(f"Error relaying {event_type} event: {e}")
+        return event_id
+
+    def _append(self, hospital_id, event_type, payload):
+        """Add a serialized event to the hospital's buffer and wake its subscribers"""
+        buffer, condition = self._channel(hospital_id)
+        with condition:
+            with self._lock:
+                event_id = self._next_id
+                self._next_id += 1
+            if len(buffer) == buffer.maxlen:
+                self._evicted[hospital_id] = buffer[0][0]
+            buffer.append((event_id, event_type, payload))
+            condition.notify_all()
+        return event_id
+
+    @staticmethod
+    def _after(buffer, cursor):
+        """Events newer than cursor, oldest first (caller holds the condition)"""
+        newer = []
+        for event in reversed(buffer):
+            if event[0] <= cursor:
+                break
+            newer.append(event)
+        newer.reverse()
+        return newer
+
+    @staticmethod
+    def _format(event_id, event_type, payload):
+        return f"id: {event_id}\nevent: {event_type}\ndata: {payload}\n\n"
+
+    def _covers(self, hospital_id, buffer, event_id):
+        """Whether every event after event_id is still in the buffer (caller holds the condition)"""
+        newest = buffer[-1][0] if buffer else self._next_id - 1
+        floor = max(self._evicted.get(hospital_id, 0), self._first_id - 1)
+        return floor <= event_id <= newest
+
+    def stream(self, hospital_id, last_event_id=None, heartbeat=SSE_HEARTBEAT_SECONDS):
+        """SSE text for one subscriber, resuming after last_event_id when the buffer still covers it.
+
+        The starting point is fixed here, not on first iteration, so events published while the
+        response is being set up are not skipped.
+        """
+        buffer, condition = self._channel(hospital_id)
+        with condition:
+            newest = buffer[-1][0] if buffer else self._next_id - 1
+            resumable = last_event_id is not None and self._covers(hospital_id, buffer, last_event_id)
+        cursor = last_event_id if resumable else newest
+        # Events were missed (restart, buffer overrun or another worker's ids); the client reloads in full
+        reset = last_event_id is not None and not resumable
+        return self._events(hospital_id, buffer, condition, cursor, reset, heartbeat)
+
+    def _events(self, hospital_id, buffer, condition, cursor, reset, heartbeat):
+        with self._lock:
+            self.subscribers += 1
+        try:
+            yield f"retry: {SSE_RETRY_MILLISECONDS}\n\n"
+            if reset:
+                yield self._format(cursor, 'reset', json.dumps({'reason': 'events_missed'}))
+
+            while True:
+                with condition:
+                    events = self._after(buffer, cursor)
+                    if not events:
+                        condition.wait(timeout=heartbeat)
+                        events = self._after(buffer, cursor)
+                    overrun = cursor < self._evicted.get(hospital_id, 0)
+                if not events:
+                    yield ": keepalive\n\n"
+                    continue
+                if overrun:
+                    # Too slow to keep up; what is left of the buffer is still sent after the reset
+                    yield self._format(cursor, 'reset', json.dumps({'reason': 'events_missed'}))
+                for event in events:
+                    yield self._format(*event)
+                cursor = events[-1][0]
+        finally:
+            with self._lock:
+                self.subscribers -= 1
+
+# One bus per process, fed by every repository's write paths and, once shared, by the other processes
+event_bus = HospitalEventBus()
@@ -0,0 +1,96 @@
+"""
+Offline Geocoding for Hospital Management
+Hospital coordinates from a bundled postal-code centroid table, with no calls to an outside service
+"""
+
+from threading import Lock
+import csv
+import os
+import re
+
+# CSV with columns country, postal_code, city, state, latitude, longitude; point this at a full ZIP /
+# forward sortation area table to cover every address (the bundled one only lists a few areas)
+GEOCODE_TABLE = os.getenv('GEOCODE_TABLE', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'postal_centroids.csv'))
+
+# Country names as written on hospital records -> table country codes
+COUNTRY_CODES = {'US': 'US', 'USA': 'US', 'UNITED STATES': 'US', 'CA': 'CA', 'CAN': 'CA', 'CANADA': 'CA'}
+
+# Hospital fields a location is derived from; changing any of them re-geocodes the hospital
+LOCATION_FIELDS = ['latitude', 'longitude', 'zip_code', 'city', 'state', 'country']
+
+
+def check_coordinates(latitude, longitude):
+    """Validated (latitude, longitude) as floats; raises ValueError when out of range"""
+    latitude, longitude = float(latitude), float(longitude)
+    if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+        raise ValueError("latitude must be between -90 and 90 and longitude between -180 and 180")
+    return latitude, longitude
+
+
+def geo_point(latitude, longitude):
+    """GeoJSON point; GeoJSON puts longitude first"""
+    return {'type': 'Point', 'coordinates': [longitude, latitude]}
+
+
+def _country(value):
+    country = str(value or 'USA').strip().upper()
+    return COUNTRY_CODES.get(country, country)
+
+
+def _postal_key(country, postal_code):
+    """US ZIPs match on the first five digits, Canadian postal codes on the forward sortation area"""
+    code = re.sub(r'\s+', '', str(postal_code or '')).upper()
+    if country == 'US':
+        return code[:5]
+    if country == 'CA':
+        return code[:3]
+    return code
+
+
+class Geocoder:
+    def __init__(self, table=GEOCODE_TABLE):
+        """Geocoder over a centroid table, loaded on first use"""
+        self.table = table
+        self._lock = Lock()
+        self._postal = None
+        self._cities = None
+
+    def _load(self):
+        with self._lock:
+            if self._postal is not None:
+                return
+            postal, cities = {}, {}
+            try:
+                with open(self.table, newline='', encoding='utf-8') as table:
+                    for row in csv.DictReader(table):
+                        country = _country(row['country'])
+                        point = (float(row['latitude']), float(row['longitude']))
+                        postal[(country, _postal_key(country, row['postal_code']))] = point
+                        city_key = (country, row['state'].strip().upper(), row['city'].strip().lower())
+                        cities.setdefault(city_key, []).append(point)
+            except (OSError, KeyError, ValueError) as e:
+                print(f"Error loading geocode table {self.table}: {e}")
+            # A city spanning several postal areas is placed at their mean
+            self._cities = {key: (round(sum(p[0] for p in points) / len(points), 4),
+                                  round(sum(p[1] for p in points) / len(points), 4))
+                            for key, points in cities.items()}
+            self._postal = postal
+
+    def locate(self, record):
+        """(GeoJSON point, source) for a hospital record, or (None, None) if it cannot be placed.
+
+        Explicit latitude/longitude win, then the postal code, then the city within its state.
+        """
+        if record.get('latitude') is not None and record.get('longitude') is not None:
+            return geo_point(*check_coordinates(record['latitude'], record['longitude'])), 'provided'
+
+        self._load()
+        country = _country(record.get('country'))
+        point = self._postal.get((country, _postal_key(country, record.get('zip_code'))))
+        if point:
+            return geo_point(*point), 'postal_code'
+        point = self._cities.get((country, str(record.get('state') or '').strip().upper(),
+                                  str(record.get('city') or '').strip().lower()))
+        if point:
+            return geo_point(*point), 'city'
+        return None, None
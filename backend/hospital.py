@@ -1,4 +1,4 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, GEOSPHERE
 from datetime import datetime, timedelta
 from bson.objectid import ObjectId
 import os
@@ -9,6 +9,19 @@ from hospital_beds import HospitalBedsDB
 from patient_data import PatientDataDB
 from med_inv import MedicalInventoryDB
 from staff_inv import StaffManagementDB
+from inventory_forecast import InventoryForecaster
+from patient_flow import PatientFlowAnalytics
+from bed_forecast import BedDemandForecaster
+from hospital_summaries import HospitalSummaries
+from transfers import TransferCoordinator
+from timesheets import TimesheetEngine
+from shift_scheduler import ShiftScheduler, MIN_DEPARTMENT_COVERAGE
+from assignment_balancer import AssignmentBalancer
+from cache import entity_cache
+from change_log import ChangeLog, CHANGE_LOG_PAGE_SIZE
+from change_watcher import ChangeWatcher
+from events import event_bus
+from geocoding import Geocoder, LOCATION_FIELDS
 
 # Load environment variables
 load_dotenv()
@@ -20,12 +33,62 @@ class HospitalManagementSystem:
         self.db = self.client.hospital_db
         self.hospitals_collection = self.db.hospitals
         self.departments_collection = self.db.departments
+        self.cache = entity_cache('hospital', 'hospital_id')
+        self.changes = ChangeLog(self.db)
+        self.geocoder = Geocoder()
         
         # Initialize other database modules
         self.beds_db = HospitalBedsDB()
         self.patients_db = PatientDataDB()
         self.inventory_db = MedicalInventoryDB()
         self.staff_db = StaffManagementDB()
+        self.inventory_forecaster = InventoryForecaster(self.inventory_db)
+        self.patient_flow = PatientFlowAnalytics(self.patients_db, self.beds_db)
+        self.bed_forecaster = BedDemandForecaster(self.beds_db)
+        self.summaries = HospitalSummaries(self)
+        self.transfers = TransferCoordinator(self.beds_db, self.patients_db, self.hospitals_collection)
+        self.timesheets = TimesheetEngine(self.staff_db)
+        self.shift_scheduler = ShiftScheduler(self.staff_db, self.hospitals_collection)
+        self.assignment_balancer = AssignmentBalancer(self.staff_db)
+
+        # Keeps this process's caches in step with writes made elsewhere; started by the API server
+        self.change_watcher = ChangeWatcher(self.db)
+        self.change_watcher.register('hospitals', self.cache.on_change)
+        self.change_watcher.register('beds', self.beds_db.cache.on_change)
+        self.change_watcher.register('patients', self.patients_db.cache.on_change)
+        self.change_watcher.register('staff', self.staff_db.cache.on_change, self.staff_db.roster.on_change)
+        self.change_watcher.register('staff_schedules', self.staff_db.coverage.on_change, poll_field='created_at')
+        self.change_watcher.register('medical_inventory', self.inventory_db.on_item_change)
+        # Events published by the other workers and scripts, for this worker's live screens
+        self.change_watcher.register('hospital_events', event_bus.on_shared_event, poll_field='created_at')
+
+        self.ensure_indexes()
+        self.locate_hospitals()
+
+    def ensure_indexes(self):
+        """Create the hospital indexes (idempotent)"""
+        try:
+            self.hospitals_collection.create_index([('location', GEOSPHERE)])
+        except Exception as e:
+            print(f"Error creating hospital indexes: {e}")
+
+    def _location_fields(self, hospital):
+        """location (GeoJSON point) and location_source for a hospital record; empty if it cannot be placed"""
+        location, source = self.geocoder.locate(hospital)
+        return {'location': location, 'location_source': source} if location else {}
+
+    def locate_hospitals(self):
+        """Geocode hospitals saved without a location (created before geocoding, or not placeable then)"""
+        try:
+            for hospital in self.hospitals_collection.find({'location': {'$exists': False}},
+                                                           {'_id': 0, 'hospital_id': 1, **{f: 1 for f in LOCATION_FIELDS}}):
+                fields = self._location_fields(hospital)
+                if fields:
+                    self.hospitals_collection.update_one({'hospital_id': hospital['hospital_id']}, {'$set': fields})
+                    self.cache.invalidate(hospital['hospital_id'])
+                    self.beds_db.availability.refresh(hospital['hospital_id'])
+        except Exception as e:
+            print(f"Error geocoding hospitals: {e}")
     
     def create_hospital(self, hospital_data):
         """Create a new hospital"""
@@ -61,6 +124,7 @@ class HospitalManagementSystem:
             'insurance_accepted': hospital_data.get('insurance_accepted', []),
             'languages_spoken': hospital_data.get('languages_spoken', ['English']),
             'is_active': hospital_data.get('is_active', True),
+            **self._location_fields(hospital_data),  # From latitude/longitude if given, else geocoded offline
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow()
         }
@@ -72,6 +136,7 @@ class HospitalManagementSystem:
         
         result = self.hospitals_collection.insert_one(hospital)
         hospital_mongo_id = str(result.inserted_id)
+        self.changes.record(hospital['hospital_id'], 'hospital', hospital['hospital_id'])
         
         # Create beds for the hospital if specified
         if hospital_data.get('total_beds', 0) > 0:
@@ -136,8 +201,13 @@ class HospitalManagementSystem:
             hospital['_id'] = str(hospital['_id'])
         return hospitals
     
-    def get_hospital_by_id(self, hospital_id):
-        """Get hospital by ID"""
+    def get_hospital_by_id(self, hospital_id, cached=True):
+        """Get hospital by ID (read through the hospital cache unless cached=False)"""
+        if cached:
+            return self.cache.get(hospital_id, self._load_hospital)
+        return self._load_hospital(hospital_id)
+
+    def _load_hospital(self, hospital_id):
         hospital = self.hospitals_collection.find_one({'hospital_id': hospital_id})
         if hospital:
             hospital['_id'] = str(hospital['_id'])
@@ -160,14 +230,15 @@ class HospitalManagementSystem:
         
         # Get departments with staff count
         departments_info = []
+        staff_counts = self.staff_db.roster.get_department_counts(hospital_id)
         for dept in hospital.get('departments', []):
-            dept_staff = self.staff_db.get_staff_by_department_and_hospital(dept, hospital_id)
             dept_beds = self.beds_db.get_beds_by_department_and_hospital(dept, hospital_id)
+            dept_staff = staff_counts.get(dept, {})
             departments_info.append({
                 'name': dept,
-                'staff_count': len(dept_staff),
+                'staff_count': dept_staff.get('total', 0),
                 'beds_count': len(dept_beds),
-                'on_duty_staff': len([s for s in dept_staff if s['current_status'] == 'on_duty'])
+                'on_duty_staff': dept_staff.get('on_duty', 0)
             })
         
         # Get alerts and notifications
@@ -245,20 +316,22 @@ class HospitalManagementSystem:
                 'timestamp': datetime.utcnow()
             })
         
+        # Predictive capacity alerts: departments projected to fill up over the next 72 hours
+        alerts.extend(self.bed_forecaster.capacity_alerts(hospital_id))
+        
         # Staff shortage alerts for this hospital
         hospital_data = self.hospitals_collection.find_one({'hospital_id': hospital_id})
         departments = hospital_data.get('departments', []) if hospital_data else []
         for dept in departments:
-            dept_staff = self.staff_db.get_staff_by_department_and_hospital(dept, hospital_id)
-            on_duty_staff = [s for s in dept_staff if s['current_status'] == 'on_duty']
+            on_duty_count = self.staff_db.roster.count(hospital_id, dept, 'on_duty')
             
-            if len(on_duty_staff) < 2:  # Minimum staff threshold
+            if on_duty_count < MIN_DEPARTMENT_COVERAGE:
                 alerts.append({
                     'type': 'warning',
                     'category': 'staffing',
-                    'message': f"{dept} department has only {len(on_duty_staff)} staff on duty",
+                    'message': f"{dept} department has only {on_duty_count} staff on duty",
                     'department': dept,
-                    'staff_count': len(on_duty_staff),
+                    'staff_count': on_duty_count,
                     'timestamp': datetime.utcnow()
                 })
         
@@ -279,6 +352,16 @@ class HospitalManagementSystem:
     def get_hospital_inventory(self, hospital_id):
         """Get all inventory for a hospital"""
         return self.inventory_db.get_inventory_by_hospital(hospital_id)
+
+    def get_hospital_changes(self, hospital_id, since=0, limit=CHANGE_LOG_PAGE_SIZE):
+        """Hospital, bed, patient, staff and inventory records changed since a change log sequence number"""
+        changes = self.changes.changes_since(hospital_id, since, limit)
+        # Same shape as the list endpoints, so clients merge deltas into what they already hold
+        formatters = {'staff': self.staff_db.format_staff, 'inventory': self.inventory_db.format_item}
+        for record_type, delta in changes['changes'].items():
+            if record_type in formatters:
+                delta['updated'] = [formatters[record_type](record) for record in delta['updated']]
+        return changes
     
     def create_hospital_beds(self, hospital_id, hospital_data):
         """Create beds for a hospital based on capacity"""
@@ -447,8 +530,10 @@ class HospitalManagementSystem:
         # Add department to hospital's department list
         self.hospitals_collection.update_one(
             {'hospital_id': hospital_id},
-            {'$addToSet': {'departments': department_data['name']}}
+            {'$addToSet': {'departments': department_data['name']},
+             '$set': {'updated_at': datetime.utcnow()}}
         )
+        self.cache.invalidate(hospital_id)
         
         return str(result.inserted_id)
     
@@ -461,12 +546,35 @@ class HospitalManagementSystem:
     
     def update_hospital(self, hospital_id, update_data):
         """Update hospital information"""
+        update = {'$set': update_data}
+        if any(field in update_data for field in LOCATION_FIELDS):
+            current = self.hospitals_collection.find_one(
+                {'hospital_id': hospital_id}, {'location_source': 1, **{f: 1 for f in LOCATION_FIELDS}}
+            ) or {}
+            coordinates = {f: update_data.pop(f, None) for f in ('latitude', 'longitude')}
+            if list(coordinates.values()).count(None) == 1:
+                raise ValueError("latitude and longitude must be given together")
+            address_changed = any(field in update_data and update_data[field] != current.get(field)
+                                  for field in LOCATION_FIELDS)
+            if None not in coordinates.values():
+                update_data.update(self._location_fields(coordinates))
+            elif address_changed and current.get('location_source') != 'provided':
+                # Re-geocode from the address as it will be after this update; explicit coordinates
+                # are only replaced by new coordinates, never by an address lookup
+                location_fields = self._location_fields({**current, **update_data})
+                update_data.update(location_fields)
+                if not location_fields:
+                    update['$unset'] = {'location': '', 'location_source': ''}
         update_data['updated_at'] = datetime.utcnow()
         
         result = self.hospitals_collection.update_one(
             {'hospital_id': hospital_id},
-            {'$set': update_data}
+            update
         )
+        self.cache.invalidate(hospital_id)
+        if result.matched_count:
+            self.changes.record(hospital_id, 'hospital', hospital_id)
+            self.beds_db.availability.refresh(hospital_id)
         return result.modified_count > 0
     
     def deactivate_hospital(self, hospital_id, reason=''):
@@ -480,6 +588,10 @@ class HospitalManagementSystem:
                 'updated_at': datetime.utcnow()
             }}
         )
+        self.cache.invalidate(hospital_id)
+        if result.matched_count:
+            self.changes.record(hospital_id, 'hospital', hospital_id)
+            self.beds_db.availability.refresh(hospital_id)
         return result.modified_count > 0
     
     def search_hospitals(self, search_term):
@@ -499,36 +611,9 @@ class HospitalManagementSystem:
             hospital['_id'] = str(hospital['_id'])
         return hospitals
     
-    def get_system_overview(self):
-        """Get overview of all hospitals in the system"""
-        total_hospitals = self.hospitals_collection.count_documents({'is_active': True})
-        
-        # Aggregate statistics across all hospitals
-        bed_stats = self.beds_db.get_bed_statistics()
-        patient_stats = self.patients_db.get_patient_statistics()
-        inventory_stats = self.inventory_db.get_inventory_statistics()
-        staff_stats = self.staff_db.get_staff_statistics()
-        
-        # Get hospitals by state/city
-        hospitals_by_location = list(self.hospitals_collection.aggregate([
-            {'$match': {'is_active': True}},
-            {'$group': {
-                '_id': {'state': '$state', 'city': '$city'},
-                'count': {'$sum': 1}
-            }}
-        ]))
-        
-        return {
-            'total_hospitals': total_hospitals,
-            'system_statistics': {
-                'total_beds': bed_stats['total_beds'],
-                'total_patients': patient_stats['total_patients'],
-                'total_staff': staff_stats['total_staff'],
-                'total_inventory_value': inventory_stats['total_value']
-            },
-            'hospitals_by_location': hospitals_by_location,
-            'last_updated': datetime.utcnow()
-        }
+    def get_system_overview(self, region='state'):
+        """Get overview of all hospitals in the system, from the per-hospital summaries"""
+        return self.summaries.overview(region)
     
     def assign_patient_to_bed(self, hospital_id, patient_id, bed_id):
         """Assign a patient to a bed in a specific hospital"""
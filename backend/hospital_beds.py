@@ -1,12 +1,22 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, ReturnDocument
 from datetime import datetime
+import re
 from bson.objectid import ObjectId
 import os
 from dotenv import load_dotenv
 
+from cache import entity_cache
+from events import event_bus
+from change_log import ChangeLog
+from bed_occupancy import OccupancyHistory
+from bed_availability import BedAvailability
+
 # Load environment variables
 load_dotenv()
 
+# Bed fields sent to live screens when a bed changes
+BED_EVENT_FIELDS = ['hospital_id', 'bed_number', 'room_number', 'department', 'bed_type', 'status', 'patient_id', 'updated_at']
+
 class HospitalBedsDB:
     def __init__(self):
         """Initialize MongoDB connection"""
@@ -14,6 +24,24 @@ class HospitalBedsDB:
         self.db = self.client.hospital_db
         self.beds_collection = self.db.beds
         self.patients_collection = self.db.patients
+        self.cache = entity_cache('bed')
+        # Shared with PatientDataDB, which writes the same collection
+        self.patient_cache = entity_cache('patient', 'patient_id')
+        self.changes = ChangeLog(self.db)
+        event_bus.share(self.db.hospital_events)
+        self.occupancy = OccupancyHistory(self.db)
+        self.availability = BedAvailability(self.db, self.changes)
+        self.ensure_indexes()
+        self.occupancy.backfill(self.beds_collection)
+        self.availability.rebuild()
+
+    def ensure_indexes(self):
+        """Create the indexes used by the bed queries (idempotent)"""
+        try:
+            # Per-hospital listings, and the count/latest-update read behind conditional GETs
+            self.beds_collection.create_index([('hospital_id', ASCENDING), ('updated_at', ASCENDING)])
+        except Exception as e:
+            print(f"Error creating bed indexes: {e}")
         
     def create_bed(self, bed_data):
         """Create a new hospital bed"""
@@ -23,7 +51,7 @@ class HospitalBedsDB:
             'room_number': bed_data['room_number'],
             'department': bed_data['department'],
             'bed_type': bed_data.get('bed_type', 'standard'),  # standard, ICU, emergency
-            'status': bed_data.get('status', 'available'),  # available, occupied, maintenance
+            'status': bed_data.get('status', 'available'),  # available, occupied, maintenance, reserved (held for a transfer)
             'patient_id': bed_data.get('patient_id', None),
             'floor': bed_data.get('floor', 1),
             'wing': bed_data.get('wing', 'Main'),
@@ -32,6 +60,7 @@ class HospitalBedsDB:
         }
         
         result = self.beds_collection.insert_one(bed)
+        self._bed_changed({field: bed[field] for field in ['_id', *BED_EVENT_FIELDS]}, 'bed_created')
         return str(result.inserted_id)
     
     def get_all_beds(self):
@@ -43,7 +72,10 @@ class HospitalBedsDB:
         return beds
     
     def get_bed_by_id(self, bed_id):
-        """Get a specific bed by ID"""
+        """Get a specific bed by ID (read through the bed cache)"""
+        return self.cache.get(bed_id, self._load_bed)
+
+    def _load_bed(self, bed_id):
         bed = self.beds_collection.find_one({'_id': ObjectId(bed_id)})
         if bed:
             bed['_id'] = str(bed['_id'])
@@ -113,11 +145,24 @@ class HospitalBedsDB:
         elif status == 'available':
             update_data['patient_id'] = None
             
-        result = self.beds_collection.update_one(
+        bed = self.beds_collection.find_one_and_update(
             {'_id': ObjectId(bed_id)},
-            {'$set': update_data}
+            {'$set': update_data},
+            projection=BED_EVENT_FIELDS,
+            return_document=ReturnDocument.AFTER
         )
-        return result.modified_count > 0
+        self.cache.invalidate(bed_id)
+        if bed is None:
+            return False
+        self._bed_changed(bed, 'bed_status')
+        return True
+    
+    def _bed_changed(self, bed, event_type):
+        """Log a bed change for delta sync, occupancy history and availability, and push it to the hospital's live screens"""
+        self.changes.record(bed.get('hospital_id'), 'beds', bed['_id'])
+        self.occupancy.record(bed, deleted=event_type == 'bed_deleted')
+        self.availability.refresh(bed.get('hospital_id'))
+        event_bus.publish(bed.get('hospital_id'), event_type, {**bed, '_id': str(bed['_id'])})
     
     def update_bed_details(self, bed_id, update_data):
         """Update bed details (room, type, department, etc.)"""
@@ -126,16 +171,102 @@ class HospitalBedsDB:
         filtered_data = {k: v for k, v in update_data.items() if k in allowed_fields}
         filtered_data['updated_at'] = datetime.utcnow()
         
-        result = self.beds_collection.update_one(
+        bed = self.beds_collection.find_one_and_update(
             {'_id': ObjectId(bed_id)},
-            {'$set': filtered_data}
+            {'$set': filtered_data},
+            projection=BED_EVENT_FIELDS,
+            return_document=ReturnDocument.AFTER
         )
-        return result.modified_count > 0
+        self.cache.invalidate(bed_id)
+        if bed is None:
+            return False
+        self._bed_changed(bed, 'bed_updated')
+        return True
     
     def delete_bed(self, bed_id):
         """Delete a bed"""
-        result = self.beds_collection.delete_one({'_id': ObjectId(bed_id)})
-        return result.deleted_count > 0
+        bed = self.beds_collection.find_one_and_delete({'_id': ObjectId(bed_id)}, projection=BED_EVENT_FIELDS)
+        self.cache.invalidate(bed_id)
+        if bed is None:
+            return False
+        self._bed_changed(bed, 'bed_deleted')
+        return True
+
+    def _transition_bed(self, query, update, session=None, announce=True):
+        """Apply an update to the one bed matching a guard query; the bed after the update, or None.
+
+        Inside a transaction pass announce=False and call announce_bed_change once it has committed.
+        """
+        bed = self.beds_collection.find_one_and_update(
+            query,
+            update,
+            projection=BED_EVENT_FIELDS,
+            sort=[('bed_number', ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if bed is None:
+            return None
+        if announce:
+            self.announce_bed_change(bed)
+        return bed
+
+    def announce_bed_change(self, bed):
+        """Drop a changed bed from the cache and log and publish its new status"""
+        self.cache.invalidate(str(bed['_id']))
+        self._bed_changed(bed, 'bed_status')
+
+    def hold_bed(self, hospital_id, transfer_id, patient_id, expires_at, bed_id=None, bed_type=None, department=None):
+        """Reserve a free bed for an incoming transfer: the given bed, or the first free one of the type
+        and department. A bed whose hold has run out counts as free, so it is not lost until the expiry
+        sweep releases it. Picking and holding are one atomic update; returns the held bed, or None if none is free"""
+        now = datetime.utcnow()
+        query = {'hospital_id': hospital_id, '$or': [
+            {'status': 'available'},
+            {'status': 'reserved', 'hold.expires_at': {'$lt': now}}
+        ]}
+        if bed_id:
+            query['_id'] = ObjectId(bed_id)
+        if bed_type:
+            query['bed_type'] = {'$regex': f'^{re.escape(bed_type)}$', '$options': 'i'}
+        if department:
+            query['department'] = department
+        return self._transition_bed(query, {'$set': {
+            'status': 'reserved',
+            'patient_id': patient_id,
+            'hold': {'transfer_id': transfer_id, 'expires_at': expires_at},
+            'updated_at': now
+        }})
+
+    def release_bed_hold(self, bed_id, transfer_id):
+        """Make a bed held for this transfer available again"""
+        return self._transition_bed(
+            {'_id': ObjectId(bed_id), 'status': 'reserved', 'hold.transfer_id': transfer_id},
+            {'$set': {'status': 'available', 'patient_id': None, 'updated_at': datetime.utcnow()}, '$unset': {'hold': ''}}
+        ) is not None
+
+    def occupy_held_bed(self, bed_id, transfer_id, session=None, announce=True):
+        """Turn a bed held for this transfer into the patient's occupied bed; None if the hold is gone"""
+        return self._transition_bed(
+            {'_id': ObjectId(bed_id), 'status': 'reserved', 'hold.transfer_id': transfer_id},
+            {'$set': {'status': 'occupied', 'updated_at': datetime.utcnow()}, '$unset': {'hold': ''}},
+            session=session,
+            announce=announce
+        )
+
+    def vacate_patient_beds(self, hospital_id, patient_id, bed_id=None, session=None, announce=True):
+        """Free the beds a patient occupies in a hospital (only bed_id, if given); returns the freed beds"""
+        query = {'hospital_id': hospital_id, 'patient_id': patient_id, 'status': 'occupied'}
+        if bed_id:
+            query['_id'] = ObjectId(bed_id)
+        freed = []
+        for bed in list(self.beds_collection.find(query, {'_id': 1}, session=session)):
+            bed = self._transition_bed({**query, '_id': bed['_id']},
+                                       {'$set': {'status': 'available', 'patient_id': None, 'updated_at': datetime.utcnow()}},
+                                       session=session, announce=announce)
+            if bed:
+                freed.append(bed)
+        return freed
     
     def get_bed_statistics(self):
         """Get statistics about bed usage"""
@@ -181,8 +312,13 @@ class HospitalBedsDB:
         result = self.patients_collection.insert_one(patient)
         return str(result.inserted_id)
     
-    def get_patient_by_id(self, patient_id):
+    def get_patient_by_id(self, patient_id, cached=True):
         """Get patient information"""
+        if cached:
+            return self.patient_cache.get(patient_id, self._load_patient)
+        return self._load_patient(patient_id)
+
+    def _load_patient(self, patient_id):
         patient = self.patients_collection.find_one({'_id': ObjectId(patient_id)})
         if patient:
             patient['_id'] = str(patient['_id'])
@@ -199,13 +335,14 @@ class HospitalBedsDB:
                 {'_id': ObjectId(patient_id)},
                 {'$set': {'assigned_bed_id': bed_id, 'updated_at': datetime.utcnow()}}
             )
+            self.patient_cache.invalidate(patient_id)
             return True
         return False
     
     def discharge_patient(self, patient_id):
         """Discharge a patient and free up the bed"""
-        # Find patient's bed
-        patient = self.get_patient_by_id(patient_id)
+        # Find patient's bed; the write below depends on it, so read the database
+        patient = self.get_patient_by_id(patient_id, cached=False)
         if patient and 'assigned_bed_id' in patient:
             bed_id = patient['assigned_bed_id']
             
@@ -223,6 +360,7 @@ class HospitalBedsDB:
                     }
                 }
             )
+            self.patient_cache.invalidate(patient_id)
             return True
         return False
 
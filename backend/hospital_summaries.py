@@ -0,0 +1,170 @@
+"""
+Hospital Summaries for Hospital Management
+One precomputed summary document per hospital, refreshed in the background when that hospital's
+change log moves, so the system overview reads one small document per hospital and counts nothing
+"""
+
+from pymongo import ASCENDING, ReplaceOne
+from datetime import datetime, timedelta
+from threading import Event, Thread
+import os
+
+# How often the background refresher looks for hospitals whose change log has moved
+HOSPITAL_SUMMARY_REFRESH_SECONDS = float(os.getenv('HOSPITAL_SUMMARY_REFRESH_SECONDS', 10))
+
+# Summaries older than this are recomputed even without logged changes (writes that bypass the
+# repositories, such as raw db_utils.py updates, are not in the change log)
+HOSPITAL_SUMMARY_MAX_AGE_SECONDS = int(os.getenv('HOSPITAL_SUMMARY_MAX_AGE_SECONDS', 300))
+
+# Counters summed across hospitals into the system and region totals
+SUMMARY_COUNTERS = ['total_beds', 'occupied_beds', 'available_beds', 'maintenance_beds', 'total_patients',
+                    'admitted_patients', 'total_staff', 'on_duty_staff', 'total_inventory_items',
+                    'total_inventory_value']
+
+REGION_LEVELS = {'state': ['state'], 'city': ['state', 'city']}
+
+
+class HospitalSummaries:
+    def __init__(self, hms):
+        """Summaries over the collections of an existing HospitalManagementSystem"""
+        self.hospitals_collection = hms.hospitals_collection
+        self.beds_collection = hms.beds_db.beds_collection
+        self.patients_collection = hms.patients_db.patients_collection
+        self.staff_collection = hms.staff_db.staff_collection
+        self.inventory_collection = hms.inventory_db.inventory_collection
+        self.changes = hms.changes
+        self.summaries_collection = hms.db.hospital_summaries
+        self._stop = Event()
+        self._thread = None
+
+    def start(self, interval=HOSPITAL_SUMMARY_REFRESH_SECONDS):
+        """Keep the summaries current from a daemon thread (idempotent)"""
+        if self._thread is not None:
+            return
+        self._thread = Thread(target=self._run, args=(interval,), name='hospital-summaries', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"Error refreshing hospital summaries: {e}")
+            self._stop.wait(interval)
+
+    def _summarize(self, hospital, seq):
+        """Recount one hospital; every query is bounded by that hospital's own records"""
+        hospital_id = hospital['hospital_id']
+        beds = {row['_id']: row['count'] for row in self.beds_collection.aggregate([
+            {'$match': {'hospital_id': hospital_id}},
+            {'$group': {'_id': '$status', 'count': {'$sum': 1}}}
+        ])}
+        staff = (list(self.staff_collection.aggregate([
+            {'$match': {'hospital_id': hospital_id, 'is_active': True}},
+            {'$group': {
+                '_id': None,
+                'total': {'$sum': 1},
+                'on_duty': {'$sum': {'$cond': [{'$eq': ['$current_status', 'on_duty']}, 1, 0]}}
+            }}
+        ])) or [{}])[0]
+        inventory = (list(self.inventory_collection.aggregate([
+            {'$match': {'hospital_id': hospital_id, 'status': 'active'}},
+            {'$group': {'_id': None, 'items': {'$sum': 1}, 'value': {'$sum': '$total_value'}}}
+        ])) or [{}])[0]
+
+        return {
+            '_id': hospital_id,
+            'name': hospital.get('name') or '',
+            'state': hospital.get('state') or '',
+            'city': hospital.get('city') or '',
+            'seq': seq,
+            'total_beds': sum(beds.values()),
+            'occupied_beds': beds.get('occupied', 0),
+            'available_beds': beds.get('available', 0),
+            'maintenance_beds': beds.get('maintenance', 0),
+            'total_patients': self.patients_collection.count_documents({'current_hospital': hospital_id}),
+            'admitted_patients': self.patients_collection.count_documents({'current_hospital': hospital_id, 'status': 'admitted'}),
+            'total_staff': staff.get('total', 0),
+            'on_duty_staff': staff.get('on_duty', 0),
+            'total_inventory_items': inventory.get('items', 0),
+            'total_inventory_value': round(inventory.get('value', 0) or 0, 2),
+            'computed_at': datetime.utcnow()
+        }
+
+    def refresh(self):
+        """Bring every active hospital's summary up to date, recomputing only those changed since their last one"""
+        hospitals = list(self.hospitals_collection.find(
+            {'is_active': True}, {'_id': 0, 'hospital_id': 1, 'name': 1, 'state': 1, 'city': 1}
+        ))
+        hospital_ids = [hospital['hospital_id'] for hospital in hospitals]
+        seqs = {counter['_id']: counter['seq']
+                for counter in self.changes.counters_collection.find({'_id': {'$in': hospital_ids}})}
+        summaries = {summary['_id']: summary
+                     for summary in self.summaries_collection.find({'_id': {'$in': hospital_ids}})}
+
+        stale_before = datetime.utcnow() - timedelta(seconds=HOSPITAL_SUMMARY_MAX_AGE_SECONDS)
+        refreshed = []
+        for hospital in hospitals:
+            hospital_id = hospital['hospital_id']
+            summary = summaries.get(hospital_id)
+            # The sequence is read before counting, so a write landing during the count leaves it stale, not lost
+            seq = seqs.get(hospital_id, 0)
+            if summary is None or summary['seq'] != seq or summary['computed_at'] < stale_before:
+                summaries[hospital_id] = self._summarize(hospital, seq)
+                refreshed.append(summaries[hospital_id])
+
+        if refreshed:
+            self.summaries_collection.bulk_write(
+                [ReplaceOne({'_id': summary['_id']}, summary, upsert=True) for summary in refreshed], ordered=False
+            )
+        # Deactivated and deleted hospitals drop out of the overview
+        self.summaries_collection.delete_many({'_id': {'$nin': hospital_ids}})
+        return [summaries[hospital_id] for hospital_id in hospital_ids]
+
+    def get_summaries(self):
+        """Stored summaries, as of the last refresh; only computed here if none have been stored yet"""
+        summaries = list(self.summaries_collection.find().sort('_id', ASCENDING))
+        if not summaries:
+            summaries = self.refresh()
+        return summaries
+
+    @staticmethod
+    def _totals(summaries):
+        totals = {counter: sum(summary[counter] for summary in summaries) for counter in SUMMARY_COUNTERS}
+        totals['total_inventory_value'] = round(totals['total_inventory_value'], 2)
+        totals['occupancy_rate'] = round(totals['occupied_beds'] / totals['total_beds'] * 100, 2) if totals['total_beds'] else 0
+        return totals
+
+    def overview(self, region='state'):
+        """System totals and a per-region breakdown (state, or state and city) from the summaries"""
+        keys = REGION_LEVELS.get(region)
+        if keys is None:
+            raise ValueError(f"Invalid region. Must be one of: {list(REGION_LEVELS)}")
+        summaries = self.get_summaries()
+
+        grouped = {}
+        for summary in summaries:
+            grouped.setdefault(tuple(summary[key] for key in keys), []).append(summary)
+        regions = [
+            {**dict(zip(keys, location)), 'hospitals': len(members), **self._totals(members)}
+            for location, members in sorted(grouped.items())
+        ]
+        locations = {}
+        for summary in summaries:
+            location = (summary['state'], summary['city'])
+            locations[location] = locations.get(location, 0) + 1
+        return {
+            'total_hospitals': len(summaries),
+            'system_statistics': self._totals(summaries),
+            'regions': regions,
+            'hospitals_by_location': [
+                {'_id': {'state': state, 'city': city}, 'count': count}
+                for (state, city), count in sorted(locations.items())
+            ],
+            'last_updated': min((summary['computed_at'] for summary in summaries), default=datetime.utcnow())
+        }
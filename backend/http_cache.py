@@ -0,0 +1,91 @@
+"""
+HTTP Conditional Requests for Hospital Management
+ETag / Last-Modified validators from per-hospital collection versions, checked before the full query runs
+"""
+
+from flask import request, make_response
+from datetime import timezone
+from functools import wraps
+import hashlib
+import os
+
+from cache import memoized
+
+# Seconds a client may reuse a list without asking again; 0 = revalidate every time (a 304 is cheap)
+LIST_CACHE_MAX_AGE_SECONDS = int(os.getenv('LIST_CACHE_MAX_AGE_SECONDS', 0))
+
+# Part of every ETag; bump when a response shape changes so clients drop bodies built by older code
+RESPONSE_FORMAT_VERSION = '1'
+
+
+def collection_version(collection, match):
+    """(document count, latest updated_at) of the documents in scope, in one indexed aggregation.
+
+    The count catches deletes and documents leaving the scope, which do not move the latest updated_at.
+    """
+    result = list(collection.aggregate([
+        {'$match': match},
+        {'$group': {'_id': None, 'count': {'$sum': 1}, 'last_modified': {'$max': '$updated_at'}}}
+    ]))
+    if not result:
+        return 0, None
+    return result[0]['count'], result[0]['last_modified']
+
+
+def make_etag(*parts):
+    """Opaque validator for the given version parts"""
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode()).hexdigest()[:24]
+
+
+def _is_fresh(etag, last_modified):
+    """Whether the client's copy is current; If-None-Match wins over If-Modified-Since"""
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified is not None:
+        # Date-only clients miss a hard delete that leaves the latest updated_at unchanged; ETags do not.
+        # HTTP dates have whole-second precision
+        return last_modified.replace(microsecond=0, tzinfo=timezone.utc) <= request.if_modified_since
+    return False
+
+
+def _set_validators(response, etag, last_modified):
+    # Weak: compression changes the bytes but not the meaning
+    response.set_etag(etag, weak=True)
+    if last_modified is not None:
+        response.last_modified = last_modified.replace(tzinfo=timezone.utc)
+    if LIST_CACHE_MAX_AGE_SECONDS > 0:
+        response.headers['Cache-Control'] = f"private, max-age={LIST_CACHE_MAX_AGE_SECONDS}, must-revalidate"
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+
+
+def conditional_get(scope):
+    """Answer a GET with 304 when nothing in its scope changed since the client's copy.
+
+    scope(**view_kwargs) returns (collection, match) naming the documents the response is built from.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                collection, match = scope(**kwargs)
+                # Sub-requests of one batch that share a scope share one version read
+                count, last_modified = memoized(('version', collection.full_name, repr(sorted(match.items()))),
+                                                lambda: collection_version(collection, match))
+            except Exception as e:
+                print(f"Error computing validators for {request.path}: {e}")
+                return view(*args, **kwargs)
+
+            # Read before the body, so a write racing the query leaves the ETag older than the body, never newer
+            etag = make_etag(RESPONSE_FORMAT_VERSION, request.path, request.query_string.decode(),
+                             count, last_modified.isoformat() if last_modified else '')
+            if _is_fresh(etag, last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            _set_validators(response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
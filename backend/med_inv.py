@@ -1,12 +1,54 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument, UpdateOne
 from datetime import datetime, timedelta
 from bson.objectid import ObjectId
 import os
+import uuid
 from dotenv import load_dotenv
 
+from cache import LRUCache, entity_cache
+from events import event_bus
+from change_log import ChangeLog
+
 # Load environment variables
 load_dotenv()
 
+# Raw inventory_transactions rows are kept this long; hourly/daily rollups are kept forever
+TRANSACTION_RETENTION_DAYS = int(os.getenv('INVENTORY_TRANSACTION_RETENTION_DAYS', 90))
+
+# History windows up to this many days are served from hourly buckets, longer ones from daily
+HOURLY_ROLLUP_MAX_DAYS = 7
+
+# Reservations that are neither fulfilled nor released by then give their stock back
+DEFAULT_RESERVATION_TTL_MINUTES = 24 * 60
+
+# Field names used by the old InventoryManager (`inventory` collection) -> canonical names
+LEGACY_INVENTORY_FIELDS = {
+    'min_stock': 'minimum_threshold',
+    'max_stock': 'maximum_capacity',
+    'unit': 'unit_of_measurement',
+    'location': 'storage_location'
+}
+
+# Stock-level labels the old collection stored in `status`; canonical `status` is the item lifecycle
+LEGACY_STOCK_STATUSES = ['in_stock', 'low_stock', 'out_of_stock']
+
+# Enough of an item to invalidate and log it after a write
+ITEM_KEY_FIELDS = {'_id': 0, 'item_id': 1, 'hospital_id': 1}
+
+# Fields whose change can make a cached (hospital_id, barcode) -> item_id mapping wrong
+BARCODE_MAPPING_FIELDS = {'barcode', 'status', 'hospital_id'}
+
+# Stock that can still be promised: current_stock minus what is held by active reservations
+AVAILABLE_STOCK_EXPR = {'$subtract': ['$current_stock', {'$ifNull': ['$reserved_quantity', 0]}]}
+
+def stock_level(current_stock, reserved_quantity, minimum_threshold):
+    """in_stock / low_stock / out_of_stock label for a stock position"""
+    if current_stock <= 0:
+        return 'out_of_stock'
+    if current_stock - reserved_quantity <= minimum_threshold:
+        return 'low_stock'
+    return 'in_stock'
+
 class MedicalInventoryDB:
     def __init__(self):
         """Initialize MongoDB connection"""
@@ -15,20 +57,107 @@ class MedicalInventoryDB:
         self.inventory_collection = self.db.medical_inventory
         self.transactions_collection = self.db.inventory_transactions
         self.suppliers_collection = self.db.suppliers
-        
-    def create_inventory_item(self, item_data):
-        """Create a new inventory item"""
-        item = {
+        self.lots_collection = self.db.inventory_lots
+        self.rollups_collection = self.db.inventory_transaction_rollups
+        self.reservations_collection = self.db.inventory_reservations
+        # (hospital_id, barcode) -> item_id for ward scanners
+        self.barcode_cache = LRUCache(maxsize=int(os.getenv('BARCODE_CACHE_SIZE', 10000)))
+        self.cache = entity_cache('item', 'item_id')
+        self.changes = ChangeLog(self.db)
+        event_bus.share(self.db.hospital_events)
+        self.ensure_indexes()
+        self.migrate_legacy_inventory()
+
+    def ensure_indexes(self):
+        """Create the indexes used by the inventory queries (idempotent)"""
+        try:
+            self.inventory_collection.create_index([('hospital_id', ASCENDING), ('item_id', ASCENDING)])
+            self.inventory_collection.create_index([('hospital_id', ASCENDING), ('expiry_date', ASCENDING)])
+            # Conditional GETs read count and latest updated_at per hospital from this index
+            self.inventory_collection.create_index([('hospital_id', ASCENDING), ('updated_at', ASCENDING)])
+            self.inventory_collection.create_index(
+                [('hospital_id', ASCENDING), ('barcode', ASCENDING)],
+                partialFilterExpression={'barcode': {'$gt': ''}},
+                name='item_by_barcode'
+            )
+            self.lots_collection.create_index([('item_id', ASCENDING), ('batch_number', ASCENDING)])
+            # FEFO order for a single item: earliest expiry first
+            self.lots_collection.create_index([
+                ('item_id', ASCENDING),
+                ('expiry_date', ASCENDING),
+                ('received_at', ASCENDING)
+            ])
+            # Expiry horizon: only lots that still hold stock are indexed, so
+            # depleted lots never slow down "expiring in N days" queries
+            self.lots_collection.create_index(
+                [('hospital_id', ASCENDING), ('expiry_date', ASCENDING)],
+                partialFilterExpression={'quantity_remaining': {'$gt': 0}},
+                name='open_lots_by_expiry'
+            )
+            self.transactions_collection.create_index([('hospital_id', ASCENDING), ('timestamp', DESCENDING)])
+            self.transactions_collection.create_index([('item_id', ASCENDING), ('timestamp', DESCENDING)])
+            self.rollups_collection.create_index([
+                ('hospital_id', ASCENDING),
+                ('granularity', ASCENDING),
+                ('item_id', ASCENDING),
+                ('bucket', ASCENDING)
+            ], unique=True)
+            self.rollups_collection.create_index([
+                ('hospital_id', ASCENDING),
+                ('granularity', ASCENDING),
+                ('bucket', ASCENDING)
+            ])
+            self.reservations_collection.create_index([('status', ASCENDING), ('expires_at', ASCENDING)])
+            self.reservations_collection.create_index([('hospital_id', ASCENDING), ('status', ASCENDING)])
+            self._ensure_transaction_retention()
+        except Exception as e:
+            print(f"Error creating inventory indexes: {e}")
+
+    def _ensure_transaction_retention(self):
+        """Expire raw transaction rows after TRANSACTION_RETENTION_DAYS via a TTL index"""
+        expire_after = TRANSACTION_RETENTION_DAYS * 24 * 3600
+        indexes = self.transactions_collection.index_information()
+        existing = indexes.get('timestamp_ttl')
+
+        if existing is None:
+            self.transactions_collection.create_index('timestamp', expireAfterSeconds=expire_after, name='timestamp_ttl')
+        elif existing.get('expireAfterSeconds') != expire_after:
+            # Retention setting changed since the index was built
+            self.db.command('collMod', self.transactions_collection.name,
+                            index={'name': 'timestamp_ttl', 'expireAfterSeconds': expire_after})
+
+    def _from_legacy_fields(self, item_data):
+        """Accept the field names the old InventoryManager used (min_stock, unit, supplier, ...)"""
+        item_data = dict(item_data)
+        for legacy, canonical in LEGACY_INVENTORY_FIELDS.items():
+            if legacy in item_data:
+                value = item_data.pop(legacy)
+                item_data.setdefault(canonical, value)
+        if isinstance(item_data.get('supplier'), str):
+            item_data.setdefault('supplier_info', {
+                'name': item_data.pop('supplier'),
+                'contact': item_data.pop('supplier_contact', '')
+            })
+        if item_data.get('status') in LEGACY_STOCK_STATUSES:
+            item_data.pop('status')
+        if isinstance(item_data.get('expiry_date'), str):
+            item_data['expiry_date'] = datetime.fromisoformat(item_data['expiry_date']) if item_data['expiry_date'] else None
+        return item_data
+
+    def _build_item(self, item_data):
+        """Canonical inventory document for new item data"""
+        return {
             'hospital_id': item_data.get('hospital_id', 'DEFAULT'),  # Add hospital_id
-            'item_id': item_data['item_id'],  # Unique item identifier
+            'item_id': item_data.get('item_id') or f"ITEM-{uuid.uuid4().hex[:8].upper()}",  # Unique item identifier
             'name': item_data['name'],
             'category': item_data['category'],  # medicine, equipment, consumable, PPE, etc.
             'subcategory': item_data.get('subcategory', ''),  # antibiotics, surgical, masks, etc.
             'description': item_data.get('description', ''),
             'manufacturer': item_data.get('manufacturer', ''),
             'brand': item_data.get('brand', ''),
-            'unit_of_measurement': item_data['unit_of_measurement'],  # pieces, mg, ml, boxes, etc.
+            'unit_of_measurement': item_data.get('unit_of_measurement', 'pieces'),  # pieces, mg, ml, boxes, etc.
             'current_stock': item_data.get('current_stock', 0),
+            'reserved_quantity': 0,  # held by active reservations
             'minimum_threshold': item_data.get('minimum_threshold', 10),
             'maximum_capacity': item_data.get('maximum_capacity', 1000),
             'unit_price': item_data.get('unit_price', 0.0),
@@ -46,18 +175,501 @@ class MedicalInventoryDB:
             'created_at': datetime.utcnow(),
             'updated_at': datetime.utcnow()
         }
+
+    def create_inventory_item(self, item_data):
+        """Create a new inventory item"""
+        item = self._build_item(self._from_legacy_fields(item_data))
         
         # Check if item_id already exists in this hospital
         existing_item = self.inventory_collection.find_one({
-            'item_id': item_data['item_id'],
-            'hospital_id': item_data.get('hospital_id', 'DEFAULT')
+            'item_id': item['item_id'],
+            'hospital_id': item['hospital_id']
         })
         if existing_item:
-            raise ValueError(f"Item with ID {item_data['item_id']} already exists in this hospital")
+            raise ValueError(f"Item with ID {item['item_id']} already exists in this hospital")
         
         result = self.inventory_collection.insert_one(item)
+        self.changes.record(item['hospital_id'], 'inventory', item['item_id'])
+
+        self._create_opening_lot(item)
+
         return str(result.inserted_id)
-    
+
+    def _create_opening_lot(self, item):
+        """Opening stock becomes the item's first lot"""
+        if item['current_stock'] > 0:
+            self.create_lot(item, item['current_stock'], item['batch_number'], item['expiry_date'],
+                            supplier=item['supplier_info'].get('name', '') if isinstance(item['supplier_info'], dict) else '')
+
+    def migrate_legacy_inventory(self):
+        """Fold items from the old `inventory` collection into medical_inventory (idempotent)"""
+        legacy_collection = self.db.inventory
+        try:
+            legacy_items = list(legacy_collection.find({'migrated_at': {'$exists': False}}))
+            if not legacy_items:
+                return 0
+
+            items = []
+            for legacy in legacy_items:
+                item = self._build_item(self._from_legacy_fields(
+                    {k: v for k, v in legacy.items() if k not in ('_id', 'created_at', 'last_updated')}
+                ))
+                # Keep the old _id so links built from it still resolve
+                item['_id'] = legacy['_id']
+                item['created_at'] = legacy.get('created_at', item['created_at'])
+                item['updated_at'] = legacy.get('last_updated', item['updated_at'])
+                items.append(item)
+
+            result = self.inventory_collection.bulk_write([
+                UpdateOne(
+                    {'hospital_id': item['hospital_id'], 'item_id': item['item_id']},
+                    {'$setOnInsert': item},
+                    upsert=True
+                )
+                for item in items
+            ], ordered=False)
+            for index in result.upserted_ids:
+                self._create_opening_lot(items[index])
+
+            legacy_collection.update_many(
+                {'_id': {'$in': [legacy['_id'] for legacy in legacy_items]}},
+                {'$set': {'migrated_at': datetime.utcnow()}}
+            )
+            return len(result.upserted_ids)
+        except Exception as e:
+            print(f"Error migrating legacy inventory: {e}")
+            return 0
+
+    def create_lot(self, item, quantity, batch_number='', expiry_date=None, supplier='', source='received'):
+        """Create a stock lot (batch) for an item; source is 'received' or 'adjustment' (a stock count)"""
+        if isinstance(expiry_date, str):
+            expiry_date = datetime.fromisoformat(expiry_date)
+
+        lot = {
+            'hospital_id': item.get('hospital_id', 'DEFAULT'),
+            'item_id': item['item_id'],
+            'batch_number': batch_number,
+            'expiry_date': expiry_date,
+            'quantity_received': quantity,
+            'quantity_remaining': quantity,
+            'supplier': supplier,
+            'source': source,
+            'received_at': datetime.utcnow()
+        }
+
+        result = self.lots_collection.insert_one(lot)
+        return str(result.inserted_id)
+
+    def get_lots_for_item(self, item_id, include_depleted=False, hospital_id=None):
+        """Get the lots of an item in FEFO (first-expiring-first-out) order"""
+        lots = list(self._fefo_lots(item_id, include_depleted, hospital_id))
+        for lot in lots:
+            lot['_id'] = str(lot['_id'])
+        return lots
+
+    @staticmethod
+    def _hospital_item_query(item_id, hospital_id=None):
+        """Filter for an item or its lots; item_ids are only unique within a hospital, so scope by it when known"""
+        query = {'item_id': item_id}
+        if hospital_id:
+            query['hospital_id'] = hospital_id
+        return query
+
+    def _fefo_lots(self, item_id, include_depleted=False, hospital_id=None):
+        """Yield lots earliest expiry first; lots without an expiry date come last"""
+        query = self._hospital_item_query(item_id, hospital_id)
+        if not include_depleted:
+            query['quantity_remaining'] = {'$gt': 0}
+
+        order = [('expiry_date', ASCENDING), ('received_at', ASCENDING)]
+        yield from self.lots_collection.find({**query, 'expiry_date': {'$ne': None}}).sort(order)
+        yield from self.lots_collection.find({**query, 'expiry_date': None}).sort('received_at', ASCENDING)
+
+    def _expired_lot_quantity(self, item_id, hospital_id=None):
+        """Units of an item still sitting in expired lots; they count as stock but must not be dispensed"""
+        return self._open_lot_quantity(item_id, hospital_id, {'expiry_date': {'$lt': datetime.utcnow()}})
+
+    def _open_lot_quantity(self, item_id, hospital_id=None, match=None):
+        """Units of an item left in its open lots (those matching match, if given)"""
+        rows = list(self.lots_collection.aggregate([
+            {'$match': {**self._hospital_item_query(item_id, hospital_id), 'quantity_remaining': {'$gt': 0}, **(match or {})}},
+            {'$group': {'_id': None, 'quantity': {'$sum': '$quantity_remaining'}}}
+        ]))
+        return rows[0]['quantity'] if rows else 0
+
+    def consume_lots(self, item_id, quantity, hospital_id=None, include_expired=False):
+        """Take quantity out of an item's unexpired lots FEFO and return the lots touched.
+
+        include_expired takes expired lots first, for stock that leaves the shelf without being dispensed.
+        """
+        consumed = []
+        remaining = quantity
+        now = datetime.utcnow()
+        depleted_lot = False
+
+        open_lots = {**self._hospital_item_query(item_id, hospital_id), 'quantity_remaining': {'$gt': 0}}
+
+        # Dated lots in expiry order first, then lots without an expiry date
+        passes = [
+            ({**open_lots, 'expiry_date': {'$gte': now}}, [('expiry_date', ASCENDING), ('received_at', ASCENDING)]),
+            ({**open_lots, 'expiry_date': None}, [('received_at', ASCENDING)])
+        ]
+        if include_expired:
+            passes.insert(0, ({**open_lots, 'expiry_date': {'$lt': now}}, [('expiry_date', ASCENDING), ('received_at', ASCENDING)]))
+
+        for query, order in passes:
+            while remaining > 0:
+                # Atomically take up to `remaining` from the first lot in FEFO order;
+                # the pre-image tells us how much was actually taken
+                lot = self.lots_collection.find_one_and_update(
+                    query,
+                    [{'$set': {'quantity_remaining': {
+                        '$max': [{'$subtract': ['$quantity_remaining', remaining]}, 0]
+                    }}}],
+                    sort=order,
+                    return_document=ReturnDocument.BEFORE
+                )
+                if lot is None:
+                    break
+                take = min(remaining, lot['quantity_remaining'])
+                consumed.append({
+                    'lot_id': str(lot['_id']),
+                    'batch_number': lot.get('batch_number', ''),
+                    'expiry_date': lot.get('expiry_date'),
+                    'quantity': take
+                })
+                remaining -= take
+                if take == lot['quantity_remaining']:
+                    depleted_lot = True
+
+        # Anything left over is stock recorded before lot tracking existed.
+        # The item's next expiry only moves when a lot runs out.
+        if depleted_lot:
+            self._refresh_item_expiry(item_id, hospital_id)
+        return consumed
+
+    def _consume_batch(self, item_id, hospital_id, batch_number, quantity):
+        """Take quantity out of one named, unexpired lot; raises ValueError if it cannot cover it all"""
+        now = datetime.utcnow()
+        lot = self.lots_collection.find_one_and_update(
+            {**self._hospital_item_query(item_id, hospital_id), 'batch_number': batch_number,
+             'quantity_remaining': {'$gte': quantity},
+             '$or': [{'expiry_date': None}, {'expiry_date': {'$gte': now}}]},
+            {'$inc': {'quantity_remaining': -quantity}},
+            sort=[('received_at', ASCENDING)],
+            return_document=ReturnDocument.BEFORE
+        )
+        if lot is None:
+            raise ValueError(f"Batch {batch_number} of item {item_id} does not have {quantity} unexpired units")
+        if lot['quantity_remaining'] == quantity:
+            self._refresh_item_expiry(item_id, hospital_id)
+        return {
+            'lot_id': str(lot['_id']),
+            'batch_number': batch_number,
+            'expiry_date': lot.get('expiry_date'),
+            'quantity': quantity
+        }
+
+    def _return_to_lot(self, item_id, hospital_id, consumed):
+        """Undo _consume_batch when the stock change it was taken for fails"""
+        self.lots_collection.update_one({'_id': ObjectId(consumed['lot_id'])},
+                                        {'$inc': {'quantity_remaining': consumed['quantity']}})
+        self._refresh_item_expiry(item_id, hospital_id)
+
+    def _refresh_item_expiry(self, item_id, hospital_id=None):
+        """Point the item's expiry_date/batch_number at its next-expiring open lot"""
+        item_query = self._hospital_item_query(item_id, hospital_id)
+        next_lot = next(self._fefo_lots(item_id, hospital_id=hospital_id), None)
+        if next_lot is None:
+            # Leave untracked (pre-lot) items alone; fully depleted items no longer expire
+            if self.lots_collection.find_one(item_query, {'_id': 1}):
+                item = self.inventory_collection.find_one_and_update(
+                    item_query,
+                    {'$set': {'expiry_date': None, 'updated_at': datetime.utcnow()}},
+                    projection=ITEM_KEY_FIELDS
+                )
+                self._item_changed(item)
+            return
+
+        item = self.inventory_collection.find_one_and_update(
+            item_query,
+            {'$set': {
+                'expiry_date': next_lot.get('expiry_date'),
+                'batch_number': next_lot.get('batch_number', ''),
+                'updated_at': datetime.utcnow()
+            }},
+            projection=ITEM_KEY_FIELDS
+        )
+        self._item_changed(item)
+
+    def _item_changed(self, item, *keys):
+        """Drop a written item from the lookup cache and log it for delta sync"""
+        if item is None:
+            self.cache.invalidate(*keys)
+            return
+        self.cache.invalidate(*keys, item['item_id'])
+        self.changes.record(item.get('hospital_id'), 'inventory', item['item_id'])
+
+    def on_item_change(self, event):
+        """Change watcher callback: items written by other processes leave both lookup caches"""
+        self.cache.on_change(event)
+        if event['_id'] is None:
+            self.barcode_cache.clear()
+        elif event['updated_fields'] is None or BARCODE_MAPPING_FIELDS.intersection(event['updated_fields']):
+            # The barcode it was cached under may be the old one, so find it by item
+            item_id = (event['document'] or {}).get('item_id')
+            if item_id is None:
+                self.barcode_cache.clear()
+            else:
+                self.barcode_cache.delete_value(item_id)
+
+    def get_expiring_lots_by_hospital(self, hospital_id, days_ahead=30):
+        """Get open lots expiring within specified days for a specific hospital"""
+        now = datetime.utcnow()
+        lots = list(self.lots_collection.find({
+            'hospital_id': hospital_id,
+            'quantity_remaining': {'$gt': 0},
+            'expiry_date': {
+                '$gte': now,
+                '$lte': now + timedelta(days=days_ahead)
+            }
+        }).sort('expiry_date', ASCENDING))
+
+        for lot in lots:
+            lot['_id'] = str(lot['_id'])
+        return lots
+
+    def get_expired_lots_by_hospital(self, hospital_id):
+        """Get open lots that have already expired for a specific hospital"""
+        lots = list(self.lots_collection.find({
+            'hospital_id': hospital_id,
+            'quantity_remaining': {'$gt': 0},
+            'expiry_date': {'$lt': datetime.utcnow()}
+        }).sort('expiry_date', ASCENDING))
+
+        for lot in lots:
+            lot['_id'] = str(lot['_id'])
+        return lots
+
+    def write_off_expired_lots(self, hospital_id, user_id=''):
+        """Remove the remaining quantity of expired lots from stock"""
+        written_off = []
+        for lot in self.get_expired_lots_by_hospital(hospital_id):
+            updated = self.lots_collection.find_one_and_update(
+                {'_id': ObjectId(lot['_id']), 'quantity_remaining': lot['quantity_remaining']},
+                {'$set': {'quantity_remaining': 0, 'written_off_at': datetime.utcnow()}}
+            )
+            if not updated:
+                continue
+            item_query = {'hospital_id': hospital_id, 'item_id': lot['item_id']}
+            item = self.inventory_collection.find_one(item_query, {'current_stock': 1}) or {}
+            # Only stock the other open lots do not account for can leave, so a lot ledger that drifted
+            # above the stock neither fails the write-off on every run nor takes unexpired units with it
+            uncovered = item.get('current_stock', 0) - self._open_lot_quantity(lot['item_id'], hospital_id)
+            quantity = min(lot['quantity_remaining'], max(uncovered, 0))
+            try:
+                # Expired units leave the shelf whether or not a reservation is holding them
+                if quantity:
+                    self._apply_stock_change(lot['item_id'], -quantity, 'expired',
+                                             f"Expired lot written off, Batch: {lot.get('batch_number', '')}", user_id,
+                                             use_reserved=True, item_query=item_query)
+            except ValueError as e:
+                # Reopen the lot so it stays on the expired list rather than drifting from the item's stock
+                self.lots_collection.update_one(
+                    {'_id': updated['_id']},
+                    {'$set': {'quantity_remaining': lot['quantity_remaining']}, '$unset': {'written_off_at': ''}}
+                )
+                print(f"Error writing off expired lot {lot['_id']}: {e}")
+                continue
+            self._refresh_item_expiry(lot['item_id'], hospital_id)
+            written_off.append(lot)
+        return written_off
+
+    def resolve_barcode(self, hospital_id, barcode):
+        """Resolve a scanned barcode to an item_id, served from the LRU when possible"""
+        key = (hospital_id, barcode)
+        item_id = self.barcode_cache.get(key)
+        if item_id is not None:
+            return item_id
+
+        item = self.inventory_collection.find_one(
+            {'hospital_id': hospital_id, 'barcode': barcode, 'status': 'active'},
+            {'_id': 0, 'item_id': 1}
+        )
+        if not item:
+            return None
+
+        self.barcode_cache.set(key, item['item_id'])
+        return item['item_id']
+
+    def scan_and_dispense(self, hospital_id, barcode, quantity, batch_number=None,
+                          patient_id='', department='', reason='', user_id=''):
+        """Resolve barcode -> item -> lot and dispense in one call"""
+        item_id = self.resolve_barcode(hospital_id, barcode)
+        if item_id is None:
+            raise ValueError(f"No item with barcode {barcode} in hospital {hospital_id}")
+
+        # Lapsed holds must not keep this dispense out of their stock
+        self.expire_reservations(hospital_id=hospital_id, item_id=item_id)
+        # A pinned batch is taken first, so an unknown or short batch is refused before stock moves
+        pinned = self._consume_batch(item_id, hospital_id, batch_number, quantity) if batch_number else None
+        try:
+            item = self._apply_stock_change(
+                item_id, -quantity, 'dispense',
+                f"Scanned dispense to patient: {patient_id}, Department: {department}, Reason: {reason}",
+                user_id,
+                item_query={'hospital_id': hospital_id, 'item_id': item_id},
+                held_back=self._expired_lot_quantity(item_id, hospital_id)
+            )
+        except ValueError:
+            if pinned:
+                self._return_to_lot(item_id, hospital_id, pinned)
+            # The cached mapping may be stale (item removed or re-labelled)
+            self.barcode_cache.delete((hospital_id, barcode))
+            raise
+
+        lots = [pinned] if pinned else self.consume_lots(item_id, quantity, hospital_id=hospital_id)
+        return {
+            'item_id': item_id,
+            'name': item.get('name', ''),
+            'dispensed': quantity,
+            'current_stock': item['current_stock'],
+            'lots': lots
+        }
+
+    def reserve_stock(self, item_id, quantity, ttl_minutes=DEFAULT_RESERVATION_TTL_MINUTES,
+                      reference='', patient_id='', reserved_by='', hospital_id=None):
+        """Hold stock for a scheduled procedure without removing it"""
+        if quantity <= 0:
+            raise ValueError("Reservation quantity must be positive")
+
+        target = self._find_item(item_id, hospital_id, {'item_id': 1, 'hospital_id': 1})
+        if not target:
+            raise ValueError(f"Item with ID {item_id} not found")
+        item_id = target['item_id']
+        self.expire_reservations(hospital_id=target.get('hospital_id'), item_id=item_id)
+
+        # The available-to-promise check and the counter bump are one atomic update
+        item = self.inventory_collection.find_one_and_update(
+            {'_id': target['_id'], 'status': 'active', '$expr': {'$gte': [AVAILABLE_STOCK_EXPR, quantity]}},
+            {'$inc': {'reserved_quantity': quantity}, '$set': {'updated_at': datetime.utcnow()}},
+            return_document=ReturnDocument.AFTER
+        )
+        if item is None:
+            raise ValueError("Insufficient unreserved stock for this reservation")
+        self._item_changed(item)
+
+        reservation = {
+            'hospital_id': item.get('hospital_id', 'DEFAULT'),
+            'item_id': item_id,
+            'quantity': quantity,
+            'reference': reference,  # procedure / surgery identifier
+            'patient_id': patient_id,
+            'reserved_by': reserved_by,
+            'status': 'active',  # active, fulfilled, released, expired
+            'expires_at': datetime.utcnow() + timedelta(minutes=ttl_minutes),
+            'created_at': datetime.utcnow(),
+            'updated_at': datetime.utcnow()
+        }
+
+        try:
+            result = self.reservations_collection.insert_one(reservation)
+        except Exception:
+            self._adjust_reserved(item_id, -quantity, item.get('hospital_id'))
+            raise
+        return str(result.inserted_id)
+
+    def _adjust_reserved(self, item_id, quantity_change, hospital_id=None):
+        """Move the item's reserved_quantity counter"""
+        item = self.inventory_collection.find_one_and_update(
+            self._hospital_item_query(item_id, hospital_id),
+            {'$inc': {'reserved_quantity': quantity_change}, '$set': {'updated_at': datetime.utcnow()}},
+            projection=ITEM_KEY_FIELDS
+        )
+        self._item_changed(item, item_id)
+
+    def _close_reservation(self, reservation_id, status, query=None, release_hold=True):
+        """Move an active reservation to a final status and give back its hold"""
+        reservation = self.reservations_collection.find_one_and_update(
+            {**(query or {}), '_id': ObjectId(reservation_id), 'status': 'active'},
+            {'$set': {'status': status, 'updated_at': datetime.utcnow()}}
+        )
+        if reservation and release_hold:
+            self._adjust_reserved(reservation['item_id'], -reservation['quantity'], reservation.get('hospital_id'))
+        return reservation
+
+    def release_reservation(self, reservation_id):
+        """Cancel a reservation, returning its stock to available-to-promise"""
+        return self._close_reservation(reservation_id, 'released') is not None
+
+    def fulfill_reservation(self, reservation_id, patient_id='', department='', user_id=''):
+        """Dispense the reserved stock for a reservation"""
+        # Keep the hold until the stock has actually left, so nothing else can claim it
+        reservation = self._close_reservation(reservation_id, 'fulfilled', release_hold=False)
+        if reservation is None:
+            return False
+
+        try:
+            self._apply_stock_change(
+                reservation['item_id'], -reservation['quantity'], 'dispense',
+                f"Reservation fulfilled: {reservation.get('reference', '')}, "
+                f"Patient: {patient_id or reservation.get('patient_id', '')}, Department: {department}",
+                user_id,
+                use_reserved=True,
+                item_query=self._hospital_item_query(reservation['item_id'], reservation.get('hospital_id'))
+            )
+        except ValueError:
+            # Reopen the reservation so it can be retried or released
+            self.reservations_collection.update_one(
+                {'_id': reservation['_id']},
+                {'$set': {'status': 'active', 'updated_at': datetime.utcnow()}}
+            )
+            raise
+
+        self._adjust_reserved(reservation['item_id'], -reservation['quantity'], reservation.get('hospital_id'))
+        self.consume_lots(reservation['item_id'], reservation['quantity'], hospital_id=reservation.get('hospital_id'))
+        return True
+
+    def expire_reservations(self, hospital_id=None, item_id=None):
+        """Expire reservations past their TTL and release their holds"""
+        query = {'status': 'active', 'expires_at': {'$lt': datetime.utcnow()}}
+        if hospital_id:
+            query['hospital_id'] = hospital_id
+        if item_id:
+            query['item_id'] = item_id
+
+        expired = 0
+        for reservation in self.reservations_collection.find(query, {'_id': 1}):
+            if self._close_reservation(reservation['_id'], 'expired', {'expires_at': query['expires_at']}):
+                expired += 1
+        return expired
+
+    def get_reservations_by_hospital(self, hospital_id, status='active'):
+        """Get reservations for a hospital, soonest to expire first"""
+        self.expire_reservations(hospital_id=hospital_id)
+        query = {'hospital_id': hospital_id}
+        if status:
+            query['status'] = status
+
+        reservations = list(self.reservations_collection.find(query).sort('expires_at', ASCENDING))
+        for reservation in reservations:
+            reservation['_id'] = str(reservation['_id'])
+        return reservations
+
+    def get_item_availability(self, item_id, hospital_id=None):
+        """Get current, reserved and available-to-promise stock for an item"""
+        item = self._find_item(
+            item_id, hospital_id,
+            {'_id': 0, 'item_id': 1, 'hospital_id': 1, 'current_stock': 1, 'reserved_quantity': 1}
+        )
+        if not item:
+            return None
+
+        reserved = item.get('reserved_quantity', 0)
+        item['reserved_quantity'] = reserved
+        item['available_to_promise'] = item['current_stock'] - reserved
+        return item
+
     def get_all_inventory(self):
         """Get all inventory items"""
         items = list(self.inventory_collection.find())
@@ -65,22 +677,61 @@ class MedicalInventoryDB:
             item['_id'] = str(item['_id'])
         return items
     
-    def get_item_by_id(self, item_id):
-        """Get a specific item by item_id"""
-        item = self.inventory_collection.find_one({'item_id': item_id})
+    def _item_query(self, item_key):
+        """Look an item up by Mongo _id (older clients) or by item_id"""
+        if ObjectId.is_valid(item_key):
+            return {'_id': ObjectId(item_key)}
+        return {'item_id': item_key}
+
+    def _find_item(self, item_key, hospital_id=None, projection=None):
+        """The item document for a Mongo _id or item_id key, within a hospital when given"""
+        query = self._item_query(item_key)
+        if hospital_id:
+            query['hospital_id'] = hospital_id
+        return self.inventory_collection.find_one(query, projection)
+
+    def format_item(self, item):
+        """Serialize an item for the API, including the field names older clients read"""
+        item['_id'] = str(item['_id'])
+        for legacy, canonical in LEGACY_INVENTORY_FIELDS.items():
+            item.setdefault(legacy, item.get(canonical))
+        supplier_info = item.get('supplier_info')
+        item.setdefault('supplier', supplier_info.get('name', '') if isinstance(supplier_info, dict) else '')
+        item.setdefault('last_updated', item.get('updated_at'))
+
+        item['stock_status'] = stock_level(item.get('current_stock', 0), item.get('reserved_quantity', 0),
+                                           item.get('minimum_threshold', 0))
+
+        for field in ('expiry_date', 'last_updated', 'created_at', 'updated_at', 'last_restocked'):
+            if isinstance(item.get(field), datetime):
+                item[field] = item[field].isoformat()
+        return item
+
+    def get_item_by_id(self, item_id, cached=True):
+        """Get a specific item by item_id (or Mongo _id)"""
+        if cached:
+            return self.cache.get(item_id, self._load_item)
+        return self._load_item(item_id)
+
+    def _load_item(self, item_id):
+        item = self.inventory_collection.find_one(self._item_query(item_id))
         if item:
             item['_id'] = str(item['_id'])
         return item
     
-    def get_inventory_by_hospital(self, hospital_id):
-        """Get all inventory items for a specific hospital"""
-        items = list(self.inventory_collection.find({'hospital_id': hospital_id}))
+    def get_inventory_by_hospital(self, hospital_id, category=None):
+        """Get all inventory items for a specific hospital, optionally in one category"""
+        query = {'hospital_id': hospital_id, 'status': {'$ne': 'discontinued'}}
+        if category:
+            query['category'] = category
+        items = list(self.inventory_collection.find(query))
         for item in items:
             item['_id'] = str(item['_id'])
         return items
     
     def get_low_stock_items_by_hospital(self, hospital_id):
-        """Get items with stock below minimum threshold for a specific hospital"""
+        """Get items whose unreserved stock is below minimum threshold for a specific hospital"""
+        self.expire_reservations(hospital_id=hospital_id)
         pipeline = [
             {
                 '$match': {
@@ -91,7 +742,7 @@ class MedicalInventoryDB:
             {
                 '$addFields': {
                     'is_low_stock': {
-                        '$lte': ['$current_stock', '$minimum_threshold']
+                        '$lte': [AVAILABLE_STOCK_EXPR, '$minimum_threshold']
                     }
                 }
             },
@@ -124,43 +775,59 @@ class MedicalInventoryDB:
             item['_id'] = str(item['_id'])
         return items
     
-    def get_inventory_statistics_by_hospital(self, hospital_id):
-        """Get comprehensive inventory statistics for a specific hospital"""
-        total_items = self.inventory_collection.count_documents({'hospital_id': hospital_id, 'status': 'active'})
-        total_value = list(self.inventory_collection.aggregate([
-            {'$match': {'hospital_id': hospital_id, 'status': 'active'}},
-            {'$group': {'_id': None, 'total': {'$sum': '$total_value'}}}
-        ]))
-        
-        low_stock_count = len(self.get_low_stock_items_by_hospital(hospital_id))
-        expiring_soon_count = len(self.get_expiring_items_by_hospital(hospital_id))
-        
-        # Category breakdown for this hospital
-        category_stats = list(self.inventory_collection.aggregate([
-            {'$match': {'hospital_id': hospital_id, 'status': 'active'}},
-            {'$group': {
-                '_id': '$category',
-                'count': {'$sum': 1},
-                'total_value': {'$sum': '$total_value'},
-                'total_stock': {'$sum': '$current_stock'}
+    def _inventory_statistics(self, match):
+        """All inventory counts, value and breakdowns in one aggregation"""
+        now = datetime.utcnow()
+        expiry_threshold = now + timedelta(days=30)
+        result = list(self.inventory_collection.aggregate([
+            {'$match': {**match, 'status': 'active'}},
+            {'$facet': {
+                'totals': [{'$group': {
+                    '_id': None,
+                    'total_items': {'$sum': 1},
+                    'total_value': {'$sum': '$total_value'},
+                    'low_stock_items': {'$sum': {'$cond': [{'$lte': [AVAILABLE_STOCK_EXPR, '$minimum_threshold']}, 1, 0]}},
+                    'out_of_stock_items': {'$sum': {'$cond': [{'$lte': ['$current_stock', 0]}, 1, 0]}},
+                    'expiring_soon': {'$sum': {'$cond': [{'$and': [
+                        {'$gte': ['$expiry_date', now]},
+                        {'$lte': ['$expiry_date', expiry_threshold]}
+                    ]}, 1, 0]}}
+                }}],
+                'categories': [{'$group': {
+                    '_id': '$category',
+                    'count': {'$sum': 1},
+                    'total_value': {'$sum': '$total_value'},
+                    'total_stock': {'$sum': '$current_stock'}
+                }}]
             }}
-        ]))
-        
+        ], allowDiskUse=True))
+        facets = result[0] if result else {}
+        totals = (facets.get('totals') or [{}])[0]
+
         return {
-            'total_items': total_items,
-            'total_value': total_value[0]['total'] if total_value else 0,
-            'low_stock_items': low_stock_count,
-            'expiring_soon': expiring_soon_count,
-            'category_breakdown': category_stats
+            'total_items': totals.get('total_items', 0),
+            'total_value': round(totals.get('total_value', 0), 2),
+            'low_stock_items': totals.get('low_stock_items', 0),
+            'out_of_stock_items': totals.get('out_of_stock_items', 0),
+            'expiring_soon': totals.get('expiring_soon', 0),
+            'expiring_items': totals.get('expiring_soon', 0),
+            'category_breakdown': {stat['_id']: stat['count'] for stat in facets.get('categories', [])},
+            'category_details': facets.get('categories', [])
         }
+
+    def get_inventory_statistics_by_hospital(self, hospital_id):
+        """Get comprehensive inventory statistics for a specific hospital"""
+        self.expire_reservations(hospital_id=hospital_id)
+        return self._inventory_statistics({'hospital_id': hospital_id})
     
     def get_low_stock_items(self):
-        """Get items with stock below minimum threshold"""
+        """Get items whose unreserved stock is below minimum threshold"""
+        self.expire_reservations()
         pipeline = [
             {
                 '$addFields': {
                     'is_low_stock': {
-                        '$lte': ['$current_stock', '$minimum_threshold']
+                        '$lte': [AVAILABLE_STOCK_EXPR, '$minimum_threshold']
                     }
                 }
             },
@@ -193,82 +860,179 @@ class MedicalInventoryDB:
             item['_id'] = str(item['_id'])
         return items
     
-    def update_stock(self, item_id, quantity_change, transaction_type, reason='', user_id=''):
-        """Update stock quantity and log transaction"""
-        item = self.get_item_by_id(item_id)
+    def update_stock(self, item_id, quantity_change, transaction_type, reason='', user_id='', hospital_id=None):
+        """Update stock quantity and log transaction, keeping the item's lots in step"""
+        item = self._find_item(item_id, hospital_id, {'item_id': 1, 'hospital_id': 1})
         if not item:
             raise ValueError(f"Item with ID {item_id} not found")
-        
-        new_stock = item['current_stock'] + quantity_change
-        if new_stock < 0:
-            raise ValueError("Insufficient stock for this operation")
-        
-        # Update item stock
-        new_total_value = new_stock * item['unit_price']
+        self._change_stock(item, quantity_change, transaction_type, reason, user_id)
+        return True
+
+    def _change_stock(self, item, quantity_change, transaction_type, reason='', user_id=''):
+        """Apply a stock change that is not a dispense or restock (a count, waste) to its lots as well.
+
+        A decrease takes expired lots first, then FEFO. An increase becomes an 'adjustment' lot without
+        expiry, unless the item predates lot tracking and has no lots at all.
+        """
+        item_id, hospital_id = item['item_id'], item.get('hospital_id')
+        updated = self._apply_stock_change(item_id, quantity_change, transaction_type, reason, user_id,
+                                           item_query={'_id': item['_id']})
+        if quantity_change < 0:
+            self.consume_lots(item_id, -quantity_change, hospital_id=hospital_id, include_expired=True)
+        elif quantity_change > 0 and self.lots_collection.find_one(self._hospital_item_query(item_id, hospital_id), {'_id': 1}):
+            self.create_lot(item, quantity_change, source='adjustment')
+            self._refresh_item_expiry(item_id, hospital_id)
+        return updated
+
+    def _apply_stock_change(self, item_id, quantity_change, transaction_type, reason='', user_id='',
+                            use_reserved=False, item_query=None, held_back=0):
+        """Atomically apply a stock change, log it and return the updated item.
+
+        item_query pins the item document (item_ids are only unique within a hospital); held_back
+        units (expired lots) are kept out of what a decrease may take.
+        """
+        now = datetime.utcnow()
+        query = dict(item_query or {'item_id': item_id})
+        if quantity_change < 0:
+            # The stock check is part of the update filter, so concurrent
+            # dispenses can never drive stock below zero or into reserved stock.
+            # Held-back units never count for more than the stock there is.
+            on_hand = '$current_stock' if use_reserved else AVAILABLE_STOCK_EXPR
+            held = {'$min': [held_back, '$current_stock']}
+            query['$expr'] = {'$gte': [{'$subtract': [on_hand, held]}, -quantity_change]}
+
+        new_stock = {'$add': ['$current_stock', quantity_change]}
         update_data = {
             'current_stock': new_stock,
-            'total_value': new_total_value,
-            'updated_at': datetime.utcnow()
+            'total_value': {'$multiply': [new_stock, '$unit_price']},
+            'updated_at': now
         }
         
         if transaction_type == 'restock':
-            update_data['last_restocked'] = datetime.utcnow()
+            update_data['last_restocked'] = now
         
-        result = self.inventory_collection.update_one(
-            {'item_id': item_id},
-            {'$set': update_data}
+        item = self.inventory_collection.find_one_and_update(
+            query,
+            [{'$set': update_data}],
+            return_document=ReturnDocument.AFTER
         )
+        self._item_changed(item, item_id)
+
+        if item is None:
+            if not self.inventory_collection.find_one(item_query or {'item_id': item_id}, {'_id': 1}):
+                raise ValueError(f"Item with ID {item_id} not found")
+            if held_back:
+                raise ValueError(f"Insufficient unreserved stock for this operation ({held_back} units are in expired lots)")
+            raise ValueError("Insufficient unreserved stock for this operation")
         
         # Log transaction
-        if result.modified_count > 0:
-            self.log_transaction(item_id, quantity_change, transaction_type, reason, user_id)
-        
-        return result.modified_count > 0
+        self.log_transaction(item_id, quantity_change, transaction_type, reason, user_id,
+                             hospital_id=item.get('hospital_id'))
+        self._publish_stock_alert(item, quantity_change)
+
+        item['_id'] = str(item['_id'])
+        return item
+
+    def _publish_stock_alert(self, item, quantity_change):
+        """Push a stock alert to the hospital's live screens when a change moves the item between levels"""
+        reserved = item.get('reserved_quantity', 0)
+        threshold = item.get('minimum_threshold', 0)
+        level = stock_level(item['current_stock'], reserved, threshold)
+        if level == stock_level(item['current_stock'] - quantity_change, reserved, threshold):
+            return
+        event_bus.publish(item.get('hospital_id'), 'stock_alert', {
+            'item_id': item['item_id'],
+            'name': item.get('name'),
+            'category': item.get('category'),
+            'stock_status': level,
+            'current_stock': item['current_stock'],
+            'reserved_quantity': reserved,
+            'minimum_threshold': threshold
+        })
     
-    def log_transaction(self, item_id, quantity_change, transaction_type, reason='', user_id=''):
-        """Log inventory transaction"""
+    def log_transaction(self, item_id, quantity_change, transaction_type, reason='', user_id='', hospital_id=None):
+        """Log inventory transaction and fold it into the hourly/daily rollups"""
+        timestamp = datetime.utcnow()
         transaction = {
+            'hospital_id': hospital_id,
             'item_id': item_id,
             'quantity_change': quantity_change,
             'transaction_type': transaction_type,  # restock, dispense, adjust, waste, expired
             'reason': reason,
             'user_id': user_id,
-            'timestamp': datetime.utcnow()
+            'timestamp': timestamp
         }
         
         self.transactions_collection.insert_one(transaction)
+        self._update_rollups(hospital_id, item_id, quantity_change, transaction_type, timestamp)
+
+    def _update_rollups(self, hospital_id, item_id, quantity_change, transaction_type, timestamp):
+        """Increment the hour and day buckets for a transaction in one round trip"""
+        increments = {
+            'transaction_count': 1,
+            'net_change': quantity_change,
+            f'by_type.{transaction_type}': quantity_change
+        }
+        if transaction_type == 'dispense':
+            increments['dispensed'] = -quantity_change
+        elif transaction_type == 'restock':
+            increments['restocked'] = quantity_change
+
+        buckets = {
+            'hour': timestamp.replace(minute=0, second=0, microsecond=0),
+            'day': timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+        }
+        operations = [
+            UpdateOne(
+                {'hospital_id': hospital_id, 'granularity': granularity, 'item_id': item_id, 'bucket': bucket},
+                {'$inc': increments, '$set': {'updated_at': timestamp}},
+                upsert=True
+            )
+            for granularity, bucket in buckets.items()
+        ]
+        self.rollups_collection.bulk_write(operations, ordered=False)
     
-    def dispense_item(self, item_id, quantity, patient_id='', department='', reason=''):
-        """Dispense items (reduce stock)"""
-        return self.update_stock(item_id, -quantity, 'dispense', 
-                               f"Dispensed to patient: {patient_id}, Department: {department}, Reason: {reason}")
+    def dispense_item(self, item_id, quantity, patient_id='', department='', reason='', hospital_id=None):
+        """Dispense items (reduce stock), consuming unexpired lots first-expiring-first-out"""
+        target = self._find_item(item_id, hospital_id, {'item_id': 1, 'hospital_id': 1})
+        if not target:
+            raise ValueError(f"Item with ID {item_id} not found")
+
+        item_id, hospital_id = target['item_id'], target.get('hospital_id')
+        # Lapsed holds must not keep this dispense out of their stock
+        self.expire_reservations(hospital_id=hospital_id, item_id=item_id)
+        self._apply_stock_change(item_id, -quantity, 'dispense',
+                                 f"Dispensed to patient: {patient_id}, Department: {department}, Reason: {reason}",
+                                 item_query={'_id': target['_id']},
+                                 held_back=self._expired_lot_quantity(item_id, hospital_id))
+        self.consume_lots(item_id, quantity, hospital_id=hospital_id)
+        return True
     
-    def restock_item(self, item_id, quantity, supplier='', batch_number='', expiry_date=None):
-        """Restock items (increase stock)"""
-        # Update batch number and expiry date if provided
-        if batch_number or expiry_date:
-            update_data = {'updated_at': datetime.utcnow()}
-            if batch_number:
-                update_data['batch_number'] = batch_number
-            if expiry_date:
-                update_data['expiry_date'] = expiry_date
-            
-            self.inventory_collection.update_one(
-                {'item_id': item_id},
-                {'$set': update_data}
-            )
-        
-        return self.update_stock(item_id, quantity, 'restock', 
-                               f"Restocked from supplier: {supplier}, Batch: {batch_number}")
+    def restock_item(self, item_id, quantity, supplier='', batch_number='', expiry_date=None, hospital_id=None):
+        """Restock items (increase stock) as a new lot with its own expiry"""
+        item = self._find_item(item_id, hospital_id, {'item_id': 1, 'hospital_id': 1})
+        if not item:
+            raise ValueError(f"Item with ID {item_id} not found")
+
+        self._apply_stock_change(item['item_id'], quantity, 'restock',
+                                 f"Restocked from supplier: {supplier}, Batch: {batch_number}",
+                                 item_query={'_id': item['_id']})
+        self.create_lot(item, quantity, batch_number, expiry_date, supplier)
+        self._refresh_item_expiry(item['item_id'], item.get('hospital_id'))
+        return True
     
-    def adjust_stock(self, item_id, new_quantity, reason=''):
-        """Adjust stock to a specific quantity"""
-        item = self.get_item_by_id(item_id)
+    def adjust_stock(self, item_id, new_quantity, reason='', user_id='', hospital_id=None):
+        """Adjust stock to a specific quantity; the lots are adjusted with it"""
+        # The change is computed from the current stock, so it must not come from a cached copy
+        item = self._find_item(item_id, hospital_id, {'item_id': 1, 'hospital_id': 1, 'current_stock': 1})
         if not item:
             raise ValueError(f"Item with ID {item_id} not found")
         
         quantity_change = new_quantity - item['current_stock']
-        return self.update_stock(item_id, quantity_change, 'adjust', reason)
+        if quantity_change < 0:
+            self.expire_reservations(hospital_id=item.get('hospital_id'), item_id=item['item_id'])
+        self._change_stock(item, quantity_change, 'adjust', reason, user_id)
+        return True
     
     def search_inventory(self, search_term):
         """Search inventory by name, item_id, manufacturer, or brand"""
@@ -290,36 +1054,11 @@ class MedicalInventoryDB:
     
     def get_inventory_statistics(self):
         """Get comprehensive inventory statistics"""
-        total_items = self.inventory_collection.count_documents({'status': 'active'})
-        total_value = list(self.inventory_collection.aggregate([
-            {'$match': {'status': 'active'}},
-            {'$group': {'_id': None, 'total': {'$sum': '$total_value'}}}
-        ]))
-        
-        low_stock_count = len(self.get_low_stock_items())
-        expiring_soon_count = len(self.get_expiring_items())
-        
-        # Category breakdown
-        category_stats = list(self.inventory_collection.aggregate([
-            {'$match': {'status': 'active'}},
-            {'$group': {
-                '_id': '$category',
-                'count': {'$sum': 1},
-                'total_value': {'$sum': '$total_value'},
-                'total_stock': {'$sum': '$current_stock'}
-            }}
-        ]))
-        
-        return {
-            'total_items': total_items,
-            'total_value': total_value[0]['total'] if total_value else 0,
-            'low_stock_items': low_stock_count,
-            'expiring_soon': expiring_soon_count,
-            'category_breakdown': category_stats
-        }
+        self.expire_reservations()
+        return self._inventory_statistics({})
     
-    def get_transaction_history(self, item_id=None, days=30):
-        """Get transaction history for an item or all items"""
+    def get_transaction_history(self, item_id=None, days=30, hospital_id=None, limit=None, skip=0):
+        """Get raw transaction history (newest first) for an item or all items"""
         query = {
             'timestamp': {
                 '$gte': datetime.utcnow() - timedelta(days=days)
@@ -328,13 +1067,71 @@ class MedicalInventoryDB:
         
         if item_id:
             query['item_id'] = item_id
+        if hospital_id:
+            query['hospital_id'] = hospital_id
         
-        transactions = list(self.transactions_collection.find(query).sort('timestamp', -1))
+        cursor = self.transactions_collection.find(query).sort('timestamp', DESCENDING).skip(skip)
+        if limit:
+            cursor = cursor.limit(limit)
+
+        transactions = list(cursor)
         for transaction in transactions:
             transaction['_id'] = str(transaction['_id'])
         
         return transactions
     
+    def get_consumption_history(self, hospital_id, item_id=None, days=30, granularity=None):
+        """Get per-bucket consumption totals from the hourly/daily rollups"""
+        if granularity is None:
+            granularity = 'hour' if days <= HOURLY_ROLLUP_MAX_DAYS else 'day'
+        if granularity not in ('hour', 'day'):
+            raise ValueError("Invalid granularity. Must be one of: ['hour', 'day']")
+
+        # Align the window start to a bucket boundary so the first bucket is not dropped
+        since = datetime.utcnow() - timedelta(days=days)
+        since = since.replace(minute=0, second=0, microsecond=0)
+        if granularity == 'day':
+            since = since.replace(hour=0)
+
+        query = {
+            'hospital_id': hospital_id,
+            'granularity': granularity,
+            'bucket': {'$gte': since}
+        }
+
+        if item_id:
+            query['item_id'] = item_id
+            buckets = list(self.rollups_collection.find(query, {'_id': 0, 'updated_at': 0}).sort('bucket', ASCENDING))
+        else:
+            # Hospital-wide totals: sum every item's bucket server-side
+            buckets = list(self.rollups_collection.aggregate([
+                {'$match': query},
+                {'$group': {
+                    '_id': '$bucket',
+                    'transaction_count': {'$sum': '$transaction_count'},
+                    'net_change': {'$sum': '$net_change'},
+                    'dispensed': {'$sum': '$dispensed'},
+                    'restocked': {'$sum': '$restocked'}
+                }},
+                {'$sort': {'_id': 1}},
+                {'$project': {
+                    '_id': 0,
+                    'bucket': '$_id',
+                    'transaction_count': 1,
+                    'net_change': 1,
+                    'dispensed': 1,
+                    'restocked': 1
+                }}
+            ]))
+
+        return {
+            'hospital_id': hospital_id,
+            'item_id': item_id,
+            'granularity': granularity,
+            'days': days,
+            'buckets': buckets
+        }
+
     def create_supplier(self, supplier_data):
         """Create a new supplier"""
         supplier = {
@@ -354,13 +1151,44 @@ class MedicalInventoryDB:
         result = self.suppliers_collection.insert_one(supplier)
         return str(result.inserted_id)
     
+    def update_item(self, item_key, update_data):
+        """Update an item's descriptive fields; stock changes go through adjust_stock"""
+        update_data = self._from_legacy_fields(update_data)
+        new_stock = update_data.pop('current_stock', None)
+        update_data = {
+            field: value for field, value in update_data.items()
+            # Identity, holds and derived values have their own write paths
+            if field not in ('_id', 'item_id', 'hospital_id', 'reserved_quantity', 'total_value',
+                             'created_at', 'last_updated')
+        }
+        update_data['updated_at'] = datetime.utcnow()
+
+        item = self.inventory_collection.find_one_and_update(
+            self._item_query(item_key),
+            [{'$set': {field: {'$literal': value} for field, value in update_data.items()}},
+             {'$set': {'total_value': {'$multiply': ['$current_stock', {'$ifNull': ['$unit_price', 0]}]}}}],
+            projection=ITEM_KEY_FIELDS
+        )
+        self.barcode_cache.clear()
+        self._item_changed(item, item_key)
+        if new_stock is not None and item is not None:
+            self.set_stock_level(item_key, int(new_stock), 'Stock edited with item details')
+        return item is not None
+
+    def set_stock_level(self, item_key, new_stock, reason='', user_id='', hospital_id=None):
+        """Set an item's stock to an absolute quantity, logged as an adjustment"""
+        return self.adjust_stock(item_key, new_stock, reason, user_id, hospital_id)
+
     def delete_item(self, item_id):
         """Soft delete an item by setting status to discontinued"""
-        result = self.inventory_collection.update_one(
-            {'item_id': item_id},
-            {'$set': {'status': 'discontinued', 'updated_at': datetime.utcnow()}}
+        item = self.inventory_collection.find_one_and_update(
+            self._item_query(item_id),
+            {'$set': {'status': 'discontinued', 'updated_at': datetime.utcnow()}},
+            projection=ITEM_KEY_FIELDS
         )
-        return result.modified_count > 0
+        self.barcode_cache.clear()
+        self._item_changed(item, item_id)
+        return item is not None
 
 # Example usage and testing functions
 def initialize_sample_inventory():
@@ -1,12 +1,19 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, ReturnDocument
 from datetime import datetime
 from bson.objectid import ObjectId
 import os
 from dotenv import load_dotenv
 
+from cache import entity_cache
+from events import event_bus
+from change_log import ChangeLog
+
 # Load environment variables
 load_dotenv()
 
+# Reads of a patient a transfer retries when the record changes between its read and write
+TRANSFER_WRITE_ATTEMPTS = 3
+
 class PatientDataDB:
     def __init__(self):
         """Initialize MongoDB connection"""
@@ -14,6 +21,23 @@ class PatientDataDB:
         self.db = self.client.hospital_db
         self.patients_collection = self.db.patients
         self.beds_collection = self.db.beds
+        # Shared with HospitalBedsDB, which looks patients up by _id
+        self.cache = entity_cache('patient', 'patient_id')
+        self.changes = ChangeLog(self.db)
+        event_bus.share(self.db.hospital_events)
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """Create the indexes used by the patient queries (idempotent)"""
+        try:
+            self.patients_collection.create_index('patient_id')
+            # Per-hospital listings, and the count/latest-update read behind conditional GETs
+            self.patients_collection.create_index([('current_hospital', ASCENDING), ('updated_at', ASCENDING)])
+            # Stays at a hospital, unwound by the patient flow analytics
+            self.patients_collection.create_index([('admission_history.hospital_id', ASCENDING),
+                                                   ('admission_history.admission_date', ASCENDING)])
+        except Exception as e:
+            print(f"Error creating patient indexes: {e}")
         
     def create_patient(self, patient_data):
         """Create a new patient record"""
@@ -57,7 +81,19 @@ class PatientDataDB:
             raise ValueError(f"Patient with ID {patient_data['patient_id']} already exists")
         
         result = self.patients_collection.insert_one(patient)
+        self.changes.record(patient['current_hospital'], 'patients', patient['patient_id'])
+        if patient['current_hospital'] and patient['status'] == 'admitted':
+            self._publish(patient['current_hospital'], 'patient_admitted', patient)
         return str(result.inserted_id)
+
+    def _publish(self, hospital_id, event_type, patient, **extra):
+        """Push an admission, discharge or transfer to the hospital's live screens"""
+        event_bus.publish(hospital_id, event_type, {
+            'patient_id': patient['patient_id'],
+            'name': patient.get('name'),
+            'department': (patient.get('bed_info') or {}).get('department'),
+            **extra
+        })
     
     def get_all_patients(self):
         """Get all patients"""
@@ -67,8 +103,13 @@ class PatientDataDB:
             patient['_id'] = str(patient['_id'])
         return patients
     
-    def get_patient_by_id(self, patient_id):
+    def get_patient_by_id(self, patient_id, cached=True):
         """Get a specific patient by patient_id"""
+        if cached:
+            return self.cache.get(patient_id, self._load_patient)
+        return self._load_patient(patient_id)
+
+    def _load_patient(self, patient_id):
         patient = self.patients_collection.find_one({'patient_id': patient_id})
         if patient:
             patient['_id'] = str(patient['_id'])
@@ -76,6 +117,9 @@ class PatientDataDB:
     
     def get_patient_by_mongo_id(self, mongo_id):
         """Get a specific patient by MongoDB _id"""
+        return self.cache.get(mongo_id, self._load_patient_by_mongo_id)
+
+    def _load_patient_by_mongo_id(self, mongo_id):
         patient = self.patients_collection.find_one({'_id': ObjectId(mongo_id)})
         if patient:
             patient['_id'] = str(patient['_id'])
@@ -85,11 +129,21 @@ class PatientDataDB:
         """Update patient information"""
         update_data['updated_at'] = datetime.utcnow()
         
-        result = self.patients_collection.update_one(
+        return self._update_patient(patient_id, update_data)
+    
+    def _update_patient(self, patient_id, update_data):
+        """Set fields on a patient, then invalidate and log it for delta sync"""
+        patient = self.patients_collection.find_one_and_update(
             {'patient_id': patient_id},
-            {'$set': update_data}
+            {'$set': update_data},
+            projection={'_id': 0, 'current_hospital': 1},
+            return_document=ReturnDocument.AFTER
         )
-        return result.modified_count > 0
+        self.cache.invalidate(patient_id)
+        if patient is None:
+            return False
+        self.changes.record(patient.get('current_hospital'), 'patients', patient_id)
+        return True
     
     def update_doctor_report(self, patient_id, doctor_report):
         """Update patient's doctor report"""
@@ -110,11 +164,7 @@ class PatientDataDB:
             'updated_at': datetime.utcnow()
         }
         
-        result = self.patients_collection.update_one(
-            {'patient_id': patient_id},
-            {'$set': update_data}
-        )
-        return result.modified_count > 0
+        return self._update_patient(patient_id, update_data)
     
     def remove_bed_from_patient(self, patient_id):
         """Remove bed assignment from patient"""
@@ -129,11 +179,7 @@ class PatientDataDB:
             'updated_at': datetime.utcnow()
         }
         
-        result = self.patients_collection.update_one(
-            {'patient_id': patient_id},
-            {'$set': update_data}
-        )
-        return result.modified_count > 0
+        return self._update_patient(patient_id, update_data)
     
     def get_patients_in_beds(self):
         """Get all patients currently assigned to beds"""
@@ -194,48 +240,90 @@ class PatientDataDB:
             'department_distribution': department_stats
         }
     
-    def transfer_patient_to_hospital(self, patient_id, new_hospital_id):
-        """Transfer a patient to a different hospital"""
-        patient = self.get_patient_by_id(patient_id)
-        if not patient:
-            raise ValueError(f"Patient with ID {patient_id} not found")
-        
-        # Update admission history
-        if patient.get('current_hospital'):
-            # Close current admission
-            self.patients_collection.update_one(
-                {'patient_id': patient_id, 'admission_history.hospital_id': patient['current_hospital'], 'admission_history.discharge_date': None},
-                {'$set': {'admission_history.$.discharge_date': datetime.utcnow(), 'admission_history.$.status': 'transferred'}}
+    def transfer_patient_to_hospital(self, patient_id, new_hospital_id, bed_info=None, from_hospital_id=None):
+        """Transfer a patient to a different hospital in one write: the open stay is closed as transferred,
+        the new stay appended and the bed assignment replaced (with bed_info, or cleared).
+
+        Returns False without writing if from_hospital_id is given and is not the patient's current
+        hospital. admission_history is rewritten only if it still holds what was read, and the read is
+        retried if another write changed it in between.
+        """
+        moved = self.write_patient_transfer(patient_id, new_hospital_id, bed_info, from_hospital_id)
+        if moved is None:
+            return False
+        self.announce_patient_transfer(*moved, new_hospital_id, bed_info)
+        return True
+
+    def write_patient_transfer(self, patient_id, new_hospital_id, bed_info=None, from_hospital_id=None,
+                               collection=None, session=None):
+        """The write of transfer_patient_to_hospital alone, optionally through another client's collection
+        and session so it can join a transaction. Returns (patient as read, old hospital id), or None if
+        the patient is not at from_hospital_id"""
+        collection = collection if collection is not None else self.patients_collection
+        for _ in range(TRANSFER_WRITE_ATTEMPTS):
+            patient = collection.find_one(
+                {'patient_id': patient_id},
+                {'_id': 0, 'patient_id': 1, 'name': 1, 'bed_info': 1, 'current_hospital': 1, 'admission_history': 1},
+                session=session
             )
-        
-        # Add new admission
-        new_admission = {
-            'hospital_id': new_hospital_id,
-            'admission_date': datetime.utcnow(),
-            'status': 'admitted'
-        }
-        
-        update_data = {
-            'current_hospital': new_hospital_id,
-            'updated_at': datetime.utcnow(),
-            '$push': {'admission_history': new_admission}
-        }
-        
-        # Clear bed info since patient is transferring
-        update_data['is_in_bed'] = False
-        update_data['bed_info'] = {
-            'bed_id': None,
-            'bed_number': None,
-            'room_number': None,
-            'department': None,
-            'hospital_id': None
-        }
-        
-        result = self.patients_collection.update_one(
-            {'patient_id': patient_id},
-            {'$set': update_data}
-        )
-        return result.modified_count > 0
+            if not patient:
+                raise ValueError(f"Patient with ID {patient_id} not found")
+            old_hospital_id = patient.get('current_hospital')
+            if from_hospital_id is not None and old_hospital_id != from_hospital_id:
+                return None
+            if old_hospital_id == new_hospital_id:
+                raise ValueError(f"Patient {patient_id} is already at hospital {new_hospital_id}")
+
+            now = datetime.utcnow()
+            history = patient.get('admission_history')
+            new_history = [
+                {**admission, 'discharge_date': now, 'status': 'transferred'}
+                if old_hospital_id and admission.get('hospital_id') == old_hospital_id and admission.get('discharge_date') is None
+                else admission
+                for admission in history or []
+            ]
+            new_history.append({
+                'hospital_id': new_hospital_id,
+                'admission_date': now,
+                'status': 'admitted'
+            })
+
+            result = collection.update_one(
+                {
+                    'patient_id': patient_id,
+                    'current_hospital': old_hospital_id,
+                    'admission_history': history if history is not None else {'$exists': False}
+                },
+                {'$set': {
+                    'current_hospital': new_hospital_id,
+                    'status': 'admitted',
+                    'admission_history': new_history,
+                    'is_in_bed': bool(bed_info),
+                    'bed_info': bed_info or {
+                        'bed_id': None,
+                        'bed_number': None,
+                        'room_number': None,
+                        'department': None,
+                        'hospital_id': None
+                    },
+                    'updated_at': now
+                }},
+                session=session
+            )
+            if result.matched_count:
+                return patient, old_hospital_id
+        raise ValueError(f"Patient {patient_id} kept changing during the transfer; try again")
+
+    def announce_patient_transfer(self, patient, old_hospital_id, new_hospital_id, bed_info=None):
+        """Cache, change-log and live-screen side of a transfer written by write_patient_transfer"""
+        patient_id = patient['patient_id']
+        self.cache.invalidate(patient_id)
+        # Logged in both hospitals: the old one sees the patient leave, the new one sees the admission
+        self.changes.record(old_hospital_id, 'patients', patient_id)
+        self.changes.record(new_hospital_id, 'patients', patient_id)
+        transfer = {'from_hospital': old_hospital_id, 'to_hospital': new_hospital_id}
+        self._publish(old_hospital_id, 'patient_transferred', patient, **transfer)
+        self._publish(new_hospital_id, 'patient_admitted', {**patient, 'bed_info': bed_info}, **transfer)
     
     def search_patients(self, search_term):
         """Search patients by name or patient_id"""
@@ -254,7 +342,7 @@ class PatientDataDB:
     
     def discharge_patient(self, patient_id):
         """Discharge a patient"""
-        patient = self.get_patient_by_id(patient_id)
+        patient = self.get_patient_by_id(patient_id, cached=False)
         if not patient:
             return False
         
@@ -297,12 +385,22 @@ class PatientDataDB:
             {'patient_id': patient_id},
             {'$set': update_data}
         )
+        self.cache.invalidate(patient_id)
+        self.changes.record(patient.get('current_hospital'), 'patients', patient_id)
+        if result.modified_count > 0:
+            self._publish(patient.get('current_hospital'), 'patient_discharged', patient,
+                          bed_id=(patient.get('bed_info') or {}).get('bed_id'))
         return result.modified_count > 0
     
     def delete_patient(self, patient_id):
         """Delete a patient record"""
-        result = self.patients_collection.delete_one({'patient_id': patient_id})
-        return result.deleted_count > 0
+        patient = self.patients_collection.find_one_and_delete({'patient_id': patient_id},
+                                                               projection={'_id': 0, 'current_hospital': 1})
+        self.cache.invalidate(patient_id)
+        if patient is None:
+            return False
+        self.changes.record(patient.get('current_hospital'), 'patients', patient_id)
+        return True
     
     def get_patient_statistics(self):
         """Get statistics about patients"""
@@ -0,0 +1,137 @@
+"""
+Patient Flow Analytics for Hospital Management
+Length of stay, admissions and discharges per hour and bed turnover, computed over whole days
+from admission_history and the bed occupancy history
+"""
+
+from datetime import datetime, timedelta
+import numpy as np
+
+from cache import LRUCache
+
+# Length-of-stay histogram bin edges, in days (the last bin is open-ended)
+LOS_BIN_EDGES_DAYS = [0, 1, 2, 3, 5, 7, 14, 30]
+
+# Longest window one report may cover
+PATIENT_FLOW_MAX_DAYS = 366
+
+HOUR_MS = 3600 * 1000
+
+
+def _to_ms(values):
+    return np.array(values, dtype='datetime64[ms]').astype(np.int64)
+
+
+class PatientFlowAnalytics:
+    def __init__(self, patients_db, beds_db):
+        """Analytics on top of an existing PatientDataDB and HospitalBedsDB"""
+        self.patients_collection = patients_db.patients_collection
+        self.occupancy = beds_db.occupancy
+        # (hospital_id, first day, last day) -> report; reports cover whole past days, so they never change
+        self._reports = LRUCache(maxsize=256)
+
+    def _load_stays(self, hospital_id, start, end):
+        """Every stay at the hospital overlapping [start, end), unwound from admission_history in one aggregation"""
+        stays = self.patients_collection.aggregate([
+            {'$match': {'admission_history': {'$elemMatch': {'hospital_id': hospital_id, 'admission_date': {'$lt': end}}}}},
+            {'$unwind': '$admission_history'},
+            {'$match': {
+                'admission_history.hospital_id': hospital_id,
+                'admission_history.admission_date': {'$lt': end},
+                '$or': [
+                    {'admission_history.discharge_date': None},
+                    {'admission_history.discharge_date': {'$gte': start}}
+                ]
+            }},
+            {'$project': {
+                '_id': 0,
+                'admitted': '$admission_history.admission_date',
+                'left': '$admission_history.discharge_date',
+                'status': '$admission_history.status'
+            }}
+        ])
+
+        admitted, left, transferred = [], [], []
+        for stay in stays:
+            admitted.append(stay['admitted'])
+            left.append(stay.get('left') or 'NaT')
+            transferred.append(stay.get('status') == 'transferred')
+        return _to_ms(admitted), np.array(left, dtype='datetime64[ms]'), np.array(transferred, dtype=bool)
+
+    @staticmethod
+    def _per_hour(times, start_ms, hours):
+        """Count of times in each hour of the window"""
+        return np.bincount((times - start_ms) // HOUR_MS, minlength=hours)[:hours]
+
+    def report(self, hospital_id, days=30):
+        """Length of stay, hourly admissions and discharges, and bed turnover over the last whole days"""
+        if not 1 <= days <= PATIENT_FLOW_MAX_DAYS:
+            raise ValueError(f"days must be between 1 and {PATIENT_FLOW_MAX_DAYS}")
+        end = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        start = end - timedelta(days=days)
+
+        key = (hospital_id, start, end)
+        report = self._reports.get(key)
+        if report is None:
+            report = self._compute(hospital_id, start, end)
+            self._reports.set(key, report)
+        return report
+
+    def _compute(self, hospital_id, start, end):
+        start_ms, end_ms = _to_ms([start, end])
+        hours = (end_ms - start_ms) // HOUR_MS
+        admitted, left_at, transferred = self._load_stays(hospital_id, start, end)
+        has_left = ~np.isnat(left_at)
+        left = np.where(has_left, left_at.astype(np.int64), end_ms)
+
+        admitted_in_window = (admitted >= start_ms) & (admitted < end_ms)
+        left_in_window = has_left & (left >= start_ms) & (left < end_ms)
+        admissions = self._per_hour(admitted[admitted_in_window], start_ms, hours)
+        discharges = self._per_hour(left[left_in_window], start_ms, hours)
+
+        # Length of stay of the stays that ended in the window
+        los_days = (left[left_in_window] - admitted[left_in_window]) / (24 * HOUR_MS)
+        edges = np.append(LOS_BIN_EDGES_DAYS, np.inf)
+        counts, _ = np.histogram(los_days, bins=edges)
+        length_of_stay = {
+            'completed_stays': int(len(los_days)),
+            'mean_days': round(float(los_days.mean()), 2) if len(los_days) else None,
+            'median_days': round(float(np.median(los_days)), 2) if len(los_days) else None,
+            'p90_days': round(float(np.percentile(los_days, 90)), 2) if len(los_days) else None,
+            'histogram': [
+                {'from_days': LOS_BIN_EDGES_DAYS[i], 'to_days': LOS_BIN_EDGES_DAYS[i + 1] if i + 1 < len(LOS_BIN_EDGES_DAYS) else None,
+                 'stays': int(count)}
+                for i, count in enumerate(counts)
+            ],
+            # Still admitted at the end of the window, counted up to it
+            'open_stays': int((~has_left | (left >= end_ms)).sum())
+        }
+
+        days = hours // 24
+        turnover = self.occupancy.turnover(hospital_id, start, end)
+        return {
+            'hospital_id': hospital_id,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'length_of_stay': length_of_stay,
+            'admissions': int(admissions.sum()),
+            'discharges': int(discharges.sum()),
+            'transfers_out': int((left_in_window & transferred).sum()),
+            'hourly': {
+                'admissions': admissions.tolist(),
+                'discharges': discharges.tolist()
+            },
+            # Mean per hour of the day, to show when admissions and discharges peak
+            'by_hour_of_day': {
+                'admissions': np.round(admissions.reshape(days, 24).mean(axis=0), 2).tolist(),
+                'discharges': np.round(discharges.reshape(days, 24).mean(axis=0), 2).tolist()
+            },
+            'bed_turnover': {
+                department: {
+                    **values,
+                    'mean_beds': round(values['mean_beds'], 2),
+                    'turnover_per_bed': round(values['vacated'] / values['mean_beds'], 2) if values['mean_beds'] else None
+                }
+                for department, values in sorted(turnover.items())
+            }
+        }
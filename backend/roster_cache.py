@@ -0,0 +1,208 @@
+"""
+Live On-Duty Roster for Hospital Management
+In-process roster per hospital and department, keyed by staff status
+"""
+
+from datetime import datetime, timedelta
+from threading import RLock
+import os
+import time
+
+# How often a worker re-reads staff changed by other workers or scripts
+ROSTER_POLL_SECONDS = float(os.getenv('ROSTER_POLL_SECONDS', 5))
+
+# Each poll re-reads this far behind the newest updated_at it has seen, for writes committed out of order
+ROSTER_POLL_OVERLAP_SECONDS = 1
+
+# Only these fields are kept per staff member
+ROSTER_FIELDS = {
+    '_id': 0,
+    'staff_id': 1,
+    'hospital_id': 1,
+    'full_name': 1,
+    'role': 1,
+    'department': 1,
+    'shift': 1,
+    'current_status': 1,
+    'current_location': 1,
+    'is_active': 1,
+    'caseload': 1,
+    'updated_at': 1
+}
+
+
+class RosterCache:
+    def __init__(self, staff_collection, poll_interval=ROSTER_POLL_SECONDS):
+        """Roster of active staff: hospital -> department -> status -> staff_ids"""
+        self.staff_collection = staff_collection
+        self.poll_interval = poll_interval
+        self._lock = RLock()
+        self._staff = {}       # hospital_id -> {staff_id: entry}
+        self._index = {}       # hospital_id -> {department: {status: set(staff_id)}}
+        self._watermark = None
+        self._last_poll = 0.0
+        # Bumped whenever someone joins, leaves or changes status/department, or a caseload drops
+        # (rises are left to readers to check, so a run of assignments does not bump it every time)
+        self.version = 0
+
+    def _ensure_loaded(self, hospital_id):
+        """Load a hospital's roster with one projected query the first time it is asked for"""
+        self._poll()
+        with self._lock:
+            if hospital_id in self._staff:
+                return
+
+        loaded_at = datetime.utcnow()
+        entries = list(self.staff_collection.find({'hospital_id': hospital_id, 'is_active': True}, ROSTER_FIELDS))
+
+        with self._lock:
+            if hospital_id in self._staff:
+                return
+            self._staff[hospital_id] = {}
+            self._index[hospital_id] = {}
+            for entry in entries:
+                self._put(entry)
+            if self._watermark is None:
+                self._watermark = max((entry['updated_at'] for entry in entries if entry.get('updated_at')),
+                                      default=loaded_at)
+
+    def _put(self, entry):
+        """Insert or move one staff entry (caller holds the lock)"""
+        hospital_id = entry.get('hospital_id')
+        staff = self._staff.get(hospital_id)
+        if staff is None:
+            return  # Hospital not loaded yet; it will be read fresh when needed
+
+        previous = staff.get(entry['staff_id'])
+        if previous is None or not entry.get('is_active', True) or \
+                (previous.get('department'), previous.get('current_status')) != \
+                (entry.get('department'), entry.get('current_status')) or \
+                (entry.get('caseload') or 0) < (previous.get('caseload') or 0):
+            self.version += 1
+
+        self._remove(hospital_id, entry['staff_id'])
+        if not entry.get('is_active', True):
+            return
+
+        staff[entry['staff_id']] = entry
+        departments = self._index[hospital_id]
+        statuses = departments.setdefault(entry.get('department'), {})
+        statuses.setdefault(entry.get('current_status', 'off_duty'), set()).add(entry['staff_id'])
+
+    def _remove(self, hospital_id, staff_id):
+        """Drop one staff entry from the roster (caller holds the lock)"""
+        previous = self._staff.get(hospital_id, {}).pop(staff_id, None)
+        if previous is None:
+            return
+        statuses = self._index[hospital_id].get(previous.get('department'), {})
+        members = statuses.get(previous.get('current_status', 'off_duty'))
+        if members:
+            members.discard(staff_id)
+
+    def apply(self, entry):
+        """Feed a staff write (document with ROSTER_FIELDS) into the roster"""
+        if not entry or 'staff_id' not in entry:
+            return
+        with self._lock:
+            # A move between hospitals must leave the old hospital's roster
+            for hospital_id, staff in self._staff.items():
+                if hospital_id != entry.get('hospital_id') and entry['staff_id'] in staff:
+                    self._remove(hospital_id, entry['staff_id'])
+            self._put(entry)
+
+    def invalidate(self, hospital_id=None):
+        """Forget a hospital's roster (or all of them); the next read reloads it"""
+        with self._lock:
+            self.version += 1
+            if hospital_id is None:
+                self._staff.clear()
+                self._index.clear()
+                self._watermark = None
+            else:
+                self._staff.pop(hospital_id, None)
+                self._index.pop(hospital_id, None)
+
+    def on_change(self, event):
+        """Change watcher callback for the staff collection"""
+        document = event['document']
+        if document is None or 'staff_id' not in document:
+            # Deleted or dropped: which hospital it belonged to is not known
+            self.invalidate()
+        else:
+            self.apply({field: document.get(field) for field in ROSTER_FIELDS if field != '_id'})
+
+    def _poll(self):
+        """Pick up staff changed by other workers since the last poll"""
+        if self.poll_interval <= 0 or time.monotonic() - self._last_poll < self.poll_interval:
+            return
+        with self._lock:
+            self._last_poll = time.monotonic()
+            if self._watermark is None or not self._staff:
+                return
+            since = self._watermark
+            hospital_ids = list(self._staff)
+
+        # The watermark follows the updated_at values actually read, never this process's clock;
+        # entries re-read inside the overlap are applied again, which changes nothing
+        changed = list(self.staff_collection.find(
+            {'hospital_id': {'$in': hospital_ids},
+             'updated_at': {'$gte': since - timedelta(seconds=ROSTER_POLL_OVERLAP_SECONDS)}},
+            ROSTER_FIELDS
+        ))
+
+        with self._lock:
+            for entry in changed:
+                self.apply(entry)
+            if self._watermark is not None:
+                self._watermark = max([self._watermark] + [entry['updated_at'] for entry in changed])
+
+    def get_staff(self, hospital_id, statuses, department=None):
+        """Roster entries with one of the given statuses, optionally for one department"""
+        self._ensure_loaded(hospital_id)
+        with self._lock:
+            staff = self._staff.get(hospital_id, {})
+            departments = self._index.get(hospital_id, {})
+            if department is not None:
+                departments = {department: departments.get(department, {})}
+            return [
+                dict(staff[staff_id])
+                for dept_statuses in departments.values()
+                for status in statuses
+                for staff_id in dept_statuses.get(status, ())
+            ]
+
+    def sync(self, hospital_id):
+        """Load the hospital if needed, pick up recent changes and return the roster version"""
+        self._ensure_loaded(hospital_id)
+        return self.version
+
+    def get_entry(self, hospital_id, staff_id):
+        """One staff member's roster entry, or None if not active in the hospital"""
+        self._ensure_loaded(hospital_id)
+        with self._lock:
+            entry = self._staff.get(hospital_id, {}).get(staff_id)
+            return dict(entry) if entry else None
+
+    def get_on_duty(self, hospital_id, department=None):
+        """Who is on duty right now, optionally in one department"""
+        return self.get_staff(hospital_id, ['on_duty'], department)
+
+    def count(self, hospital_id, department, status='on_duty'):
+        """Number of staff with a status in a department"""
+        self._ensure_loaded(hospital_id)
+        with self._lock:
+            return len(self._index.get(hospital_id, {}).get(department, {}).get(status, ()))
+
+    def get_department_counts(self, hospital_id):
+        """Per-department totals and per-status counts"""
+        self._ensure_loaded(hospital_id)
+        with self._lock:
+            counts = {}
+            for department, statuses in self._index.get(hospital_id, {}).items():
+                by_status = {status: len(members) for status, members in statuses.items() if members}
+                counts[department] = {
+                    'total': sum(by_status.values()),
+                    'on_duty': by_status.get('on_duty', 0),
+                    'by_status': by_status
+                }
+            return counts
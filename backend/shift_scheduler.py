@@ -0,0 +1,283 @@
+"""
+Shift Scheduler for Hospital Management
+Builds a week of staff_schedules from the roster and per-department minimum coverage
+"""
+
+from pymongo import ASCENDING
+from datetime import datetime, timedelta, time
+import os
+
+# Minimum staff per department per shift; also the staffing alert threshold
+MIN_DEPARTMENT_COVERAGE = int(os.getenv('MIN_DEPARTMENT_COVERAGE', 2))
+
+# Shift templates: name -> (start time, length in hours)
+SHIFTS = {
+    'day': (time(7, 0), 12),
+    'night': (time(19, 0), 12)
+}
+
+# Shifts a staff member's `shift` preference allows
+SHIFT_ELIGIBILITY = {
+    'day': ('day',),
+    'night': ('night',),
+    'rotating': ('day', 'night')
+}
+
+# Contracted shifts per week by employment type
+MAX_SHIFTS_PER_WEEK = {
+    'full_time': 4,
+    'part_time': 2,
+    'contract': 3
+}
+
+SCHEDULER_NAME = 'shift_scheduler'
+
+
+class ShiftScheduler:
+    def __init__(self, staff_db, hospitals_collection):
+        """Scheduling on top of an existing StaffManagementDB"""
+        self.staff_db = staff_db
+        self.staff_collection = staff_db.staff_collection
+        self.schedules_collection = staff_db.schedules_collection
+        self.hospitals_collection = hospitals_collection
+
+    def _load_staff(self, hospital_id, roles=None):
+        """Active staff for a hospital with only the fields the scheduler needs"""
+        query = {'hospital_id': hospital_id, 'is_active': True}
+        if roles:
+            query['role'] = {'$in': roles}
+        return list(self.staff_collection.find(
+            query,
+            {'_id': 0, 'staff_id': 1, 'full_name': 1, 'role': 1, 'department': 1,
+             'shift': 1, 'employment_type': 1}
+        ).sort('staff_id', ASCENDING))
+
+    def _coverage_requirements(self, hospital_id, departments, min_coverage=None):
+        """Required staff per shift for each department"""
+        hospital = self.hospitals_collection.find_one({'hospital_id': hospital_id}, {'departments': 1}) or {}
+        # Departments the hospital declares get the alert threshold; others are staffed but not required
+        required = {dept: 0 for dept in departments}
+        for dept in hospital.get('departments', []):
+            required[dept] = MIN_DEPARTMENT_COVERAGE
+
+        if isinstance(min_coverage, dict):
+            required.update({dept: int(count) for dept, count in min_coverage.items()})
+        elif min_coverage is not None:
+            required = {dept: int(min_coverage) if count else 0 for dept, count in required.items()}
+        return required
+
+    def _existing_shifts(self, staff_ids, week_start):
+        """Shifts already on the books from the day before week_start to the end of the week, other
+        than a previous run of the scheduler for this week (which generate_week replaces)"""
+        return list(self.schedules_collection.find(
+            {
+                'staff_id': {'$in': list(staff_ids)},
+                'date': {'$gte': week_start - timedelta(days=1), '$lt': week_start + timedelta(days=7)},
+                '$or': [{'generated_by': {'$ne': SCHEDULER_NAME}}, {'date': {'$lt': week_start}}]
+            },
+            {'_id': 0, 'staff_id': 1, 'date': 1, 'shift': 1, 'shift_start': 1, 'department': 1}
+        ))
+
+    @staticmethod
+    def _shift_name(schedule):
+        """Template a schedule falls in; hand-written ones are placed by their start time"""
+        if schedule.get('shift') in SHIFTS:
+            return schedule['shift']
+        start = schedule.get('shift_start')
+        if isinstance(start, datetime) and not SHIFTS['day'][0] <= start.time() < SHIFTS['night'][0]:
+            return 'night'
+        return 'day'
+
+    def build_week(self, hospital_id, week_start, min_coverage=None, roles=None):
+        """Greedy-with-repair assignment of staff to shifts for the seven days from week_start"""
+        week_start = datetime.combine(week_start.date(), time.min)
+        staff = self._load_staff(hospital_id, roles)
+        by_id = {member['staff_id']: member for member in staff}
+
+        candidates = {}  # (department, shift) -> [staff_id]
+        for member in staff:
+            for shift in SHIFT_ELIGIBILITY.get(member.get('shift', 'day'), ('day',)):
+                candidates.setdefault((member.get('department', ''), shift), []).append(member['staff_id'])
+
+        required = self._coverage_requirements(hospital_id, {m.get('department', '') for m in staff}, min_coverage)
+        days = range(7)
+
+        capacity = {sid: MAX_SHIFTS_PER_WEEK.get(m.get('employment_type'), MAX_SHIFTS_PER_WEEK['full_time'])
+                    for sid, m in by_id.items()}
+        load = dict.fromkeys(by_id, 0)
+        worked = {sid: {} for sid in by_id}  # staff_id -> {day: shift}
+        slots = {}  # (department, day, shift) -> [staff_id]
+        booked = set()  # (staff_id, day) already scheduled outside this run; never moved or re-emitted
+
+        # Shifts entered by hand count against capacity and coverage, and the day before the week
+        # is loaded so the rest rule holds across the week boundary
+        for schedule in self._existing_shifts(by_id, week_start):
+            if not isinstance(schedule.get('date'), datetime):
+                continue
+            staff_id = schedule['staff_id']
+            day = (datetime.combine(schedule['date'].date(), time.min) - week_start).days
+            if day in worked[staff_id]:
+                continue
+            shift = self._shift_name(schedule)
+            worked[staff_id][day] = shift
+            booked.add((staff_id, day))
+            if day in days:
+                load[staff_id] += 1
+                dept = schedule.get('department') or by_id[staff_id].get('department', '')
+                slots.setdefault((dept, day, shift), []).append(staff_id)
+
+        def can_work(staff_id, day, shift):
+            if day in worked[staff_id]:
+                return False
+            # No day shift the morning after a night shift, and no night before a day shift
+            if shift == 'day' and worked[staff_id].get(day - 1) == 'night':
+                return False
+            if shift == 'night' and worked[staff_id].get(day + 1) == 'day':
+                return False
+            return True
+
+        def assign(staff_id, dept, day, shift):
+            worked[staff_id][day] = shift
+            load[staff_id] += 1
+            slots.setdefault((dept, day, shift), []).append(staff_id)
+
+        def unassign(staff_id, dept, day, shift):
+            del worked[staff_id][day]
+            load[staff_id] -= 1
+            slots[(dept, day, shift)].remove(staff_id)
+
+        def pick(dept, day, shift):
+            """Least-loaded eligible candidate with spare capacity"""
+            best = None
+            for staff_id in candidates.get((dept, shift), ()):
+                if load[staff_id] >= capacity[staff_id] or not can_work(staff_id, day, shift):
+                    continue
+                if best is None or load[staff_id] < load[best]:
+                    best = staff_id
+            return best
+
+        # Phase 1: fill minimum coverage, scarcest slots first
+        demand = [
+            (dept, day, shift)
+            for dept, count in required.items() if count > 0
+            for day in days
+            for shift in SHIFTS
+        ]
+        demand.sort(key=lambda s: len(candidates.get((s[0], s[2]), ())) / required[s[0]])
+
+        gaps = []
+        for dept, day, shift in demand:
+            while len(slots.get((dept, day, shift), ())) < required[dept]:
+                staff_id = pick(dept, day, shift)
+                if staff_id is None:
+                    break
+                assign(staff_id, dept, day, shift)
+            if len(slots.get((dept, day, shift), ())) < required[dept]:
+                gaps.append((dept, day, shift))
+
+        def repair(dept, day, shift):
+            """Free a blocked candidate for a short slot by handing one of their shifts to someone else"""
+            target = (dept, day, shift)
+            for staff_id in candidates.get((dept, shift), ()):
+                if staff_id in slots.get(target, ()):
+                    continue
+                for other_day, other_shift in list(worked[staff_id].items()):
+                    if (staff_id, other_day) in booked:
+                        continue
+                    other = (dept, other_day, other_shift)
+                    unassign(staff_id, *other)
+                    if load[staff_id] < capacity[staff_id] and can_work(staff_id, day, shift):
+                        assign(staff_id, *target)
+                        # The shift given away must stay covered
+                        if len(slots[other]) >= required[dept]:
+                            return True
+                        replacement = pick(*other)
+                        if replacement is not None:
+                            assign(replacement, *other)
+                            return True
+                        unassign(staff_id, *target)
+                    assign(staff_id, *other)
+            return False
+
+        # Phase 2: repair the gaps with one-step swaps
+        for dept, day, shift in gaps:
+            while len(slots.get((dept, day, shift), ())) < required[dept] and repair(dept, day, shift):
+                pass
+
+        # Phase 3: top staff up to their contracted shifts, on the thinnest slots of their department
+        for staff_id in by_id:
+            member = by_id[staff_id]
+            dept = member.get('department', '')
+            eligible = SHIFT_ELIGIBILITY.get(member.get('shift', 'day'), ('day',))
+            while load[staff_id] < capacity[staff_id]:
+                options = [(len(slots.get((dept, day, shift), ())), day, shift)
+                           for day in days for shift in eligible if can_work(staff_id, day, shift)]
+                if not options:
+                    break
+                _, day, shift = min(options)
+                assign(staff_id, dept, day, shift)
+
+        schedules = []
+        for (dept, day, shift), staff_ids in slots.items():
+            start_time, hours = SHIFTS[shift]
+            date = week_start + timedelta(days=day)
+            shift_start = datetime.combine(date.date(), start_time)
+            for staff_id in staff_ids:
+                if (staff_id, day) in booked:
+                    continue
+                schedules.append({
+                    'hospital_id': hospital_id,
+                    'staff_id': staff_id,
+                    'date': date,
+                    'shift': shift,
+                    'shift_start': shift_start,
+                    'shift_end': shift_start + timedelta(hours=hours),
+                    'break_times': [],
+                    'department': dept,
+                    'role': by_id[staff_id].get('role', ''),
+                    'location': {},
+                    'notes': '',
+                    'generated_by': SCHEDULER_NAME,
+                    'created_at': datetime.utcnow()
+                })
+        schedules.sort(key=lambda s: (s['shift_start'], s['department'], s['staff_id']))
+
+        coverage = []
+        for dept in sorted(required):
+            for day in days:
+                for shift in SHIFTS:
+                    assigned = len(slots.get((dept, day, shift), ()))
+                    coverage.append({
+                        'department': dept,
+                        'date': (week_start + timedelta(days=day)).date().isoformat(),
+                        'shift': shift,
+                        'required': required[dept],
+                        'assigned': assigned,
+                        'shortfall': max(required[dept] - assigned, 0)
+                    })
+
+        return {
+            'week_start': week_start,
+            'schedules': schedules,
+            'coverage': coverage,
+            'gaps': [c for c in coverage if c['shortfall'] > 0],
+            'unscheduled_staff': [sid for sid in by_id if load[sid] == 0]
+        }
+
+    def generate_week(self, hospital_id, week_start, min_coverage=None, roles=None, dry_run=False):
+        """Build a week's schedule and replace any previously generated one in bulk"""
+        result = self.build_week(hospital_id, week_start, min_coverage, roles)
+        if not dry_run:
+            week_end = result['week_start'] + timedelta(days=7)
+            # Hand-written schedules are left alone; only a previous run is replaced
+            self.schedules_collection.delete_many({
+                'hospital_id': hospital_id,
+                'date': {'$gte': result['week_start'], '$lt': week_end},
+                'generated_by': SCHEDULER_NAME
+            })
+            if result['schedules']:
+                self.schedules_collection.insert_many(result['schedules'], ordered=False)
+                for schedule in result['schedules']:
+                    schedule['_id'] = str(schedule['_id'])
+            self.staff_db.coverage.invalidate(hospital_id)
+        return result
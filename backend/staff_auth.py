@@ -0,0 +1,204 @@
+"""
+Staff Authentication for Hospital Management
+Salted PBKDF2 password hashes, signed session tokens and batched last_login writes
+"""
+
+from pymongo import UpdateOne
+from datetime import datetime
+from threading import Lock, Timer
+import atexit
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+
+from cache import entity_cache
+
+# Work factor for new hashes; raising it upgrades existing hashes as staff log in
+PASSWORD_HASH_ITERATIONS = int(os.getenv('PASSWORD_HASH_ITERATIONS', 260000))
+PASSWORD_HASH_ALGORITHM = 'pbkdf2_sha256'
+
+SESSION_TTL_HOURS = float(os.getenv('SESSION_TTL_HOURS', 12))
+LAST_LOGIN_FLUSH_SECONDS = float(os.getenv('LAST_LOGIN_FLUSH_SECONDS', 5))
+
+_SESSION_SECRET = os.getenv('SESSION_SECRET')
+if not _SESSION_SECRET:
+    # Tokens from one process will not verify in another; set SESSION_SECRET when running several workers
+    print("Warning: SESSION_SECRET is not set; using a random per-process session secret")
+    _SESSION_SECRET = secrets.token_hex(32)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def hash_password(password, iterations=PASSWORD_HASH_ITERATIONS):
+    """Salted PBKDF2-SHA256 hash stored as algorithm$iterations$salt$hash"""
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations)
+    return f"{PASSWORD_HASH_ALGORITHM}${iterations}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def verify_password(password, stored_hash):
+    """Check a password against a stored hash, including legacy unsalted SHA-256 hex digests"""
+    if not stored_hash:
+        return False
+    if '$' not in stored_hash:
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        return hmac.compare_digest(legacy, stored_hash)
+
+    try:
+        algorithm, iterations, salt, digest = stored_hash.split('$')
+        if algorithm != PASSWORD_HASH_ALGORITHM:
+            return False
+        candidate = hashlib.pbkdf2_hmac('sha256', password.encode(), _b64decode(salt), int(iterations))
+    except ValueError:
+        return False
+    return hmac.compare_digest(candidate, _b64decode(digest))
+
+
+def needs_rehash(stored_hash):
+    """Legacy hashes and hashes below the current work factor are upgraded on the next login"""
+    if not stored_hash or '$' not in stored_hash:
+        return True
+    algorithm, iterations = stored_hash.split('$')[:2]
+    return algorithm != PASSWORD_HASH_ALGORITHM or int(iterations) < PASSWORD_HASH_ITERATIONS
+
+
+def issue_session_token(staff, ttl_hours=SESSION_TTL_HOURS):
+    """HMAC-signed token carrying the staff identity; verifiable without a database read"""
+    now = int(time.time())
+    payload = {
+        'sid': staff['staff_id'],
+        'hid': staff.get('hospital_id'),
+        'role': staff.get('role'),
+        'perm': staff.get('permissions', []),
+        'iat': now,
+        'exp': now + int(ttl_hours * 3600)
+    }
+    body = _b64encode(json.dumps(payload, separators=(',', ':')).encode())
+    signature = hmac.new(_SESSION_SECRET.encode(), body.encode(), hashlib.sha256).digest()
+    return f"{body}.{_b64encode(signature)}"
+
+
+def verify_session_token(token, is_active=None):
+    """Payload of a valid, unexpired token, otherwise None.
+
+    is_active(staff_id, hospital_id), when given, is asked last so deactivated staff lose their sessions.
+    """
+    try:
+        body, signature = token.split('.')
+        expected = hmac.new(_SESSION_SECRET.encode(), body.encode(), hashlib.sha256).digest()
+        if not hmac.compare_digest(expected, _b64decode(signature)):
+            return None
+        payload = json.loads(_b64decode(body))
+    except (ValueError, AttributeError):
+        return None
+    if payload.get('exp', 0) < time.time():
+        return None
+    if is_active is not None and not is_active(payload.get('sid'), payload.get('hid')):
+        return None
+    return payload
+
+
+class LastLoginBuffer:
+    def __init__(self, staff_collection, flush_seconds=LAST_LOGIN_FLUSH_SECONDS):
+        """Collects last_login timestamps and writes them in one bulk_write per flush window"""
+        self.staff_collection = staff_collection
+        self.flush_seconds = flush_seconds
+        self._lock = Lock()
+        self._pending = {}  # staff document _id -> (staff_id, login time)
+        self._timer = None
+        self.cache = entity_cache('staff', 'staff_id')
+        atexit.register(self.flush)
+
+    def record(self, staff, login_time):
+        """Queue a login; the first one in a window schedules the flush"""
+        with self._lock:
+            self._pending[staff['_id']] = (staff['staff_id'], login_time)
+            if self._timer is None:
+                self._timer = Timer(self.flush_seconds, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Write every queued last_login"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._timer = None
+        if not pending:
+            return
+        try:
+            self.staff_collection.bulk_write([
+                UpdateOne({'_id': _id}, {'$max': {'last_login': login_time, 'updated_at': login_time}})
+                for _id, (staff_id, login_time) in pending.items()
+            ], ordered=False)
+        except Exception as e:
+            print(f"Error writing last_login batch: {e}")
+        self.cache.invalidate(*(staff_id for staff_id, _ in pending.values()))
+
+
+class StaffAuthenticator:
+    def __init__(self, staff_collection):
+        """Login against the staff collection"""
+        self.staff_collection = staff_collection
+        self.last_logins = LastLoginBuffer(staff_collection)
+        # Verified against when the identifier is unknown so both paths cost the same
+        self._dummy_hash = hash_password(secrets.token_hex(8))
+
+    def _find_by_identifier(self, identifier, hospital_id=None):
+        """Active staff with an email or staff_id; both are only unique within a hospital"""
+        field = 'email' if '@' in identifier else 'staff_id'
+        query = {field: identifier, 'is_active': True}
+        if hospital_id:
+            query['hospital_id'] = hospital_id
+        return list(self.staff_collection.find(query))
+
+    def authenticate(self, identifier, password, hospital_id=None):
+        """Staff document (without the hash) for valid credentials, otherwise None.
+
+        Raises ValueError when the credentials fit staff in more than one hospital and no hospital_id is given.
+        """
+        candidates = self._find_by_identifier(identifier, hospital_id)
+        if not candidates:
+            verify_password(password, self._dummy_hash)
+            return None
+
+        matches = [staff for staff in candidates if verify_password(password, staff.get('password_hash'))]
+        if not matches:
+            return None
+        if len(matches) > 1:
+            raise ValueError("These credentials match staff in more than one hospital; include hospital_id")
+
+        staff = matches[0]
+        stored_hash = staff.get('password_hash')
+
+        if needs_rehash(stored_hash):
+            # Compare-and-set so a concurrent password change is never overwritten
+            self.staff_collection.update_one(
+                {'_id': staff['_id'], 'password_hash': stored_hash},
+                {'$set': {'password_hash': hash_password(password)}}
+            )
+
+        login_time = datetime.utcnow()
+        self.last_logins.record(staff, login_time)
+
+        staff['_id'] = str(staff['_id'])
+        staff['last_login'] = login_time
+        # Don't return password hash
+        del staff['password_hash']
+        return staff
+
+    def login(self, identifier, password, hospital_id=None):
+        """Authenticate and issue a session token"""
+        staff = self.authenticate(identifier, password, hospital_id)
+        if staff is None:
+            return None
+        return {'staff': staff, 'token': issue_session_token(staff), 'expires_in': int(SESSION_TTL_HOURS * 3600)}
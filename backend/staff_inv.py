@@ -1,13 +1,28 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, ASCENDING, DESCENDING, ReturnDocument, UpdateOne, UpdateMany
 from datetime import datetime, timedelta, time
 from bson.objectid import ObjectId
 import os
-import hashlib
+import secrets
 from dotenv import load_dotenv
 
+from roster_cache import RosterCache, ROSTER_FIELDS
+from coverage_index import CoverageTimeline
+from staff_auth import StaffAuthenticator, hash_password
+from cache import entity_cache
+from events import event_bus
+from change_log import ChangeLog
+from transactions import AtomicWriter
+
 # Load environment variables
 load_dotenv()
 
+# Statuses that count as leave when deriving the employment status older clients read
+LEAVE_STATUSES = ['vacation', 'sick_leave', 'emergency_leave']
+EMPLOYMENT_STATUSES = ['active', 'on_leave', 'inactive']
+
+# Roster fields sent to live screens when a staff member's status changes
+STAFF_EVENT_FIELDS = ['staff_id', 'full_name', 'role', 'department', 'current_status', 'current_location', 'is_active']
+
 class StaffManagementDB:
     def __init__(self):
         """Initialize MongoDB connection"""
@@ -17,13 +32,102 @@ class StaffManagementDB:
         self.attendance_collection = self.db.staff_attendance
         self.schedules_collection = self.db.staff_schedules
         self.patient_assignments_collection = self.db.patient_assignments
-        
+        self.roster = RosterCache(self.staff_collection)
+        self.coverage = CoverageTimeline(self.schedules_collection, self.staff_collection)
+        self.auth = StaffAuthenticator(self.staff_collection)
+        self.cache = entity_cache('staff', 'staff_id')
+        self.changes = ChangeLog(self.db)
+        event_bus.share(self.db.hospital_events)
+        self._atomic = AtomicWriter(self.client)
+        self.ensure_indexes()
+        self._migrate_legacy_staff()
+        self._backfill_caseloads()
+        self.cache.clear()
+
+    def ensure_indexes(self):
+        """Create the indexes used by the staff queries (idempotent)"""
+        try:
+            self.staff_collection.create_index('staff_id')
+            # Login looks staff up by exactly one of these
+            self.staff_collection.create_index('email')
+            self.staff_collection.create_index([('hospital_id', ASCENDING), ('department', ASCENDING)])
+            # Roster polling reads recently changed staff per hospital
+            self.staff_collection.create_index([('hospital_id', ASCENDING), ('updated_at', ASCENDING)])
+            self.attendance_collection.create_index([('staff_id', ASCENDING), ('clock_out', ASCENDING)])
+            self.attendance_collection.create_index([('hospital_id', ASCENDING), ('date', ASCENDING)])
+            self.patient_assignments_collection.create_index([('staff_id', ASCENDING), ('is_active', ASCENDING)])
+            self.patient_assignments_collection.create_index([('patient_id', ASCENDING), ('is_active', ASCENDING)])
+            self.schedules_collection.create_index([('staff_id', ASCENDING), ('date', ASCENDING)])
+            self.schedules_collection.create_index([('hospital_id', ASCENDING), ('date', ASCENDING)])
+        except Exception as e:
+            print(f"Error creating staff indexes: {e}")
+        
+    def _migrate_legacy_staff(self):
+        """Fill canonical fields on staff written by the old StaffManager (name/employee_type/status)"""
+        try:
+            self.staff_collection.update_many(
+                {'is_active': {'$exists': False}},
+                [{'$set': {
+                    'is_active': {'$ne': [{'$ifNull': ['$status', 'active']}, 'inactive']},
+                    'current_status': {'$ifNull': [
+                        '$current_status',
+                        {'$cond': [{'$eq': ['$status', 'on_leave']}, 'vacation', 'off_duty']}
+                    ]},
+                    'full_name': {'$ifNull': ['$full_name', '$name']},
+                    'role': {'$ifNull': ['$role', {'$toLower': {'$ifNull': ['$employee_type', '']}}]},
+                    'shift': {'$toLower': {'$ifNull': ['$shift', 'day']}},
+                    'updated_at': datetime.utcnow()
+                }}]
+            )
+        except Exception as e:
+            print(f"Error migrating legacy staff fields: {e}")
+
+    def _backfill_caseloads(self):
+        """Give staff created before caseload counters existed a counter matching their array"""
+        try:
+            self.staff_collection.update_many(
+                {'caseload': {'$exists': False}},
+                [{'$set': {'caseload': {'$size': {'$ifNull': ['$assigned_patients', []]}}}}]
+            )
+        except Exception as e:
+            print(f"Error backfilling staff caseloads: {e}")
+
+    def _run_atomic(self, writes):
+        """Run writes(session) in a transaction when the deployment supports one (replica set/mongos)"""
+        # Without transactions each staff document still keeps its array and counter in step
+        return self._atomic.run(writes)
+
+    def _today(self):
+        """Midnight (UTC) of the current day; BSON cannot store bare dates"""
+        return datetime.combine(datetime.utcnow().date(), time.min)
+
     def hash_password(self, password):
         """Hash password for security"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        return hash_password(password)
     
+    def _from_legacy_fields(self, staff_data):
+        """Accept the field names the old StaffManager used (name, employee_type, status)"""
+        staff_data = dict(staff_data)
+        if 'name' in staff_data and 'first_name' not in staff_data:
+            first_name, _, last_name = (staff_data.pop('name') or '').partition(' ')
+            staff_data['first_name'], staff_data['last_name'] = first_name, last_name
+        if 'employee_type' in staff_data and 'role' not in staff_data:
+            staff_data['role'] = (staff_data.pop('employee_type') or '').lower()
+        status = staff_data.pop('status', None)
+        if status == 'inactive':
+            staff_data['is_active'] = False
+        elif status == 'on_leave':
+            staff_data.setdefault('current_status', 'vacation')
+        if 'shift' in staff_data:
+            # Old records may carry an explicit null; those get the same default as a missing shift
+            staff_data['shift'] = (staff_data['shift'] or 'day').lower()
+        # Imported staff without a password cannot log in until one is set
+        staff_data.setdefault('password', secrets.token_urlsafe(16))
+        return staff_data
+
     def create_staff_member(self, staff_data):
         """Create a new staff member"""
+        staff_data = self._from_legacy_fields(staff_data)
         staff = {
             'hospital_id': staff_data.get('hospital_id', 'DEFAULT'),  # Add hospital_id
             'staff_id': staff_data['staff_id'],  # Unique staff identifier
@@ -51,6 +155,7 @@ class StaffManagementDB:
             'current_status': staff_data.get('current_status', 'off_duty'),  # on_duty, off_duty, break, lunch, vacation, sick_leave
             'current_location': staff_data.get('current_location', {}),  # current working location
             'assigned_patients': staff_data.get('assigned_patients', []),
+            'caseload': len(staff_data.get('assigned_patients', [])),
             'is_active': staff_data.get('is_active', True),
             'last_login': None,
             'last_logout': None,
@@ -76,37 +181,17 @@ class StaffManagementDB:
             raise ValueError(f"Staff member with ID {staff_data['staff_id']} or email {staff_data['email']} already exists in this hospital")
         
         result = self.staff_collection.insert_one(staff)
+        self.roster.apply({field: staff.get(field) for field in ROSTER_FIELDS if field != '_id'})
+        self.changes.record(staff['hospital_id'], 'staff', staff['staff_id'])
         return str(result.inserted_id)
     
-    def authenticate_staff(self, identifier, password):
+    def authenticate_staff(self, identifier, password, hospital_id=None):
         """Authenticate staff member by email or staff_id"""
-        password_hash = self.hash_password(password)
-        
-        staff = self.staff_collection.find_one({
-            '$and': [
-                {
-                    '$or': [
-                        {'email': identifier},
-                        {'staff_id': identifier}
-                    ]
-                },
-                {'password_hash': password_hash},
-                {'is_active': True}
-            ]
-        })
-        
-        if staff:
-            # Update last login
-            self.staff_collection.update_one(
-                {'_id': staff['_id']},
-                {'$set': {'last_login': datetime.utcnow(), 'updated_at': datetime.utcnow()}}
-            )
-            staff['_id'] = str(staff['_id'])
-            # Don't return password hash
-            del staff['password_hash']
-            return staff
-        
-        return None
+        return self.auth.authenticate(identifier, password, hospital_id)
+
+    def is_staff_active(self, staff_id, hospital_id):
+        """Whether a staff member is active in a hospital, answered from the live roster"""
+        return self.roster.get_entry(hospital_id, staff_id) is not None
     
     def clock_in(self, staff_id, location=None):
         """Clock in staff member"""
@@ -123,20 +208,26 @@ class StaffManagementDB:
         if location:
             update_data['current_location'] = location
         
-        self.staff_collection.update_one(
+        updated = self.staff_collection.find_one_and_update(
             {'staff_id': staff_id},
-            {'$set': update_data}
+            {'$set': update_data},
+            projection=ROSTER_FIELDS,
+            return_document=ReturnDocument.AFTER
         )
+        self.roster.apply(updated)
+        self._staff_changed(updated, staff_id)
+        self._publish_status(updated)
         
         # Log attendance
         attendance = {
+            'hospital_id': staff.get('hospital_id', 'DEFAULT'),
             'staff_id': staff_id,
             'clock_in': datetime.utcnow(),
             'clock_out': None,
             'total_hours': 0,
             'break_times': [],
             'location': location or staff.get('primary_location', {}),
-            'date': datetime.utcnow().date()
+            'date': self._today()
         }
         
         result = self.attendance_collection.insert_one(attendance)
@@ -145,37 +236,43 @@ class StaffManagementDB:
     def clock_out(self, staff_id):
         """Clock out staff member"""
         # Update staff status
-        self.staff_collection.update_one(
+        updated = self.staff_collection.find_one_and_update(
             {'staff_id': staff_id},
             {'$set': {
                 'current_status': 'off_duty',
                 'last_logout': datetime.utcnow(),
                 'updated_at': datetime.utcnow()
-            }}
+            }},
+            projection=ROSTER_FIELDS,
+            return_document=ReturnDocument.AFTER
         )
-        
-        # Update attendance record
-        today = datetime.utcnow().date()
-        attendance = self.attendance_collection.find_one({
-            'staff_id': staff_id,
-            'date': today,
-            'clock_out': None
-        })
-        
-        if attendance:
-            clock_out_time = datetime.utcnow()
-            total_hours = (clock_out_time - attendance['clock_in']).total_seconds() / 3600
-            
-            self.attendance_collection.update_one(
-                {'_id': attendance['_id']},
-                {'$set': {
-                    'clock_out': clock_out_time,
-                    'total_hours': round(total_hours, 2)
+        self.roster.apply(updated)
+        self._staff_changed(updated, staff_id)
+        self._publish_status(updated)
+        
+        # Close the open attendance record (night shifts may have started yesterday)
+        # and compute its hours server-side in the same update
+        clock_out_time = datetime.utcnow()
+        attendance = self.attendance_collection.find_one_and_update(
+            {'staff_id': staff_id, 'clock_out': None},
+            [{'$set': {
+                'clock_out': clock_out_time,
+                'total_hours': {'$round': [
+                    {'$divide': [{'$subtract': [clock_out_time, '$clock_in']}, 3600 * 1000]}, 2
+                ]},
+                'break_times': {'$map': {
+                    'input': {'$ifNull': ['$break_times', []]},
+                    'as': 'b',
+                    'in': {'$mergeObjects': [
+                        '$$b',
+                        {'end_time': {'$ifNull': ['$$b.end_time', clock_out_time]}}
+                    ]}
                 }}
-            )
-            
-            return True
-        return False
+            }}],
+            sort=[('clock_in', DESCENDING)]
+        )
+        
+        return attendance is not None
     
     def update_staff_status(self, staff_id, status, location=None, reason=''):
         """Update staff status (break, lunch, etc.)"""
@@ -183,6 +280,7 @@ class StaffManagementDB:
         
         if status not in valid_statuses:
             raise ValueError(f"Invalid status. Must be one of: {valid_statuses}")
+        staff_id = self._resolve_staff_id(staff_id)
         
         update_data = {
             'current_status': status,
@@ -194,26 +292,68 @@ class StaffManagementDB:
         
         # Log break times if applicable
         if status in ['break', 'lunch']:
-            today = datetime.utcnow().date()
             self.attendance_collection.update_one(
-                {'staff_id': staff_id, 'date': today, 'clock_out': None},
+                {'staff_id': staff_id, 'clock_out': None},
                 {'$push': {
                     'break_times': {
                         'type': status,
                         'start_time': datetime.utcnow(),
+                        'end_time': None,
                         'reason': reason
                     }
                 }}
             )
+        elif status == 'on_duty':
+            # Back from break: close any open break so timesheets can total it
+            self.attendance_collection.update_one(
+                {'staff_id': staff_id, 'clock_out': None},
+                {'$set': {'break_times.$[open].end_time': datetime.utcnow()}},
+                array_filters=[{'open.end_time': None}]
+            )
         
-        result = self.staff_collection.update_one(
+        updated = self.staff_collection.find_one_and_update(
             {'staff_id': staff_id},
-            {'$set': update_data}
+            {'$set': update_data},
+            projection=ROSTER_FIELDS,
+            return_document=ReturnDocument.AFTER
         )
+        self.roster.apply(updated)
+        self._staff_changed(updated, staff_id)
+        self._publish_status(updated)
         
-        return result.modified_count > 0
+        return updated is not None
     
-    def assign_patient_to_staff(self, staff_id, patient_id, assignment_type='primary'):
+    def _staff_changed(self, updated, staff_key):
+        """Drop a written staff member from the lookup cache and log it for delta sync"""
+        self.cache.invalidate(staff_key)
+        if updated is not None:
+            self.changes.record(updated.get('hospital_id'), 'staff', updated['staff_id'])
+
+    def _publish_status(self, updated):
+        """Push a staff status flip to the hospital's live screens"""
+        if updated is not None:
+            event_bus.publish(updated.get('hospital_id'), 'staff_status',
+                              {field: updated.get(field) for field in STAFF_EVENT_FIELDS})
+
+    @staticmethod
+    def _caseload_update(patient_ids, add=True):
+        """Pipeline update that changes assigned_patients and caseload together"""
+        current = {'$ifNull': ['$assigned_patients', []]}
+        if add:
+            # Append only patients not already on the list, keeping assignment order
+            patients = {'$concatArrays': [current, {'$filter': {
+                'input': list(patient_ids), 'as': 'patient', 'cond': {'$not': [{'$in': ['$$patient', current]}]}
+            }}]}
+        else:
+            patients = {'$filter': {
+                'input': current, 'as': 'patient', 'cond': {'$not': [{'$in': ['$$patient', list(patient_ids)]}]}
+            }}
+        return [
+            {'$set': {'assigned_patients': patients, 'updated_at': datetime.utcnow()}},
+            {'$set': {'caseload': {'$size': '$assigned_patients'}}}
+        ]
+
+    def assign_patient_to_staff(self, staff_id, patient_id, assignment_type='primary', max_caseload=None):
         """Assign a patient to staff member"""
         assignment = {
             'staff_id': staff_id,
@@ -222,34 +362,155 @@ class StaffManagementDB:
             'assigned_at': datetime.utcnow(),
             'is_active': True
         }
-        
-        # Add to patient assignments collection
-        result = self.patient_assignments_collection.insert_one(assignment)
-        
-        # Update staff's assigned patients list
-        self.staff_collection.update_one(
-            {'staff_id': staff_id},
-            {'$addToSet': {'assigned_patients': patient_id}}
-        )
-        
-        return str(result.inserted_id)
-    
+
+        query = {'staff_id': staff_id, 'is_active': True}
+        if max_caseload is not None:
+            # Already-assigned patients are a no-op, not a capacity breach
+            query['$or'] = [{'caseload': {'$lt': max_caseload}}, {'assigned_patients': patient_id}]
+
+        def writes(session):
+            updated = self.staff_collection.find_one_and_update(
+                query,
+                self._caseload_update([patient_id]),
+                projection=ROSTER_FIELDS,
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+            if updated is None:
+                return None, None
+            result = self.patient_assignments_collection.update_one(
+                {'staff_id': staff_id, 'patient_id': patient_id, 'is_active': True},
+                {'$setOnInsert': assignment},
+                upsert=True,
+                session=session
+            )
+            return updated, result.upserted_id
+
+        updated, assignment_id = self._run_atomic(writes)
+        if updated is None:
+            raise ValueError(f"Staff member {staff_id} not found, inactive or at capacity")
+        self.roster.apply(updated)
+        self._staff_changed(updated, staff_id)
+
+        if assignment_id is None:
+            existing = self.patient_assignments_collection.find_one(
+                {'staff_id': staff_id, 'patient_id': patient_id, 'is_active': True}, {'_id': 1}
+            )
+            assignment_id = existing['_id'] if existing else None
+        return str(assignment_id)
+
     def remove_patient_from_staff(self, staff_id, patient_id):
         """Remove patient assignment from staff member"""
-        # Deactivate assignment
-        self.patient_assignments_collection.update_one(
-            {'staff_id': staff_id, 'patient_id': patient_id, 'is_active': True},
-            {'$set': {'is_active': False, 'unassigned_at': datetime.utcnow()}}
-        )
-        
-        # Remove from staff's assigned patients list
-        result = self.staff_collection.update_one(
-            {'staff_id': staff_id},
-            {'$pull': {'assigned_patients': patient_id}}
-        )
-        
-        return result.modified_count > 0
-    
+        def writes(session):
+            # Deactivate assignment
+            self.patient_assignments_collection.update_many(
+                {'staff_id': staff_id, 'patient_id': patient_id, 'is_active': True},
+                {'$set': {'is_active': False, 'unassigned_at': datetime.utcnow()}},
+                session=session
+            )
+
+            # Remove from staff's assigned patients list
+            return self.staff_collection.find_one_and_update(
+                {'staff_id': staff_id, 'assigned_patients': patient_id},
+                self._caseload_update([patient_id], add=False),
+                projection=ROSTER_FIELDS,
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+
+        updated = self._run_atomic(writes)
+        self.roster.apply(updated)
+        self._staff_changed(updated, staff_id)
+        return updated is not None
+
+    def move_patient_assignments(self, moves, reason='shift_change'):
+        """Move patients between staff in one batch; moves is a list of (from_staff_id, to_staff_id, patient_id)"""
+        outgoing, incoming = {}, {}
+        for from_staff_id, to_staff_id, patient_id in moves:
+            outgoing.setdefault(from_staff_id, []).append(patient_id)
+            incoming.setdefault(to_staff_id, []).append(patient_id)
+        if not moves:
+            return 0
+
+        now = datetime.utcnow()
+        new_assignments = [{
+            'staff_id': to_staff_id,
+            'patient_id': patient_id,
+            'assignment_type': 'primary',
+            'assigned_at': now,
+            'reassigned_from': from_staff_id,
+            'reassignment_reason': reason,
+            'is_active': True
+        } for from_staff_id, to_staff_id, patient_id in moves]
+
+        def writes(session):
+            self.staff_collection.bulk_write(
+                [UpdateOne({'staff_id': sid}, self._caseload_update(pids, add=False)) for sid, pids in outgoing.items()] +
+                [UpdateOne({'staff_id': sid}, self._caseload_update(pids)) for sid, pids in incoming.items()],
+                ordered=False,
+                session=session
+            )
+            self.patient_assignments_collection.bulk_write(
+                [UpdateMany(
+                    {'staff_id': sid, 'patient_id': {'$in': pids}, 'is_active': True},
+                    {'$set': {'is_active': False, 'unassigned_at': now, 'unassigned_reason': reason}}
+                ) for sid, pids in outgoing.items()],
+                ordered=False,
+                session=session
+            )
+            self.patient_assignments_collection.insert_many(new_assignments, ordered=False, session=session)
+
+        self._run_atomic(writes)
+
+        entries = list(self.staff_collection.find({'staff_id': {'$in': list(outgoing) + list(incoming)}}, ROSTER_FIELDS))
+        for entry in entries:
+            self.roster.apply(entry)
+        self.cache.invalidate(*outgoing, *incoming)
+        for hospital_id in {entry['hospital_id'] for entry in entries}:
+            self.changes.record(hospital_id, 'staff',
+                                *[entry['staff_id'] for entry in entries if entry['hospital_id'] == hospital_id])
+        return len(moves)
+
+    def _staff_query(self, staff_key):
+        """Look staff up by Mongo _id (older clients) or by staff_id"""
+        if ObjectId.is_valid(staff_key):
+            return {'_id': ObjectId(staff_key)}
+        return {'staff_id': staff_key}
+
+    def _resolve_staff_id(self, staff_key):
+        """staff_id for a Mongo _id or staff_id key"""
+        if not ObjectId.is_valid(staff_key):
+            return staff_key
+        staff = self.staff_collection.find_one({'_id': ObjectId(staff_key)}, {'staff_id': 1})
+        return staff['staff_id'] if staff else staff_key
+
+    def _status_query(self, status):
+        """Filter for an employment status (active/on_leave/inactive) or a current status"""
+        if status == 'active':
+            return {'is_active': True, 'current_status': {'$nin': LEAVE_STATUSES}}
+        if status == 'on_leave':
+            return {'is_active': True, 'current_status': {'$in': LEAVE_STATUSES}}
+        if status == 'inactive':
+            return {'is_active': False}
+        return {'current_status': status}
+
+    def format_staff(self, staff):
+        """Serialize a staff document for the API, including the field names older clients read"""
+        staff['_id'] = str(staff['_id'])
+        staff.pop('password_hash', None)
+        if not staff.get('is_active', True):
+            staff['status'] = 'inactive'
+        elif staff.get('current_status') in LEAVE_STATUSES:
+            staff['status'] = 'on_leave'
+        else:
+            staff['status'] = 'active'
+        staff.setdefault('name', staff.get('full_name', ''))
+        staff.setdefault('employee_type', staff.get('role', ''))
+        for field in ('hire_date', 'last_login', 'last_logout', 'created_at', 'updated_at', 'deactivated_at'):
+            if isinstance(staff.get(field), datetime):
+                staff[field] = staff[field].isoformat()
+        return staff
+
     def get_all_staff(self):
         """Get all staff members"""
         staff_list = list(self.staff_collection.find({}, {'password_hash': 0}))
@@ -258,15 +519,21 @@ class StaffManagementDB:
         return staff_list
     
     def get_staff_by_id(self, staff_id):
-        """Get staff member by ID"""
-        staff = self.staff_collection.find_one({'staff_id': staff_id}, {'password_hash': 0})
+        """Get staff member by staff_id (or Mongo _id), read through the staff cache"""
+        return self.cache.get(staff_id, self._load_staff)
+
+    def _load_staff(self, staff_id):
+        staff = self.staff_collection.find_one(self._staff_query(staff_id), {'password_hash': 0})
         if staff:
             staff['_id'] = str(staff['_id'])
         return staff
     
-    def get_staff_by_hospital(self, hospital_id):
-        """Get staff members by hospital"""
-        staff_list = list(self.staff_collection.find({'hospital_id': hospital_id}, {'password_hash': 0}))
+    def get_staff_by_hospital(self, hospital_id, status=None):
+        """Get staff members by hospital, optionally by employment or current status"""
+        query = {'hospital_id': hospital_id}
+        if status:
+            query.update(self._status_query(status))
+        staff_list = list(self.staff_collection.find(query, {'password_hash': 0}))
         for staff in staff_list:
             staff['_id'] = str(staff['_id'])
         return staff_list
@@ -281,45 +548,107 @@ class StaffManagementDB:
             staff['_id'] = str(staff['_id'])
         return staff_list
     
-    def get_staff_statistics_by_hospital(self, hospital_id):
-        """Get comprehensive staff statistics for a specific hospital"""
-        total_staff = self.staff_collection.count_documents({'hospital_id': hospital_id, 'is_active': True})
-        on_duty = self.staff_collection.count_documents({'hospital_id': hospital_id, 'current_status': 'on_duty'})
-        on_break = self.staff_collection.count_documents({
-            'hospital_id': hospital_id,
-            'current_status': {'$in': ['break', 'lunch']}
-        })
-        on_vacation = self.staff_collection.count_documents({'hospital_id': hospital_id, 'current_status': 'vacation'})
-        sick_leave = self.staff_collection.count_documents({'hospital_id': hospital_id, 'current_status': 'sick_leave'})
-        
-        # Department breakdown for this hospital
-        department_stats = list(self.staff_collection.aggregate([
-            {'$match': {'hospital_id': hospital_id, 'is_active': True}},
-            {'$group': {
-                '_id': '$department',
-                'total': {'$sum': 1},
-                'on_duty': {'$sum': {'$cond': [{'$eq': ['$current_status', 'on_duty']}, 1, 0]}}
-            }}
-        ]))
-        
-        # Role breakdown for this hospital
-        role_stats = list(self.staff_collection.aggregate([
-            {'$match': {'hospital_id': hospital_id, 'is_active': True}},
-            {'$group': {
-                '_id': '$role',
-                'count': {'$sum': 1}
+    def update_staff_member(self, staff_key, update_data):
+        """Update a staff member's profile fields"""
+        update_data = {
+            field: value for field, value in update_data.items()
+            # Status, caseload and identity have their own write paths
+            if field not in ('_id', 'staff_id', 'password_hash', 'assigned_patients', 'caseload',
+                             'current_status', 'is_active', 'status', 'last_login')
+        }
+        if 'password' in update_data:
+            update_data['password_hash'] = self.hash_password(update_data.pop('password'))
+        if 'first_name' in update_data or 'last_name' in update_data:
+            current = self.staff_collection.find_one(self._staff_query(staff_key), {'first_name': 1, 'last_name': 1}) or {}
+            update_data['full_name'] = (f"{update_data.get('first_name', current.get('first_name', ''))} "
+                                        f"{update_data.get('last_name', current.get('last_name', ''))}")
+        update_data['updated_at'] = datetime.utcnow()
+
+        updated = self.staff_collection.find_one_and_update(
+            self._staff_query(staff_key),
+            {'$set': update_data},
+            projection=ROSTER_FIELDS,
+            return_document=ReturnDocument.AFTER
+        )
+        self.roster.apply(updated)
+        self._staff_changed(updated, staff_key)
+        return updated is not None
+
+    def set_employment_status(self, staff_key, status):
+        """Apply an employment status (active, on_leave, inactive) from the older staff routes"""
+        if status not in EMPLOYMENT_STATUSES:
+            raise ValueError(f"Invalid status. Must be one of: {EMPLOYMENT_STATUSES}")
+        staff_id = self._resolve_staff_id(staff_key)
+        if status == 'inactive':
+            return self.deactivate_staff(staff_id)
+        if status == 'on_leave':
+            return self.update_staff_status(staff_id, 'vacation')
+
+        updated = self.staff_collection.find_one_and_update(
+            {'staff_id': staff_id},
+            [{'$set': {
+                'is_active': True,
+                'current_status': {'$cond': [
+                    {'$in': ['$current_status', LEAVE_STATUSES]}, 'off_duty', '$current_status'
+                ]},
+                'updated_at': datetime.utcnow()
+            }}],
+            projection=ROSTER_FIELDS,
+            return_document=ReturnDocument.AFTER
+        )
+        self.roster.apply(updated)
+        self._staff_changed(updated, staff_id)
+        self._publish_status(updated)
+        return updated is not None
+
+    def _staff_statistics(self, match):
+        """All staff counts and breakdowns in one aggregation"""
+        result = list(self.staff_collection.aggregate([
+            {'$match': match},
+            {'$facet': {
+                'totals': [{'$group': {
+                    '_id': None,
+                    'all_staff': {'$sum': 1},
+                    'total_staff': {'$sum': {'$cond': ['$is_active', 1, 0]}},
+                    'on_duty': {'$sum': {'$cond': [{'$and': ['$is_active', {'$eq': ['$current_status', 'on_duty']}]}, 1, 0]}},
+                    'on_break': {'$sum': {'$cond': [{'$and': ['$is_active', {'$in': ['$current_status', ['break', 'lunch']]}]}, 1, 0]}},
+                    'on_vacation': {'$sum': {'$cond': [{'$and': ['$is_active', {'$eq': ['$current_status', 'vacation']}]}, 1, 0]}},
+                    'sick_leave': {'$sum': {'$cond': [{'$and': ['$is_active', {'$eq': ['$current_status', 'sick_leave']}]}, 1, 0]}},
+                    'on_leave': {'$sum': {'$cond': [{'$and': ['$is_active', {'$in': ['$current_status', LEAVE_STATUSES]}]}, 1, 0]}}
+                }}],
+                'departments': [
+                    {'$match': {'is_active': True}},
+                    {'$group': {
+                        '_id': '$department',
+                        'total': {'$sum': 1},
+                        'on_duty': {'$sum': {'$cond': [{'$eq': ['$current_status', 'on_duty']}, 1, 0]}}
+                    }}
+                ],
+                'roles': [{'$match': {'is_active': True}}, {'$group': {'_id': '$role', 'count': {'$sum': 1}}}],
+                'shifts': [{'$match': {'is_active': True}}, {'$group': {'_id': '$shift', 'count': {'$sum': 1}}}]
             }}
-        ]))
-        
+        ], allowDiskUse=True))
+        facets = result[0] if result else {}
+        totals = (facets.get('totals') or [{}])[0]
+
+        total_staff = totals.get('total_staff', 0)
         return {
             'total_staff': total_staff,
-            'on_duty': on_duty,
-            'on_break': on_break,
-            'on_vacation': on_vacation,
-            'sick_leave': sick_leave,
-            'department_breakdown': department_stats,
-            'role_breakdown': role_stats
+            'active_staff': total_staff - totals.get('on_leave', 0),
+            'inactive_staff': totals.get('all_staff', 0) - total_staff,
+            'on_duty': totals.get('on_duty', 0),
+            'on_break': totals.get('on_break', 0),
+            'on_vacation': totals.get('on_vacation', 0),
+            'sick_leave': totals.get('sick_leave', 0),
+            'on_leave': totals.get('on_leave', 0),
+            'department_breakdown': facets.get('departments', []),
+            'role_breakdown': facets.get('roles', []),
+            'shift_breakdown': {stat['_id']: stat['count'] for stat in facets.get('shifts', [])}
         }
+
+    def get_staff_statistics_by_hospital(self, hospital_id):
+        """Get comprehensive staff statistics for a specific hospital"""
+        return self._staff_statistics({'hospital_id': hospital_id})
     
     def get_staff_by_role(self, role):
         """Get staff members by role"""
@@ -335,12 +664,16 @@ class StaffManagementDB:
             staff['_id'] = str(staff['_id'])
         return staff_list
     
-    def get_on_duty_staff(self):
-        """Get all staff currently on duty"""
+    def get_on_duty_staff(self, hospital_id=None, department=None):
+        """Get staff currently on duty (from the live roster when a hospital is given)"""
+        if hospital_id:
+            return self.roster.get_on_duty(hospital_id, department)
         return self.get_staff_by_status('on_duty')
     
-    def get_staff_on_break(self):
-        """Get all staff currently on break or lunch"""
+    def get_staff_on_break(self, hospital_id=None, department=None):
+        """Get staff currently on break or lunch (from the live roster when a hospital is given)"""
+        if hospital_id:
+            return self.roster.get_staff(hospital_id, ['break', 'lunch'], department)
         staff_list = list(self.staff_collection.find(
             {'current_status': {'$in': ['break', 'lunch']}}, 
             {'password_hash': 0}
@@ -373,6 +706,7 @@ class StaffManagementDB:
     def create_staff_schedule(self, schedule_data):
         """Create staff schedule"""
         schedule = {
+            'hospital_id': schedule_data.get('hospital_id', ''),
             'staff_id': schedule_data['staff_id'],
             'date': schedule_data['date'],
             'shift_start': schedule_data['shift_start'],
@@ -385,6 +719,7 @@ class StaffManagementDB:
         }
         
         result = self.schedules_collection.insert_one(schedule)
+        self.coverage.invalidate(schedule['hospital_id'])
         return str(result.inserted_id)
     
     def get_staff_schedule(self, staff_id, date_from=None, date_to=None):
@@ -426,64 +761,40 @@ class StaffManagementDB:
     
     def get_staff_statistics(self):
         """Get comprehensive staff statistics"""
-        total_staff = self.staff_collection.count_documents({'is_active': True})
-        on_duty = self.staff_collection.count_documents({'current_status': 'on_duty'})
-        on_break = self.staff_collection.count_documents({'current_status': {'$in': ['break', 'lunch']}})
-        on_vacation = self.staff_collection.count_documents({'current_status': 'vacation'})
-        sick_leave = self.staff_collection.count_documents({'current_status': 'sick_leave'})
-        
-        # Department breakdown
-        department_stats = list(self.staff_collection.aggregate([
-            {'$match': {'is_active': True}},
-            {'$group': {
-                '_id': '$department',
-                'total': {'$sum': 1},
-                'on_duty': {'$sum': {'$cond': [{'$eq': ['$current_status', 'on_duty']}, 1, 0]}}
-            }}
-        ]))
-        
-        # Role breakdown
-        role_stats = list(self.staff_collection.aggregate([
-            {'$match': {'is_active': True}},
-            {'$group': {
-                '_id': '$role',
-                'count': {'$sum': 1}
-            }}
-        ]))
-        
-        return {
-            'total_staff': total_staff,
-            'on_duty': on_duty,
-            'on_break': on_break,
-            'on_vacation': on_vacation,
-            'sick_leave': sick_leave,
-            'department_breakdown': department_stats,
-            'role_breakdown': role_stats
-        }
+        return self._staff_statistics({})
     
     def update_staff_location(self, staff_id, location):
         """Update staff current location"""
-        result = self.staff_collection.update_one(
+        updated = self.staff_collection.find_one_and_update(
             {'staff_id': staff_id},
             {'$set': {
                 'current_location': location,
                 'updated_at': datetime.utcnow()
-            }}
+            }},
+            projection=ROSTER_FIELDS,
+            return_document=ReturnDocument.AFTER
         )
-        return result.modified_count > 0
+        self.roster.apply(updated)
+        self._staff_changed(updated, staff_id)
+        return updated is not None
     
     def deactivate_staff(self, staff_id, reason=''):
         """Deactivate staff member"""
-        result = self.staff_collection.update_one(
+        updated = self.staff_collection.find_one_and_update(
             {'staff_id': staff_id},
             {'$set': {
                 'is_active': False,
                 'deactivation_reason': reason,
                 'deactivated_at': datetime.utcnow(),
                 'updated_at': datetime.utcnow()
-            }}
+            }},
+            projection=ROSTER_FIELDS,
+            return_document=ReturnDocument.AFTER
         )
-        return result.modified_count > 0
+        self.roster.apply(updated)
+        self._staff_changed(updated, staff_id)
+        self._publish_status(updated)
+        return updated is not None
 
 # Example usage and testing functions
 def initialize_sample_staff():
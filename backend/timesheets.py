@@ -0,0 +1,190 @@
+"""
+Timesheet Engine for Hospital Management
+Hours, overtime and break totals per staff member per pay period
+"""
+
+from pymongo import ASCENDING, UpdateOne
+from datetime import datetime, timedelta
+import os
+
+# Hours beyond these limits count as overtime
+DAILY_OVERTIME_HOURS = float(os.getenv('DAILY_OVERTIME_HOURS', 8))
+WEEKLY_OVERTIME_HOURS = float(os.getenv('WEEKLY_OVERTIME_HOURS', 40))
+
+# A period is only frozen once every shift in it has had time to clock out
+PERIOD_CLOSE_GRACE_HOURS = 24
+
+MS_PER_HOUR = 3600 * 1000
+
+
+class TimesheetEngine:
+    def __init__(self, staff_db):
+        """Timesheets computed from StaffManagementDB attendance records"""
+        self.staff_db = staff_db
+        self.attendance_collection = staff_db.attendance_collection
+        self.db = staff_db.db
+        self.summaries_collection = self.db.timesheet_summaries
+        self.periods_collection = self.db.timesheet_periods
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """Create the indexes used by the timesheet queries (idempotent)"""
+        try:
+            self.summaries_collection.create_index([
+                ('hospital_id', ASCENDING),
+                ('period_start', ASCENDING),
+                ('period_end', ASCENDING),
+                ('staff_id', ASCENDING)
+            ], unique=True)
+            self.periods_collection.create_index([
+                ('hospital_id', ASCENDING),
+                ('period_start', ASCENDING),
+                ('period_end', ASCENDING)
+            ], unique=True)
+        except Exception as e:
+            print(f"Error creating timesheet indexes: {e}")
+
+    def _timesheet_pipeline(self, hospital_id, period_start, period_end, staff_id=None):
+        """Server-side aggregation of attendance into one row per staff member"""
+        match = {
+            'hospital_id': hospital_id,
+            'date': {'$gte': period_start, '$lt': period_end},
+            'clock_out': {'$ne': None}
+        }
+        if staff_id:
+            match['staff_id'] = staff_id
+
+        return [
+            {'$match': match},
+            {'$project': {
+                'staff_id': 1,
+                'date': 1,
+                'worked_hours': {'$divide': [{'$subtract': ['$clock_out', '$clock_in']}, MS_PER_HOUR]},
+                'break_hours': {'$divide': [
+                    {'$sum': {'$map': {
+                        'input': {'$ifNull': ['$break_times', []]},
+                        'as': 'b',
+                        'in': {'$subtract': [{'$ifNull': ['$$b.end_time', '$clock_out']}, '$$b.start_time']}
+                    }}},
+                    MS_PER_HOUR
+                ]}
+            }},
+            # Daily overtime is judged on each calendar day's net hours
+            {'$group': {
+                '_id': {'staff_id': '$staff_id', 'date': '$date'},
+                'shifts': {'$sum': 1},
+                'worked_hours': {'$sum': '$worked_hours'},
+                'break_hours': {'$sum': '$break_hours'}
+            }},
+            {'$addFields': {
+                'net_hours': {'$max': [{'$subtract': ['$worked_hours', '$break_hours']}, 0]}
+            }},
+            # Weekly overtime is judged on each ISO week's net hours; within a week the larger of
+            # the daily and weekly figures counts, so the same hour is never paid twice
+            {'$group': {
+                '_id': {
+                    'staff_id': '$_id.staff_id',
+                    'year': {'$isoWeekYear': '$_id.date'},
+                    'week': {'$isoWeek': '$_id.date'}
+                },
+                'days_worked': {'$sum': 1},
+                'shifts': {'$sum': '$shifts'},
+                'worked_hours': {'$sum': '$worked_hours'},
+                'break_hours': {'$sum': '$break_hours'},
+                'net_hours': {'$sum': '$net_hours'},
+                'daily_overtime_hours': {'$sum': {'$max': [{'$subtract': ['$net_hours', DAILY_OVERTIME_HOURS]}, 0]}}
+            }},
+            {'$addFields': {
+                'overtime_hours': {'$max': [
+                    '$daily_overtime_hours',
+                    {'$subtract': ['$net_hours', WEEKLY_OVERTIME_HOURS]},
+                    0
+                ]}
+            }},
+            {'$group': {
+                '_id': '$_id.staff_id',
+                'days_worked': {'$sum': '$days_worked'},
+                'shifts': {'$sum': '$shifts'},
+                'worked_hours': {'$sum': '$worked_hours'},
+                'break_hours': {'$sum': '$break_hours'},
+                'net_hours': {'$sum': '$net_hours'},
+                'overtime_hours': {'$sum': '$overtime_hours'}
+            }},
+            {'$lookup': {
+                'from': self.staff_db.staff_collection.name,
+                'localField': '_id',
+                'foreignField': 'staff_id',
+                'as': 'staff'
+            }},
+            {'$project': {
+                '_id': 0,
+                'staff_id': '$_id',
+                'full_name': {'$arrayElemAt': ['$staff.full_name', 0]},
+                'role': {'$arrayElemAt': ['$staff.role', 0]},
+                'department': {'$arrayElemAt': ['$staff.department', 0]},
+                'employment_type': {'$arrayElemAt': ['$staff.employment_type', 0]},
+                'days_worked': 1,
+                'shifts': 1,
+                'worked_hours': {'$round': ['$worked_hours', 2]},
+                'break_hours': {'$round': ['$break_hours', 2]},
+                'net_hours': {'$round': ['$net_hours', 2]},
+                'regular_hours': {'$round': [{'$subtract': ['$net_hours', '$overtime_hours']}, 2]},
+                'overtime_hours': {'$round': ['$overtime_hours', 2]}
+            }},
+            {'$sort': {'staff_id': 1}}
+        ]
+
+    def is_period_closed(self, period_end):
+        """A period closes once its end plus the grace window has passed"""
+        return datetime.utcnow() >= period_end + timedelta(hours=PERIOD_CLOSE_GRACE_HOURS)
+
+    def get_timesheets(self, hospital_id, period_start, period_end, staff_id=None):
+        """Timesheet rows for a pay period; closed periods are served from frozen summaries"""
+        if period_end <= period_start:
+            raise ValueError("period_end must be after period_start")
+
+        period = {'hospital_id': hospital_id, 'period_start': period_start, 'period_end': period_end}
+        summary_query = dict(period)
+        if staff_id:
+            summary_query['staff_id'] = staff_id
+
+        if self.periods_collection.find_one(period, {'_id': 1}):
+            return self.summaries_collection.find(
+                summary_query,
+                {'_id': 0, 'hospital_id': 0, 'period_start': 0, 'period_end': 0}
+            ).sort('staff_id', ASCENDING)
+
+        rows = self.attendance_collection.aggregate(
+            self._timesheet_pipeline(hospital_id, period_start, period_end, staff_id),
+            allowDiskUse=True
+        )
+
+        if staff_id or not self.is_period_closed(period_end):
+            return rows
+
+        # Closed period: freeze the summaries so they are never recomputed
+        rows = list(rows)
+        self._freeze_period(period, rows)
+        return iter(rows)
+
+    def _freeze_period(self, period, rows):
+        """Store immutable per-staff summaries for a closed period"""
+        if rows:
+            self.summaries_collection.bulk_write([
+                UpdateOne(
+                    {**period, 'staff_id': row['staff_id']},
+                    {'$setOnInsert': {**period, **row}},
+                    upsert=True
+                )
+                for row in rows
+            ], ordered=False)
+
+        self.periods_collection.update_one(
+            period,
+            {'$setOnInsert': {**period, 'staff_count': len(rows), 'closed_at': datetime.utcnow()}},
+            upsert=True
+        )
+
+    def get_staff_timesheet(self, staff_id, hospital_id, period_start, period_end):
+        """One staff member's timesheet row for a pay period"""
+        return next(iter(self.get_timesheets(hospital_id, period_start, period_end, staff_id)), None)
@@ -0,0 +1,31 @@
+"""
+Multi-Document Transactions for Hospital Management
+Groups of writes applied in one transaction where the deployment supports it
+"""
+
+from pymongo.errors import OperationFailure
+
+
+class AtomicWriter:
+    def __init__(self, client):
+        """Transactions on one MongoClient; only collections of that client can take part"""
+        self.client = client
+        self.supported = None
+
+    def run(self, writes):
+        """Run writes(session) in a transaction when the deployment supports one (replica set/mongos).
+
+        A standalone server has no transactions: writes(None) then applies the same writes one by one,
+        so callers keep each write guarded on its own.
+        """
+        if self.supported is not False:
+            try:
+                with self.client.start_session() as session:
+                    result = session.with_transaction(writes)
+                self.supported = True
+                return result
+            except OperationFailure as e:
+                if e.code != 20:  # IllegalOperation: standalone server without transactions
+                    raise
+                self.supported = False
+        return writes(None)
@@ -0,0 +1,393 @@
+"""
+Patient Transfers for Hospital Management
+Inter-hospital transfers as a bed hold at the receiving hospital followed by the move, and ward
+evacuations placed across receiving hospitals from live bed availability
+"""
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from bson.objectid import ObjectId
+from datetime import datetime, timedelta
+from threading import Event, Thread
+import os
+
+from transactions import AtomicWriter
+
+# Held beds not taken up by then are released
+TRANSFER_HOLD_MINUTES = int(os.getenv('TRANSFER_HOLD_MINUTES', 60))
+
+# How often the background sweep expires holds that ran out
+TRANSFER_EXPIRY_SWEEP_SECONDS = float(os.getenv('TRANSFER_EXPIRY_SWEEP_SECONDS', 60))
+
+# held: bed reserved at the receiving hospital; moving: being completed;
+# then completed, cancelled, expired (hold ran out) or failed (the move could not be applied)
+TRANSFER_STATUSES = ['held', 'moving', 'completed', 'cancelled', 'expired', 'failed']
+
+
+class TransferCoordinator:
+    def __init__(self, beds_db, patients_db, hospitals_collection):
+        """Transfers in hospital_db.patient_transfers, moving beds and patients through the existing repositories"""
+        self.beds_db = beds_db
+        self.patients_db = patients_db
+        self.hospitals_collection = hospitals_collection
+        self.transfers_collection = beds_db.db.patient_transfers
+        # Completion writes beds, the patient and the transfer in one transaction on the beds client
+        self._atomic = AtomicWriter(beds_db.client)
+        self._patients = beds_db.db[patients_db.patients_collection.name]
+        self._stop = Event()
+        self._thread = None
+        self.ensure_indexes()
+
+    def ensure_indexes(self):
+        """Create the transfer indexes (idempotent)"""
+        try:
+            # At most one open (held or moving) transfer per patient
+            self.transfers_collection.create_index('patient_id', unique=True, partialFilterExpression={'open': True},
+                                                   name='patient_id_open')
+            self.transfers_collection.create_index([('status', ASCENDING), ('expires_at', ASCENDING)])
+            self.transfers_collection.create_index([('from_hospital_id', ASCENDING), ('created_at', DESCENDING)])
+            self.transfers_collection.create_index([('to_hospital_id', ASCENDING), ('created_at', DESCENDING)])
+            self.transfers_collection.create_index('evacuation_id')
+        except Exception as e:
+            print(f"Error creating transfer indexes: {e}")
+
+    def start(self, interval=TRANSFER_EXPIRY_SWEEP_SECONDS):
+        """Expire holds that ran out from a daemon thread (idempotent)"""
+        if self._thread is not None:
+            return
+        self._thread = Thread(target=self._run, args=(interval,), name='transfer-expiry', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def _run(self, interval):
+        while not self._stop.is_set():
+            try:
+                self.expire_transfers()
+            except Exception as e:
+                print(f"Error expiring transfers: {e}")
+            self._stop.wait(interval)
+
+    @staticmethod
+    def _serialize(transfer):
+        transfer = dict(transfer)
+        transfer['transfer_id'] = str(transfer.pop('_id'))
+        transfer.pop('open', None)
+        return transfer
+
+    def _close(self, transfer_id, status, from_statuses, query=None, session=None, **fields):
+        """Move an open transfer to a final status; the transfer as it was, or None if it was not open"""
+        return self.transfers_collection.find_one_and_update(
+            {**(query or {}), '_id': ObjectId(transfer_id), 'status': {'$in': from_statuses}},
+            {'$set': {'status': status, 'open': False, 'updated_at': datetime.utcnow(), **fields}},
+            session=session
+        )
+
+    def request_transfer(self, patient_id, to_hospital_id, bed_id=None, bed_type=None, department=None,
+                         hold_minutes=TRANSFER_HOLD_MINUTES, requested_by='', reason=''):
+        """Hold a bed at the receiving hospital for an admitted patient: bed_id, or the first free bed of the
+        type and department. The patient stays where they are until complete_transfer"""
+        if hold_minutes <= 0:
+            raise ValueError("hold_minutes must be positive")
+        self.expire_transfers()
+        if not self.hospitals_collection.find_one({'hospital_id': to_hospital_id, 'is_active': True}, {'_id': 1}):
+            raise ValueError(f"Receiving hospital {to_hospital_id} not found or inactive")
+
+        patient = self._admitted_patient(patient_id)
+        transfer = self._open(patient, to_hospital_id, hold_minutes, bed_id=bed_id, bed_type=bed_type,
+                              department=department, requested_by=requested_by, reason=reason)
+        if transfer is None:
+            wanted = ' '.join(part for part in [bed_type, department] if part) or 'requested'
+            raise ValueError(f"No available {wanted} bed at hospital {to_hospital_id}")
+        return transfer
+
+    def _admitted_patient(self, patient_id):
+        patient = self.patients_db.get_patient_by_id(patient_id, cached=False)
+        if not patient:
+            raise ValueError(f"Patient with ID {patient_id} not found")
+        if not patient.get('current_hospital') or patient.get('status') != 'admitted':
+            raise ValueError(f"Patient {patient_id} is not admitted to a hospital")
+        return patient
+
+    def _open(self, patient, to_hospital_id, hold_minutes, bed_id=None, bed_type=None, department=None,
+              requested_by='', reason='', evacuation_id=None):
+        """Hold a bed and record the transfer; None if the receiving hospital has no matching free bed"""
+        patient_id, from_hospital_id = patient['patient_id'], patient['current_hospital']
+        if from_hospital_id == to_hospital_id:
+            raise ValueError(f"Patient {patient_id} is already at hospital {to_hospital_id}")
+        transfer_id = ObjectId()
+        now = datetime.utcnow()
+        expires_at = now + timedelta(minutes=hold_minutes)
+        bed = self.beds_db.hold_bed(to_hospital_id, str(transfer_id), patient_id, expires_at,
+                                    bed_id=bed_id, bed_type=bed_type, department=department)
+        if bed is None:
+            return None
+
+        source_bed = patient.get('bed_info') or {}
+        transfer = {
+            '_id': transfer_id,
+            'patient_id': patient_id,
+            'patient_name': patient.get('name', ''),
+            'from_hospital_id': from_hospital_id,
+            'from_bed_id': source_bed.get('bed_id'),
+            'from_department': source_bed.get('department'),
+            'to_hospital_id': to_hospital_id,
+            'to_bed_id': str(bed['_id']),
+            'to_bed_number': bed.get('bed_number'),
+            'to_room_number': bed.get('room_number'),
+            'to_department': bed.get('department'),
+            'bed_type': bed.get('bed_type'),
+            'status': 'held',
+            'open': True,
+            'reason': reason,
+            'requested_by': requested_by,
+            'evacuation_id': evacuation_id,
+            'expires_at': expires_at,
+            'created_at': now,
+            'updated_at': now
+        }
+        try:
+            self.transfers_collection.insert_one(transfer)
+        except DuplicateKeyError:
+            self.beds_db.release_bed_hold(transfer['to_bed_id'], str(transfer_id))
+            raise ValueError(f"Patient {patient_id} already has a transfer in progress")
+        except Exception:
+            self.beds_db.release_bed_hold(transfer['to_bed_id'], str(transfer_id))
+            raise
+        return self._serialize(transfer)
+
+    def complete_transfer(self, transfer_id):
+        """Move the patient into the held bed: the bed becomes occupied, the patient record moves with its
+        admission history, the source beds are freed and the transfer is closed. None if there is no such transfer.
+
+        All of it is one transaction where the deployment supports one, so a crash part way leaves the
+        transfer held as it was. Without transactions each step is a single-document update guarded on
+        the state the previous step left, so a concurrent completion, cancellation or expiry makes this
+        one fail instead of double-booking. If the move cannot be applied the destination bed is given
+        back and the transfer fails. Cache, change log and live screens are updated once it is applied.
+        """
+        def writes(session):
+            now = datetime.utcnow()
+            transfer = self.transfers_collection.find_one_and_update(
+                {'_id': ObjectId(transfer_id), 'status': 'held', 'expires_at': {'$gte': now}},
+                {'$set': {'status': 'moving', 'updated_at': now}},
+                return_document=ReturnDocument.AFTER,
+                session=session
+            )
+            if transfer is None:
+                return None
+            claimed.append(transfer)
+
+            bed = self.beds_db.occupy_held_bed(transfer['to_bed_id'], str(transfer['_id']),
+                                               session=session, announce=False)
+            if bed is None:
+                raise ValueError("The held bed is no longer reserved for this transfer")
+            bed_info = {
+                'bed_id': str(bed['_id']),
+                'bed_number': bed.get('bed_number'),
+                'room_number': bed.get('room_number'),
+                'department': bed.get('department'),
+                'hospital_id': transfer['to_hospital_id']
+            }
+            moved = self.patients_db.write_patient_transfer(
+                transfer['patient_id'], transfer['to_hospital_id'], bed_info,
+                from_hospital_id=transfer['from_hospital_id'], collection=self._patients, session=session
+            )
+            if moved is None:
+                raise ValueError(f"Patient {transfer['patient_id']} is no longer at hospital {transfer['from_hospital_id']}")
+
+            freed = self.beds_db.vacate_patient_beds(transfer['from_hospital_id'], transfer['patient_id'],
+                                                     session=session, announce=False)
+            self._close(transfer['_id'], 'completed', ['moving'], session=session,
+                        completed_at=datetime.utcnow(), source_beds_freed=len(freed))
+            return transfer, bed, bed_info, moved, freed
+
+        claimed = []
+        try:
+            result = self._atomic.run(writes)
+        except Exception as e:
+            if claimed:
+                self._fail(claimed[-1], str(e))
+            raise
+        if result is None:
+            self.expire_transfers()
+            existing = self.transfers_collection.find_one({'_id': ObjectId(transfer_id)}, {'status': 1})
+            if existing is None:
+                return None
+            raise ValueError(f"Transfer is {existing['status']}, not held")
+
+        transfer, bed, bed_info, moved, freed = result
+        self.beds_db.announce_bed_change(bed)
+        self.patients_db.announce_patient_transfer(*moved, transfer['to_hospital_id'], bed_info)
+        for source_bed in freed:
+            self.beds_db.announce_bed_change(source_bed)
+        return self.get_transfer(transfer['_id'])
+
+    def _fail(self, transfer, failure_reason):
+        """Give back the destination bed of a transfer whose move was not applied; a rolled-back
+        transaction leaves it held, a partial completion without transactions leaves it occupied.
+        Left moving if the patient record did move before a later write failed"""
+        patient = self.patients_db.get_patient_by_id(transfer['patient_id'], cached=False)
+        if patient and patient.get('current_hospital') == transfer['to_hospital_id']:
+            return
+        if not self._close(transfer['_id'], 'failed', ['held', 'moving'], failure_reason=failure_reason):
+            return
+        self.beds_db.release_bed_hold(transfer['to_bed_id'], str(transfer['_id']))
+        self.beds_db.vacate_patient_beds(transfer['to_hospital_id'], transfer['patient_id'], bed_id=transfer['to_bed_id'])
+
+    def cancel_transfer(self, transfer_id):
+        """Cancel a held transfer and release its bed"""
+        transfer = self._close(transfer_id, 'cancelled', ['held'])
+        if transfer is None:
+            return False
+        self.beds_db.release_bed_hold(transfer['to_bed_id'], str(transfer['_id']))
+        return True
+
+    def expire_transfers(self, hospital_id=None):
+        """Expire held transfers past their hold and release their beds"""
+        query = {'status': 'held', 'expires_at': {'$lt': datetime.utcnow()}}
+        if hospital_id:
+            query['$or'] = [{'from_hospital_id': hospital_id}, {'to_hospital_id': hospital_id}]
+
+        expired = 0
+        for transfer in self.transfers_collection.find(query, {'_id': 1}):
+            closed = self._close(transfer['_id'], 'expired', ['held'], {'expires_at': query['expires_at']})
+            if closed:
+                self.beds_db.release_bed_hold(closed['to_bed_id'], str(closed['_id']))
+                expired += 1
+        return expired
+
+    def get_transfer(self, transfer_id):
+        transfer = self.transfers_collection.find_one({'_id': ObjectId(transfer_id)})
+        return self._serialize(transfer) if transfer else None
+
+    def get_transfers_by_hospital(self, hospital_id, status=None):
+        """Transfers into or out of a hospital, newest first"""
+        if status and status not in TRANSFER_STATUSES:
+            raise ValueError(f"Invalid status. Must be one of: {TRANSFER_STATUSES}")
+        self.expire_transfers(hospital_id=hospital_id)
+        query = {'$or': [{'from_hospital_id': hospital_id}, {'to_hospital_id': hospital_id}]}
+        if status:
+            query['status'] = status
+        return [self._serialize(transfer)
+                for transfer in self.transfers_collection.find(query).sort('created_at', DESCENDING)]
+
+    # ---- ward evacuation ----
+
+    def _plan(self, hospital_id, department, receiving_hospital_ids=None, bed_type=None):
+        """Evacuation plan, plus every receiving hospital in preference order for falling back to"""
+        source = self.hospitals_collection.find_one({'hospital_id': hospital_id}, {'_id': 0, 'location': 1})
+        if source is None:
+            raise ValueError(f"Hospital {hospital_id} not found")
+        beds = list(self.beds_db.beds_collection.find(
+            {'hospital_id': hospital_id, 'department': department, 'status': 'occupied', 'patient_id': {'$nin': [None, '']}},
+            {'patient_id': 1, 'bed_number': 1, 'bed_type': 1}
+        ).sort('bed_number', ASCENDING))
+        in_transfer = {transfer['patient_id'] for transfer in self.transfers_collection.find(
+            {'open': True, 'patient_id': {'$in': [bed['patient_id'] for bed in beds]}}, {'patient_id': 1}
+        )}
+
+        candidates = self.beds_db.availability.receiving_hospitals(hospital_id, source.get('location'),
+                                                                   receiving_hospital_ids)
+        # Free beds by type left in each hospital as the plan uses them up
+        remaining = {hospital['_id']: {entry['bed_type']: entry['available'] for entry in hospital['beds']}
+                     for hospital in candidates}
+        used = {}
+
+        placements, unplaced = [], []
+        for bed in beds:
+            needed = (bed_type or bed.get('bed_type') or 'standard').lower()
+            if bed['patient_id'] in in_transfer:
+                unplaced.append({'patient_id': bed['patient_id'], 'bed_type': needed,
+                                 'reason': 'Transfer already in progress'})
+                continue
+            # Nearest hospital that still has a free bed of the type in this plan
+            target = next((hospital for hospital in candidates if remaining[hospital['_id']].get(needed, 0) > 0), None)
+            if target is None:
+                unplaced.append({'patient_id': bed['patient_id'], 'bed_type': needed,
+                                 'reason': f"No receiving hospital has a free {needed} bed"})
+                continue
+            remaining[target['_id']][needed] -= 1
+            used[target['_id']] = used.get(target['_id'], 0) + 1
+            placements.append({
+                'patient_id': bed['patient_id'],
+                'from_bed_id': str(bed['_id']),
+                'from_bed_number': bed.get('bed_number'),
+                'bed_type': needed,
+                'to_hospital_id': target['_id'],
+                'to_hospital_name': target.get('name', ''),
+                'distance_km': round(target['distance_m'] / 1000, 2) if 'distance_m' in target else None
+            })
+
+        plan = {
+            'hospital_id': hospital_id,
+            'department': department,
+            'patients': len(beds),
+            'placements': placements,
+            'unplaced': unplaced,
+            'receiving_hospitals': [
+                {'hospital_id': hospital['_id'], 'name': hospital.get('name', ''), 'patients': used[hospital['_id']]}
+                for hospital in candidates if hospital['_id'] in used
+            ]
+        }
+        return plan, [hospital['_id'] for hospital in candidates]
+
+    def plan_evacuation(self, hospital_id, department, receiving_hospital_ids=None, bed_type=None):
+        """Where each patient of a ward would go: the nearest receiving hospital with a free bed of the type
+        the patient occupies now (or bed_type for all), counted down against live availability"""
+        return self._plan(hospital_id, department, receiving_hospital_ids, bed_type)[0]
+
+    def evacuate_ward(self, hospital_id, department, receiving_hospital_ids=None, bed_type=None,
+                      hold_minutes=TRANSFER_HOLD_MINUTES, requested_by=''):
+        """Plan a ward evacuation and hold a bed for every placed patient, as transfers sharing an evacuation_id.
+
+        A planned hospital whose beds were taken in the meantime falls back to the next receiving
+        hospital in order. Patients move as each transfer (or the whole evacuation) is completed.
+        """
+        if hold_minutes <= 0:
+            raise ValueError("hold_minutes must be positive")
+        self.expire_transfers()
+        plan, candidates = self._plan(hospital_id, department, receiving_hospital_ids, bed_type)
+        evacuation_id = str(ObjectId())
+        transfers, unplaced = [], list(plan['unplaced'])
+        for placement in plan['placements']:
+            planned = placement['to_hospital_id']
+            transfer = None
+            try:
+                patient = self._admitted_patient(placement['patient_id'])
+                for to_hospital_id in [planned] + [other for other in candidates if other != planned]:
+                    transfer = self._open(patient, to_hospital_id, hold_minutes, bed_type=placement['bed_type'],
+                                          requested_by=requested_by, reason=f"Evacuation of {department}",
+                                          evacuation_id=evacuation_id)
+                    if transfer is not None:
+                        break
+                failure = f"No receiving hospital has a free {placement['bed_type']} bed"
+            except ValueError as e:
+                failure = str(e)
+            if transfer is None:
+                unplaced.append({'patient_id': placement['patient_id'], 'bed_type': placement['bed_type'],
+                                 'reason': failure})
+            else:
+                transfers.append(transfer)
+
+        return {
+            'evacuation_id': evacuation_id,
+            'hospital_id': hospital_id,
+            'department': department,
+            'patients': plan['patients'],
+            'transfers': transfers,
+            'unplaced': unplaced
+        }
+
+    def complete_evacuation(self, evacuation_id):
+        """Complete every held transfer of an evacuation; failures are reported per transfer"""
+        completed, failed = [], []
+        for transfer in self.transfers_collection.find({'evacuation_id': evacuation_id, 'status': 'held'}, {'_id': 1}):
+            try:
+                completed.append(self.complete_transfer(transfer['_id']))
+            except ValueError as e:
+                failed.append({'transfer_id': str(transfer['_id']), 'error': str(e)})
+        return {'evacuation_id': evacuation_id, 'completed': completed, 'failed': failed}
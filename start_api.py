@@ -16,7 +16,7 @@ sys.path.insert(0, backend_dir)
 if __name__ == '__main__':
     try:
         # Import from backend directory
-        from backend.api import app
+        from backend.api import app, start_background_tasks
         print("🏥 Hospital Management System API")
         print("=" * 50)
         print("📋 API Documentation: http://localhost:5000/api/docs")
@@ -27,6 +27,9 @@ if __name__ == '__main__':
         print("Press Ctrl+C to stop the server")
         print()
         
+        # The debug reloader imports the API in a watcher process too; only its child serves requests
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_background_tasks()
         app.run(debug=True, host='0.0.0.0', port=5000)
         
     except ImportError as e:
@@ -4,7 +4,7 @@ Hospital Management System - Web Server (Port 8080)
 Clean and optimized version for serving frontend HTML templates
 """
 
-from flask import Flask, render_template, send_from_directory, request, jsonify
+from flask import Flask, render_template, send_from_directory, request, jsonify, Response
 from flask_cors import CORS
 import requests
 
@@ -47,25 +47,36 @@ def drug_check():
 def static_files(filename):
     return send_from_directory('app/static', filename)
 
+# Request headers the API needs (content negotiation, conditional requests, sessions, event stream resume)
+FORWARDED_REQUEST_HEADERS = ['Accept', 'Authorization', 'Content-Type', 'If-None-Match', 'If-Modified-Since',
+                             'Last-Event-ID']
+
+# Response headers relayed to the browser unchanged
+PASSTHROUGH_RESPONSE_HEADERS = ['Content-Type', 'Content-Encoding', 'Content-Length', 'Content-Disposition',
+                                'Cache-Control', 'ETag', 'Last-Modified', 'Vary', 'X-Accel-Buffering']
+
 # API proxy - forward all /api requests to the API server
 @app.route('/api/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
 def api_proxy(path):
     """Proxy API requests to the API server on port 5000"""
     try:
         api_url = f'http://localhost:5000/api/{path}'
-        
+        headers = {name: request.headers[name] for name in FORWARDED_REQUEST_HEADERS if name in request.headers}
+        # Ask for exactly what the browser accepts; requests would otherwise ask for gzip on its behalf
+        headers['Accept-Encoding'] = request.headers.get('Accept-Encoding', 'identity')
+
         # Forward the request to the API server
-        if request.method == 'GET':
-            response = requests.get(api_url, params=request.args)
-        elif request.method == 'POST':
-            response = requests.post(api_url, json=request.get_json(), params=request.args)
-        elif request.method == 'PUT':
-            response = requests.put(api_url, json=request.get_json(), params=request.args)
-        elif request.method == 'DELETE':
-            response = requests.delete(api_url, params=request.args)
-        
-        # Return the response from the API server
-        return response.json(), response.status_code, {'Content-Type': 'application/json'}
+        upstream = requests.request(request.method, api_url, params=request.args,
+                                    data=request.get_data(), headers=headers, stream=True)
+
+        # Relay the body as the API encoded it (compressed or not, JSON, NDJSON or CSV), chunk by chunk
+        response = Response(
+            upstream.raw.stream(64 * 1024, decode_content=False),
+            status=upstream.status_code,
+            headers={name: upstream.headers[name] for name in PASSTHROUGH_RESPONSE_HEADERS if name in upstream.headers}
+        )
+        response.call_on_close(upstream.close)
+        return response
     
     except requests.exceptions.ConnectionError:
         return {'error': 'API server is not running on port 5000'}, 503